@@ -1,19 +1,181 @@
-from flask import Flask, request, jsonify
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from datetime import datetime
+
+from flask import Flask, Response, g, request, jsonify, make_response, stream_with_context
 from flask_cors import CORS
 
+from utils.auth import PasswordPoolBusy, SessionTokens
+from utils.bootstrap import Startup, run_migrations
+from utils.db_main import init_driver, get_pool_metrics
 from utils.db_manager import DatabaseManager
 from utils.db_backup import DatabaseImporter, DatabaseExporter
-from utils.utils import convert
-
-
+from utils.db_schema import DatabaseSchema
+from utils.http_cache import validators, is_not_modified, set_validators
+from utils.instrumentation import start_request, finish_request, render_metrics
+from utils.response_encoding import (
+    FastJSONProvider, choose_encoding, compress_response, iter_gzip_counted,
+    metrics as encoding_metrics
+)
+from utils.query_args import (
+    parse_announcement_args, parse_announcement_expand, page_headers,
+    parse_batch_logins, parse_batch_announcement_keys, parse_facet_args
+)
+from utils.validation import RATING_SCALE, is_estimation
+
+
+# Максимальное число элементов пакетной записи в одном запросе
+MAX_BULK_SIZE = 10000
+# Без токена сессии маршруты с владельцем доступны активным пользователям,
+# пока AUTH_REQUIRED не включена; маршруты администратора требуют токен всегда
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '0') == '1'
+# Роли пользователей; admin при регистрации требует токен администратора
+USER_ROLES = ('buyer', 'master', 'admin')
+
+
+logging.basicConfig(level=logging.INFO)
 app = Flask(__name__)
-CORS(app)
+# Сериализация ответов без convert, с учётом времени и размера
+app.json = FastJSONProvider(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'X-Total-Count', 'ETag', 'Server-Timing'])
+# Общий драйвер Neo4j, закрывается при завершении процесса
+init_driver()
 db = DatabaseManager()
-# Загрузка бэкапа, если БД пустая
-if db.is_empty():
-    importer = DatabaseImporter()
-    importer.import_data('data.json')
-    del importer
+schema = DatabaseSchema()
+# Токены сессий, отзываемые при блокировке пользователя в db.set_user_status
+sessions = SessionTokens(db.revocations)
+# Ожидание Neo4j, создание индексов и загрузка начальных данных в пустую БД
+# в фоне; до их окончания маршруты, кроме служебных, отвечают 503
+startup = Startup(db, schema)
+startup.start()
+# Маршруты, доступные до готовности базы
+STARTUP_ENDPOINTS = {
+    'index', 'get_ready', 'get_metrics', 'get_pool', 'get_cache', 'get_encoding', 'static'
+}
+
+
+def conditional(version):
+    '''Условные GET-запросы: ETag, Last-Modified и ответ 304.
+
+    version(**аргументы маршрута) - лёгкий запрос версии данных ответа;
+    если версия не изменилась, основной обработчик не вызывается.
+    None (данных нет) передаёт запрос обработчику как есть
+    '''
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            current = version(**kwargs)
+            if current is None:
+                return view(**kwargs)
+            etag, last_modified = validators(current, request.query_string)
+            if is_not_modified(request.headers, etag, last_modified):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            set_validators(response.headers, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def authorized(owner=None):
+    '''Проверка токена сессии из заголовка Authorization: Bearer <токен>.
+
+    owner(**аргументы маршрута) - логин, от имени которого выполняется запрос:
+    токен должен принадлежать ему или администратору, без owner маршрут
+    доступен только администратору. Токен проверяется без обращения к БД,
+    его данные попадают в g.session.
+
+    Запрос без токена при выключенной AUTH_REQUIRED пропускается только
+    на маршрут с owner и только если этот пользователь не заблокирован,
+    иначе отзыв его сессий обходился бы удалением заголовка. Блокировка
+    проверяется по списку отзыва в памяти процесса (см. RevocationList)
+    '''
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            token = bearer_token()
+            if token is None:
+                if AUTH_REQUIRED or owner is None:
+                    return jsonify({'error': 'Требуется авторизация'}), 401
+                if db.revocations.is_blocked(owner(**kwargs)):
+                    return jsonify({'error': 'Пользователь заблокирован'}), 403
+                g.session = None
+                return view(**kwargs)
+            claims = sessions.validate(token)
+            if claims is None:
+                return jsonify({'error': 'Сессия недействительна'}), 401
+            if claims['role'] != 'admin' and (owner is None or owner(**kwargs) != claims['sub']):
+                return jsonify({'error': 'Недостаточно прав'}), 403
+            g.session = claims
+            return view(**kwargs)
+        return wrapper
+    return decorator
+
+
+def bearer_token() -> str:
+    '''Токен из заголовка Authorization: Bearer <токен> или None'''
+    header = request.headers.get('Authorization', '')
+    return header[len('Bearer '):].strip() if header.startswith('Bearer ') else None
+
+
+def body_login(field: str):
+    '''owner для authorized: логин из поля field тела запроса'''
+    return lambda **kwargs: (request.get_json(silent=True) or {}).get(field)
+
+
+def announcement_version(login, number):
+    return db.get_announcement_version(login, int(number)) if number.isnumeric() else None
+
+
+# Время обработки запросов; обработчик after_request зарегистрирован
+# раньше сжатия, поэтому вызывается после него и учитывает его время
+@app.before_request
+def start_timing():
+    g.started = time.perf_counter()
+    start_request()
+
+
+@app.before_request
+def require_startup():
+    if not startup.ready and request.endpoint not in STARTUP_ENDPOINTS:
+        return jsonify({'error': 'Сервер запускается'}), 503, {'Retry-After': '5'}
+
+
+@app.after_request
+def finish_timing(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    finish_request(route, request.method, response.status_code,
+                   time.perf_counter() - g.started, response.headers)
+    return response
+
+
+# Запросы, кроме чтения, могли изменить данные: версия для ETag
+# списков читается заново, а не берётся из запомненной
+@app.after_request
+def invalidate_data_version(response):
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        db.invalidate_data_version()
+    return response
+
+
+# Сжатие больших ответов gzip или brotli, если клиент их поддерживает
+@app.after_request
+def encode_response(response):
+    return compress_response(response, request.headers.get('Accept-Encoding'))
+
+
+# Очередь хэширования паролей заполнена
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(error):
+    return jsonify({'error': 'Сервер перегружен, повторите позже'}), 503, {'Retry-After': '1'}
 
 
 # Проверочная страница
@@ -22,6 +184,57 @@ def index():
     return "API работает!"
 
 
+# Готовность сервера и время этапов запуска
+@app.route('/api/ready/', methods=['GET'])
+def get_ready():
+    body = {'ready': startup.ready, 'timings': startup.timings, 'error': startup.error}
+    return jsonify(body), 200 if startup.ready else 503
+
+
+# Состояние индексов, позволяет дождаться их перехода в ONLINE при развёртывании
+@app.route('/api/schema/', methods=['GET'])
+def get_schema():
+    indexes = schema.get_index_states()
+    online = all(index['state'] == 'ONLINE' for index in indexes)
+    return jsonify({'online': online, 'indexes': indexes}), 200 if online else 503
+
+
+# Состояние пула соединений с Neo4j
+@app.route('/api/metrics/pool/', methods=['GET'])
+def get_pool():
+    return jsonify(get_pool_metrics())
+
+
+# Счётчики кэша профилей и объявлений
+@app.route('/api/metrics/cache/', methods=['GET'])
+def get_cache():
+    return jsonify(db.cache.stats())
+
+
+# Метрики в формате Prometheus: время запросов, вызовов и запросов Cypher
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    cache = db.cache.stats()
+    encoding = encoding_metrics.stats()
+    extra = {f'cache_{name}': value for name, value in cache.items()}
+    extra['response_serialize_seconds'] = encoding['serialize_seconds']
+    extra['response_bytes_saved'] = encoding['bytes_saved']
+    if db.snapshot is not None:
+        snapshot = db.snapshot.stats()
+        extra['catalogue_snapshot_rows'] = snapshot['rows']
+        extra['catalogue_snapshot_answered'] = snapshot['answered']
+    for pool in get_pool_metrics():
+        extra.setdefault('neo4j_pool_in_use', 0)
+        extra['neo4j_pool_in_use'] += pool['in_use']
+    return Response(render_metrics(extra), mimetype='text/plain; version=0.0.4')
+
+
+# Время сериализации ответов и объём, сэкономленный сжатием
+@app.route('/api/metrics/encoding/', methods=['GET'])
+def get_encoding():
+    return jsonify(encoding_metrics.stats())
+
+
 # Создание нового пользователя
 @app.route('/api/users/', methods=['POST'])
 def create_user():
@@ -29,6 +242,14 @@ def create_user():
     required_field = ['login', 'password', 'role', 'full_name', 'age']
     if not data or not all(field in data for field in required_field):
         return jsonify({'error': 'Не хватает полей'}), 400
+    if data['role'] not in USER_ROLES:
+        return jsonify({'error': 'Неизвестная роль'}), 400
+    # Администратора может создать только администратор
+    if data['role'] == 'admin':
+        token = bearer_token()
+        claims = sessions.validate(token) if token else None
+        if claims is None or claims['role'] != 'admin':
+            return jsonify({'error': 'Недостаточно прав'}), 403
 
     success = db.create_user(
         login=data['login'],
@@ -49,16 +270,31 @@ def create_user():
 
 # Получение пользователя по его логину
 @app.route('/api/users/<login>/', methods=['GET'])
+@conditional(lambda login: db.get_user_version(login))
 def get_user(login):
     user = db.get_user(login)
 
     if user:
-        return jsonify(convert(user))
+        return jsonify(user)
     return jsonify({'error': 'Пользователь не найден'}), 404
 
 
+# Получение нескольких пользователей одним запросом: ?login=a&login=b.
+# Ответ - словарь логин -> пользователь, null для несуществующих
+@app.route('/api/batch/users/', methods=['GET'])
+@conditional(lambda: db.get_data_version())
+def get_users_batch():
+    try:
+        logins = parse_batch_logins(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    return jsonify(db.get_users(logins))
+
+
 # Получение отзывов о пользователе
 @app.route('/api/users/<login>/comments/', methods=['GET'])
+@conditional(lambda login: db.get_user_version(login))
 def get_user_feedback(login):
     feedback = db.get_user_feedback(login)
 
@@ -69,11 +305,14 @@ def get_user_feedback(login):
 
 # Создание отзыва о пользователе
 @app.route('/api/users/<login>/comments/', methods=['POST'])
+@authorized(body_login('sender_login'))
 def create_user_feedback(login):
     data = request.get_json()
     required_field = ['sender_login', 'text', 'estimation']
     if not data or not all(field in data for field in required_field):
         return jsonify({'error': 'Не хватает полей'}), 400
+    if not is_estimation(data['estimation']):
+        return jsonify({'error': f'Оценка должна быть целым числом от 1 до {RATING_SCALE}'}), 400
 
     success = db.create_user_feedback(
         sender_login=data['sender_login'],
@@ -88,28 +327,47 @@ def create_user_feedback(login):
 
 
 # Получение всех объявлений, возможность фильтрации
+# q - полнотекстовый поиск по названию, адресу, описанию и имени мастера.
+# near=широта,долгота и radius_km - объявления рядом с точкой с полем distance_km.
+# Постраничный вывод: limit, cursor (из заголовка X-Next-Cursor),
+# sort (relevance, distance, created_at, price, weight), order (asc, desc),
+# count=1 - X-Total-Count, expand=master - сведения о мастере в поле seller
 @app.route('/api/announcements/', methods=['GET'])
+@conditional(lambda: db.get_data_version())
 def get_announcements():
-    filters = {
-        'name': '', 'master': '', 'width_min': .0, 'width_max': .0, 
-        'height_min': .0, 'height_max': .0, 'length_min': .0, 
-        'length_max': .0, 'weight_min': .0, 'weight_max': .0,
-        'amount_min': 0, 'amount_max': 0, 'price_min': .0, 
-        'price_max': .0, 'address': ''
-    }
-    data = {}
-    for filter, value in filters.items():
-        data[filter] = request.args.get(filter, default=value)
-        try:
-            data[filter] = type(value)(data[filter])
-        except (ValueError, TypeError):
-            return jsonify({'error': f'Некорректный тип данных {filter}'}), 400
-    announcements = db.get_announcements(**data)
-    return jsonify(convert(announcements))
+    try:
+        query = parse_announcement_args(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    announcements = db.get_announcements(
+        **query['filters'], sort=query['sort'], descending=query['descending'],
+        limit=query['limit'], after=query['after'], expand=query['expand']
+    )
+    response = jsonify(announcements)
+    response.headers.update(page_headers(query, announcements))
+    if request.args.get('count') == '1':
+        response.headers['X-Total-Count'] = str(db.count_announcements(**query['filters']))
+    return response
+
+
+# Фасеты для боковой панели фильтров: для каждого числового поля min, max,
+# количество и гистограмма из buckets интервалов (по умолчанию 10).
+# Фильтры те же, что у списка объявлений
+@app.route('/api/announcements/facets/', methods=['GET'])
+@conditional(lambda: db.get_data_version())
+def get_facets():
+    try:
+        query = parse_facet_args(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    return jsonify(db.get_facets(query['buckets'], **query['filters']))
 
 
 # Создание нового объявления
 @app.route('/api/announcements/', methods=['POST'])
+@authorized(body_login('login'))
 def create_announcement():
     data = request.get_json()
     required_field = ['login', 'name', 'width', 'height', 'length',
@@ -118,7 +376,7 @@ def create_announcement():
     if not data or not all(field in data for field in required_field):
         return jsonify({'error': 'Не хватает полей'}), 400
 
-    success = db.create_announcement(
+    number = db.create_announcement(
         login=data['login'],
         name=data['name'],
         width=data['width'],
@@ -132,27 +390,92 @@ def create_announcement():
         photo_url=data.get('photo_url', 'no_photo.png')
     )
 
-    if success:
-        return jsonify({'message': 'Новое объявление создано'}), 201
+    if number:
+        return jsonify({'message': 'Новое объявление создано', 'number': number}), 201
     return jsonify({'error': 'Пользователь не найден'}), 404
 
 
+# Пакетное создание объявлений: {"announcements": [...]}
+@app.route('/api/bulk/announcements/', methods=['POST'])
+@authorized()
+def create_announcements():
+    return bulk_write('announcements', db.create_announcements)
+
+
+# Пакетное создание отзывов о пользователях: {"feedback": [...]}
+@app.route('/api/bulk/user-comments/', methods=['POST'])
+@authorized()
+def create_user_feedbacks():
+    return bulk_write('feedback', db.create_user_feedbacks)
+
+
+# Пакетное создание комментариев к объявлениям: {"feedback": [...]}
+@app.route('/api/bulk/announcement-comments/', methods=['POST'])
+@authorized()
+def create_announcement_feedbacks():
+    return bulk_write('feedback', db.create_announcement_feedbacks)
+
+
+def bulk_write(field: str, write):
+    '''Общая часть пакетных маршрутов: 201, если записаны все элементы,
+    207 с результатом по каждому элементу в остальных случаях'''
+    data = request.get_json(silent=True)
+    items = data.get(field) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': f'Не передан список {field}'}), 400
+    if len(items) > MAX_BULK_SIZE:
+        return jsonify({'error': f'Не больше {MAX_BULK_SIZE} элементов за запрос'}), 400
+
+    results = write(items)
+    created = sum(result['created'] for result in results)
+    return jsonify({
+        'created': created,
+        'failed': len(results) - created,
+        'results': results
+    }), 201 if created == len(results) else 207
+
+
 # Получение объявления по логину мастера и номеру
+# expand=master,feedback - сведения о мастере и страница отзывов
+# (feedback_limit, feedback_offset) в том же ответе
 @app.route('/api/announcements/<login>/<number>/', methods=['GET'])
+@conditional(announcement_version)
 def get_announcement(login, number):
     if not number.isnumeric():
         return jsonify({'error': 'Номер объявления некорректный'}), 401
     number = int(number)
+    try:
+        expand = parse_announcement_expand(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
 
-    success = db.get_announcement(login, number)
+    success = db.get_announcement(login, number, **expand)
 
     if success:
-        return jsonify(convert(success))
+        return jsonify(success)
     return jsonify({'error': 'Объявление не найдено'}), 404
 
 
+# Получение нескольких объявлений одним запросом: ?id=login/1&id=login/2.
+# Ответ - словарь login/number -> объявление, null для несуществующих
+@app.route('/api/batch/announcements/', methods=['GET'])
+@conditional(lambda: db.get_data_version())
+def get_announcements_batch():
+    try:
+        keys = parse_batch_announcement_keys(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    announcements = db.get_announcements_by_key(keys)
+    return jsonify({
+        f'{login}/{number}': announcement
+        for (login, number), announcement in announcements.items()
+    })
+
+
 # Получение отзывов об объявлении
 @app.route('/api/announcements/<login>/<number>/comments/', methods=['GET'])
+@conditional(announcement_version)
 def get_announcement_feedback(login, number):
     if not number.isnumeric():
         return jsonify({'error': 'Номер объявления некорректный'}), 401
@@ -167,6 +490,7 @@ def get_announcement_feedback(login, number):
 
 # Оставление комментария
 @app.route('/api/announcements/<login>/<number>/comments/', methods=['POST'])
+@authorized(body_login('sender_login'))
 def create_announcement_feedback(login, number):
     data = request.get_json()
     required_field = ['sender_login', 'text']
@@ -190,7 +514,9 @@ def create_announcement_feedback(login, number):
     return jsonify({'error': 'Объявление не найдено'}), 404
 
 
-# Авторизация пользователя с логином и паролем
+# Авторизация пользователя с логином и паролем.
+# Ответ содержит токен сессии (token, expires_at) для заголовка
+# Authorization: Bearer <token> защищённых маршрутов
 @app.route('/api/login/', methods=['POST'])
 def login():
     data = request.get_json()
@@ -200,43 +526,126 @@ def login():
     if not login or not password:
         return jsonify({'error': 'Не хватает логина или пароля'}), 400
 
-    if db.authorize_user(login, password):
-        user = db.get_user(login)
-        return jsonify({
-            'message': 'Успешный вход',
-            'login': login,
-            'role': user.get('role', ''),
-            'full_name': user.get('full_name', '')
-        }), 200
-    else:
+    user = db.login_user(login, password)
+    if user is None:
         return jsonify({'error': 'Неверный логин или пароль'}), 401
+    if user.get('status', 'active') != 'active':
+        return jsonify({'error': 'Пользователь заблокирован'}), 403
+    return jsonify({
+        'message': 'Успешный вход',
+        'login': login,
+        'role': user.get('role', ''),
+        'full_name': user.get('full_name', ''),
+        **sessions.issue(user)
+    }), 200
+
+
+# Завершение сессии: токен из заголовка Authorization отзывается
+@app.route('/api/logout/', methods=['POST'])
+def logout():
+    token = bearer_token()
+    claims = sessions.validate(token) if token else None
+    if claims is None:
+        return jsonify({'error': 'Сессия недействительна'}), 401
+    sessions.revoke(claims)
+    return jsonify({'message': 'OK'}), 200
 
 
 # Сохранение бэкапа БД
+# format=ndjson - построчный формат, gzip=1 - файл .gz; ответ передаётся потоково
+# и без gzip=1 сжимается на лету, если клиент поддерживает gzip
+# since=<дата ISO 8601> - инкрементальный бэкап NDJSON с изменениями после since
 @app.route('/api/backup/', methods=['GET'])
+@authorized()
 def get_backup():
-    data = {}
+    backup_format = request.args.get('format', 'json')
+    if backup_format not in ('json', 'ndjson'):
+        return jsonify({'error': 'Некорректный формат бэкапа'}), 400
+    compress = request.args.get('gzip', '0') == '1'
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({'error': 'Некорректная дата since'}), 400
+        backup_format = 'ndjson'
+
     exporter = DatabaseExporter()
-    data = exporter.get_graph_data()
-    return jsonify(convert(data))
+    if since is not None:
+        chunks, mimetype = exporter.iter_incremental(since), 'application/x-ndjson'
+    elif backup_format == 'ndjson':
+        chunks, mimetype = exporter.iter_ndjson(), 'application/x-ndjson'
+    else:
+        chunks, mimetype = exporter.iter_json(), 'application/json'
+    filename = f'backup.{backup_format}'
+    headers = {'Vary': 'Accept-Encoding'}
+    if compress:
+        chunks, mimetype = iter_gzip_counted(chunks), 'application/gzip'
+        filename += '.gz'
+    elif choose_encoding(request.headers.get('Accept-Encoding'), ('gzip',)) == 'gzip':
+        chunks = iter_gzip_counted(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
 
 
 # Загрузка бэкапа БД
+# mode=merge - слияние с текущими данными без предварительного удаления
 @app.route('/api/backup/', methods=['POST'])
+@authorized()
 def set_backup():
+    mode = request.args.get('mode', 'replace')
+    if mode not in ('replace', 'merge'):
+        return jsonify({'error': 'Некорректный режим загрузки'}), 400
     data = request.get_json()
     backup_data = data.get('backup_data')
     if backup_data == None:
         return jsonify({'error': 'Не переданны данные'}), 400
     
     importer = DatabaseImporter()
-    result = importer.set_graph_data(backup_data)
-    if result:
-        return jsonify({'message': 'OK'}), 201
-    return jsonify({'error': 'Некорректный бэкап'}), 400
+    if not importer.set_graph_data(backup_data, merge=mode == 'merge'):
+        return jsonify({'error': 'Некорректный бэкап'}), 400
+    # Данные бэкапа могли быть созданы до миграций, поэтому выполняются все
+    run_migrations(db, force=True)
+    reload_after_import()
+    return jsonify({'message': 'OK'}), 201
+
+
+# Применение инкрементального бэкапа (GET /api/backup/?since=...) поверх текущих
+# данных. Тело - файл NDJSON, gzip=1 - сжатый gzip. Цепочка из полного
+# и инкрементальных бэкапов загружается по очереди: полный через /api/backup/,
+# затем инкрементальные в порядке создания (проверку цепочки по границам
+# since и until делает DatabaseImporter.import_chain для файлов на диске)
+@app.route('/api/backup/incremental/', methods=['POST'])
+@authorized()
+def set_incremental_backup():
+    suffix = '.ndjson.gz' if request.args.get('gzip', '0') == '1' else '.ndjson'
+    # Бэкап читается дважды (проверка, затем запись), поэтому сохраняется на диск
+    with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+        shutil.copyfileobj(request.stream, f)
+        f.flush()
+        try:
+            result = DatabaseImporter().import_incremental(f.name)
+        except (OSError, EOFError, zlib.error):
+            # Повреждённый архив gzip
+            result = False
+    if not result:
+        return jsonify({'error': 'Некорректный бэкап'}), 400
+    reload_after_import()
+    return jsonify({'message': 'OK'}), 201
+
+
+def reload_after_import() -> None:
+    '''Обновление данных процесса после загрузки бэкапа'''
+    # Все закэшированные данные и снимок каталога устарели
+    db.cache.clear()
+    db.load_snapshot()
+    # Заблокированные пользователи берутся из загруженных данных
+    db.revoke_inactive_sessions()
 
 
 @app.route('/api/users/<login>/', methods=['PATCH'])
+@authorized(lambda login: login)
 def update_user(login):
     data = request.get_json()
     required_field = ['full_name', 'age', 'description', 'education', 'photo_url']
@@ -251,6 +660,7 @@ def update_user(login):
 
 
 @app.route('/api/users/<login>/status/', methods=['PATCH'])
+@authorized()
 def update_user_status(login):
     status = request.get_json().get('status')
     if not status:
@@ -262,6 +672,7 @@ def update_user_status(login):
 
 
 @app.route('/api/announcements/<login>/<number>/', methods=['PATCH'])
+@authorized(lambda login, number: login)
 def edit_announcement(login, number):
     if not number.isnumeric():
         return jsonify({'error': 'Номер объявления некорректный'}), 401
@@ -284,6 +695,7 @@ def edit_announcement(login, number):
 
 
 @app.route('/api/announcements/<login>/<number>/', methods=['DELETE'])
+@authorized(lambda login, number: login)
 def delete_announcement(login, number):
     if not number.isnumeric():
         return jsonify({'error': 'Номер объявления некорректный'}), 401
@@ -295,6 +707,7 @@ def delete_announcement(login, number):
 
 
 @app.route('/api/users/<login_user>/comments/<login_author>/', methods=['DELETE'])
+@authorized(lambda login_user, login_author: login_author)
 def delete_user_feedback(login_user, login_author):
     if db.delete_user_feedback(login_author, login_user):
         return jsonify({'message': 'OK'}), 204
@@ -302,6 +715,7 @@ def delete_user_feedback(login_user, login_author):
 
 
 @app.route('/api/announcements/<login_master>/<number>/comments/<login_author>/', methods=['DELETE'])
+@authorized(lambda login_master, number, login_author: login_author)
 def delete_announcement_feedback(login_master, number, login_author):
     if not number.isnumeric():
         return jsonify({'error': 'Номер объявления некорректный'}), 401
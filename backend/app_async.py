@@ -0,0 +1,229 @@
+'''Асинхронный сервер для маршрутов чтения на AsyncDatabaseManager.
+
+Повторяет ответы app.py для GET-запросов пользователей, объявлений
+и отзывов. Запуск:
+
+    hypercorn app_async:app --bind 0.0.0.0:5001 --workers 1
+'''
+import asyncio
+import functools
+import time
+
+from quart import Quart, Response, g, request, jsonify, make_response
+
+from utils.db_async import AsyncDatabaseManager, close_async_driver
+from utils.http_cache import validators, is_not_modified, set_validators
+from utils.instrumentation import start_request, finish_request, render_metrics
+from utils.response_encoding import FastJSONProvider, compressible, encode_body
+from utils.query_args import (
+    parse_announcement_args, parse_announcement_expand, page_headers,
+    parse_batch_logins, parse_batch_announcement_keys, parse_facet_args
+)
+
+
+app = Quart(__name__)
+app.json = FastJSONProvider(app)
+db = None
+
+
+@app.before_serving
+async def startup():
+    global db
+    db = AsyncDatabaseManager()
+
+
+@app.after_serving
+async def shutdown():
+    await close_async_driver()
+
+
+@app.before_request
+async def start_timing():
+    g.started = time.perf_counter()
+    start_request()
+
+
+@app.after_request
+async def add_cors_headers(response):
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor, X-Total-Count, ETag, Server-Timing'
+    # Сжатие больших ответов, как в app.py
+    if compressible(response.status_code, response.mimetype, response.headers):
+        response.vary.add('Accept-Encoding')
+        body, encoding = encode_body(
+            await response.get_data(), request.headers.get('Accept-Encoding')
+        )
+        if encoding is not None:
+            response.set_data(body)
+            response.headers['Content-Encoding'] = encoding
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    finish_request(route, request.method, response.status_code,
+                   time.perf_counter() - g.started, response.headers)
+    return response
+
+
+# Метрики в формате Prometheus
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    extra = {f'cache_{name}': value for name, value in db.cache.stats().items()}
+    return Response(render_metrics(extra), mimetype='text/plain; version=0.0.4')
+
+
+def conditional(version):
+    '''Условные GET-запросы, как conditional в app.py'''
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(**kwargs):
+            current = await version(**kwargs)
+            if current is None:
+                return await view(**kwargs)
+            etag, last_modified = validators(current, request.query_string)
+            if is_not_modified(request.headers, etag, last_modified):
+                response = app.response_class('', status=304)
+            else:
+                response = await make_response(await view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            set_validators(response.headers, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+async def announcement_version(login, number):
+    if not number.isnumeric():
+        return None
+    return await db.get_announcement_version(login, int(number))
+
+
+# Проверочная страница
+@app.route('/')
+async def index():
+    return "Асинхронное API работает!"
+
+
+# Получение пользователя по его логину
+@app.route('/api/users/<login>/', methods=['GET'])
+@conditional(lambda login: db.get_user_version(login))
+async def get_user(login):
+    user = await db.get_user(login)
+
+    if user:
+        return jsonify(user)
+    return jsonify({'error': 'Пользователь не найден'}), 404
+
+
+# Получение нескольких пользователей одним запросом: ?login=a&login=b
+@app.route('/api/batch/users/', methods=['GET'])
+@conditional(lambda: db.get_data_version())
+async def get_users_batch():
+    try:
+        logins = parse_batch_logins(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    return jsonify(await db.get_users(logins))
+
+
+# Получение отзывов о пользователе
+@app.route('/api/users/<login>/comments/', methods=['GET'])
+@conditional(lambda login: db.get_user_version(login))
+async def get_user_feedback(login):
+    feedback = await db.get_user_feedback(login)
+
+    if feedback is not None:
+        return jsonify(feedback)
+    return jsonify({'error': 'Пользователь не найден'}), 404
+
+
+# Получение всех объявлений, параметры как в app.py
+@app.route('/api/announcements/', methods=['GET'])
+@conditional(lambda: db.get_data_version())
+async def get_announcements():
+    try:
+        query = parse_announcement_args(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    page = db.get_announcements(
+        **query['filters'], sort=query['sort'], descending=query['descending'],
+        limit=query['limit'], after=query['after'], expand=query['expand']
+    )
+    if request.args.get('count') == '1':
+        # Страница и общее количество запрашиваются одновременно
+        announcements, total = await asyncio.gather(
+            page, db.count_announcements(**query['filters'])
+        )
+    else:
+        announcements, total = await page, None
+    response = jsonify(announcements)
+    response.headers.update(page_headers(query, announcements))
+    if total is not None:
+        response.headers['X-Total-Count'] = str(total)
+    return response
+
+
+# Фасеты каталога, параметры как в app.py
+@app.route('/api/announcements/facets/', methods=['GET'])
+@conditional(lambda: db.get_data_version())
+async def get_facets():
+    try:
+        query = parse_facet_args(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    return jsonify(await db.get_facets(query['buckets'], **query['filters']))
+
+
+# Получение объявления по логину мастера и номеру
+@app.route('/api/announcements/<login>/<number>/', methods=['GET'])
+@conditional(announcement_version)
+async def get_announcement(login, number):
+    if not number.isnumeric():
+        return jsonify({'error': 'Номер объявления некорректный'}), 401
+    number = int(number)
+    try:
+        expand = parse_announcement_expand(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    success = await db.get_announcement(login, number, **expand)
+
+    if success:
+        return jsonify(success)
+    return jsonify({'error': 'Объявление не найдено'}), 404
+
+
+# Получение нескольких объявлений одним запросом: ?id=login/1&id=login/2
+@app.route('/api/batch/announcements/', methods=['GET'])
+@conditional(lambda: db.get_data_version())
+async def get_announcements_batch():
+    try:
+        keys = parse_batch_announcement_keys(request.args)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    announcements = await db.get_announcements_by_key(keys)
+    return jsonify({
+        f'{login}/{number}': announcement
+        for (login, number), announcement in announcements.items()
+    })
+
+
+# Получение отзывов об объявлении
+@app.route('/api/announcements/<login>/<number>/comments/', methods=['GET'])
+@conditional(announcement_version)
+async def get_announcement_feedback(login, number):
+    if not number.isnumeric():
+        return jsonify({'error': 'Номер объявления некорректный'}), 401
+    number = int(number)
+
+    success = await db.get_announcement_feedback(login, number)
+
+    if success is not None:
+        return jsonify(success)
+    return jsonify({'error': 'Объявление не найдено'}), 404
+
+
+if __name__ == '__main__':
+    app.run(host="0.0.0.0", port=5001)
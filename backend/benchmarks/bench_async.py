@@ -0,0 +1,73 @@
+'''Нагрузочное сравнение синхронного (app.py) и асинхронного (app_async.py) серверов.
+
+Оба сервера должны быть запущены и подключены к одной базе:
+
+    cd backend && python app.py
+    cd backend && hypercorn app_async:app --bind 0.0.0.0:5001
+    cd backend && python -m benchmarks.bench_async --concurrency 1 8 32 64
+'''
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+
+# Маршруты чтения, которые обслуживают оба сервера
+PATHS = [
+    '/api/users/seller/',
+    '/api/users/seller/comments/',
+    '/api/announcements/?limit=20',
+    '/api/announcements/seller/1/',
+    '/api/announcements/seller/1/comments/',
+]
+
+
+def _request(url: str) -> float:
+    '''Время одного запроса в миллисекундах'''
+    started = time.perf_counter()
+    try:
+        with urlopen(url) as response:
+            response.read()
+    except HTTPError as error:
+        error.read()
+    return (time.perf_counter() - started) * 1000
+
+
+def run(base_url: str, concurrency: int, requests: int) -> dict:
+    '''Пропускная способность и задержки при заданном числе параллельных клиентов'''
+    urls = [base_url + PATHS[i % len(PATHS)] for i in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = sorted(pool.map(_request, urls))
+    elapsed = time.perf_counter() - started
+    return {
+        'rps': requests / elapsed,
+        'mean': statistics.fmean(timings),
+        'p50': timings[len(timings) // 2],
+        'p95': timings[int(len(timings) * 0.95) - 1],
+        'p99': timings[int(len(timings) * 0.99) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sync-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--async-url', default='http://127.0.0.1:5001')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'server':<8}{'clients':>8}{'rps':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for concurrency in args.concurrency:
+        for name, url in (('sync', args.sync_url), ('async', args.async_url)):
+            # Прогрев соединений и кэшей
+            run(url, concurrency, min(args.requests, 100))
+            result = run(url, concurrency, args.requests)
+            print(f"{name:<8}{concurrency:>8}{result['rps']:>10.1f}{result['mean']:>10.2f}"
+                  f"{result['p50']:>10.2f}{result['p95']:>10.2f}{result['p99']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
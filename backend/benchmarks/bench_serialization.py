@@ -0,0 +1,121 @@
+'''Сравнение сериализации бэкапа до и после учёта схемы свойств.
+
+Синтетический бэкап содержит заданное число свойств (по умолчанию 1 000 000)
+в узлах, похожих на пользователей и объявления. Прежний вариант - рекурсивный
+convert с json.dumps при экспорте и back_convert, разбирающий каждую строку,
+при загрузке. Neo4j не нужен.
+
+    cd backend && python -m benchmarks.bench_serialization --properties 1000000
+'''
+import argparse
+import json
+import time
+from datetime import datetime
+
+from neo4j.time import DateTime
+
+from utils import utils
+from utils.utils import back_convert, convert, dumps
+
+
+# Свойств в одном синтетическом узле
+PROPERTIES_PER_NODE = 10
+
+
+def _legacy_convert(obj):
+    if isinstance(obj, dict):
+        return {k: _legacy_convert(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_legacy_convert(v) for v in obj]
+    elif isinstance(obj, DateTime):
+        return obj.iso_format()
+    else:
+        return obj
+
+
+def _legacy_back_convert(obj):
+    if isinstance(obj, dict):
+        return {k: _legacy_back_convert(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_legacy_back_convert(v) for v in obj]
+    elif isinstance(obj, str):
+        try:
+            dt = datetime.fromisoformat(obj)
+            return DateTime(
+                dt.year, dt.month, dt.day,
+                dt.hour, dt.minute, dt.second,
+                dt.microsecond * 1000
+            )
+        except ValueError:
+            return obj
+    else:
+        return obj
+
+
+def _nodes(properties: int) -> list:
+    '''Узлы бэкапа в том виде, в каком их возвращает экспорт'''
+    created = DateTime(2025, 4, 21, 19, 34, 17, 26000000)
+    nodes = []
+    for i in range(properties // PROPERTIES_PER_NODE):
+        nodes.append({
+            'id': i,
+            'labels': ['Announcement'],
+            'properties': {
+                'name': f'Шкаф {i}',
+                'address': 'Санкт-Петербург, Невский проспект, 1',
+                'description': 'Дубовый шкаф ручной работы',
+                'width': 1.5, 'height': 2.0, 'length': 0.6, 'weight': 40.0,
+                'amount': 1, 'created_at': created, 'updated_at': created,
+            }
+        })
+    return nodes
+
+
+def _export_legacy(nodes: list) -> list:
+    return [json.dumps(item, ensure_ascii=False) for item in _legacy_convert(nodes)]
+
+
+def _export_new(nodes: list) -> list:
+    return [dumps(item) for item in nodes]
+
+
+def _measure(function, data, repeat: int) -> float:
+    '''Лучшее время из repeat запусков в секундах'''
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(data)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--properties', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    nodes = _nodes(args.properties)
+    lines = _export_new(nodes)
+    parsed = [json.loads(line) for line in lines]
+    # Даты восстанавливаются без потери точности, остальные строки не меняются
+    restored = back_convert(parsed)
+    assert all(item['properties'] == node['properties'] for item, node in zip(restored, nodes))
+
+    encoder = 'orjson' if utils.orjson is not None else 'json'
+    print(f'{len(nodes) * PROPERTIES_PER_NODE} properties, encoder: {encoder}')
+    print(f"{'operation':<30}{'legacy s':>10}{'new s':>10}{'speedup':>10}")
+    cases = (
+        ('export (convert + dumps)', _export_legacy, _export_new, nodes),
+        ('convert without temporals', _legacy_convert, convert, parsed),
+        ('back_convert', _legacy_back_convert, back_convert, parsed),
+    )
+    for name, legacy, new, data in cases:
+        legacy_time = _measure(legacy, data, args.repeat)
+        new_time = _measure(new, data, args.repeat)
+        print(f'{name:<30}{legacy_time:>10.3f}{new_time:>10.3f}{legacy_time / new_time:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,473 @@
+'''Сквозной нагрузочный тест всех маршрутов app.py, импорта и экспорта.
+
+Нужен локальный Neo4j, параметры подключения берутся из переменных
+окружения NEO4J_*. Маршруты вызываются тестовым клиентом Flask внутри
+процесса, поэтому время включает обработчик, сериализацию и запросы к БД,
+но не сеть. С --dataset база ЗАМЕНЯЕТСЯ содержимым бэкапа (см.
+generate_dataset), время импорта и экспорта тоже измеряется.
+Результат сохраняется в JSON с хэшем коммита; --compare печатает
+изменение p50 и p95 относительно сохранённого ранее прогона.
+
+    cd backend && python -m benchmarks.generate_dataset --announcements 100000 \\
+        --output bench_100k.ndjson.gz
+    cd backend && python -m benchmarks.bench_suite --dataset bench_100k.ndjson.gz \\
+        --iterations 200 --compare bench_results/previous.json
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from utils.bootstrap import run_migrations
+from utils.db_backup import DatabaseExporter, DatabaseImporter
+from utils.db_manager import ANNOUNCEMENT_QUERY, ANNOUNCEMENTS_BY_KEY_QUERY, USER_QUERY
+
+
+# Маршруты, которые не вызываются в цикле, и причина
+SKIPPED_ROUTES = {
+    'POST /api/backup/': 'заменяет всю базу, измеряется как import',
+    'POST /api/backup/incremental/': 'изменяет базу бэкапом, нужен файл инкрементального бэкапа',
+}
+# Маршруты, которые выполняются медленно и вызываются не больше --heavy-iterations раз
+HEAVY_ROUTES = ('GET /api/backup/',)
+# Поиск пользователя и объявления по ключу: план EXPLAIN должен начинаться
+# с поиска по индексам db_schema (user_login_unique, create_number)
+INDEX_CHECKS = {
+    'user': (USER_QUERY, {'login': 'bench'}),
+    'announcement': (ANNOUNCEMENT_QUERY, {'login': 'bench', 'number': 1}),
+    'announcements_by_key': (ANNOUNCEMENTS_BY_KEY_QUERY, {'keys': [{'login': 'bench', 'number': 1}]}),
+}
+# Операторы плана, означающие обход всех узлов метки или всех отношений типа
+SCAN_OPERATORS = frozenset({
+    'AllNodesScan', 'NodeByLabelScan', 'DirectedAllRelationshipsScan',
+    'UndirectedAllRelationshipsScan', 'DirectedRelationshipTypeScan',
+    'UndirectedRelationshipTypeScan',
+})
+
+_ANNOUNCEMENT = dict(
+    name='Бенчмарк', width=1.0, height=1.0, length=1.0, weight=1.0,
+    amount=1, price=1.0, address='Москва, ул. Ленина, 1'
+)
+
+
+class Context:
+    '''Пользователи бенчмарка и примеры существующих данных для запросов'''
+
+    def __init__(self, db):
+        self.db = db
+        suffix = uuid.uuid4().hex[:8]
+        self.prefix = f'bench_{suffix}_'
+        self.master = self.prefix + 'master'
+        self.buyer = self.prefix + 'buyer'
+        self.admin = self.prefix + 'admin'
+        self._counter = iter(range(10 ** 9))
+        self._lock = threading.Lock()
+        db.create_user(self.master, 'password', 'master', 'Бенчмарк', 30)
+        db.create_user(self.buyer, 'password', 'buyer', 'Бенчмарк', 30)
+        # Администратор создаётся в БД напрямую: через /api/users/ его может
+        # создать только другой администратор
+        db.create_user(self.admin, 'password', 'admin', 'Бенчмарк', 30)
+        db.create_announcement(self.master, **_ANNOUNCEMENT)
+        with db.driver.session() as session:
+            # Мастера с наибольшим числом объявлений и номера их объявлений
+            self.sellers = session.run(
+                '''MATCH (u:User)-[c:Create]->(:Announcement)
+                WHERE NOT u.login STARTS WITH 'bench_'
+                WITH u, collect(c.number) AS numbers
+                ORDER BY size(numbers) DESC LIMIT 50
+                RETURN u.login AS login, numbers[..20] AS numbers'''
+            ).data()
+            self.logins = session.run(
+                '''MATCH (u:User) WHERE NOT u.login STARTS WITH 'bench_'
+                RETURN u.login AS login LIMIT 1000'''
+            ).value()
+        if not self.sellers:
+            self.sellers = [{'login': self.master, 'numbers': [1]}]
+        self.announcements = [
+            (seller['login'], number) for seller in self.sellers for number in seller['numbers']
+        ]
+
+
+    def next(self) -> int:
+        '''Номер очередного запроса, общий для всех потоков'''
+        with self._lock:
+            return next(self._counter)
+
+
+    def cleanup(self) -> None:
+        '''Удаление пользователей бенчмарка со всеми объявлениями и отзывами'''
+        with self.db.driver.session() as session:
+            session.run(
+                '''MATCH (u:User) WHERE u.login STARTS WITH $prefix
+                OPTIONAL MATCH (u)-[:Create|Make]->(n)
+                OPTIONAL MATCH (f:Feedback)-[:About]->(n)
+                DETACH DELETE f, n, u''',
+                prefix=self.prefix
+            ).consume()
+        self.db.cache.clear()
+
+
+def scenarios(ctx: Context, app) -> list:
+    '''Тройки (маршрут, вариант, функция запроса). Функция получает номер
+    запроса и возвращает аргументы client.open; подготовка (например,
+    создание удаляемого объявления) выполняется в ней до замера'''
+    def seller(i):
+        return ctx.sellers[i % len(ctx.sellers)]['login']
+
+    def announcement(i):
+        return ctx.announcements[i % len(ctx.announcements)]
+
+    def login(i):
+        return ctx.logins[i % len(ctx.logins)] if ctx.logins else ctx.master
+
+    def logout(i):
+        response = app.test_client().post(
+            '/api/login/', json={'login': ctx.master, 'password': 'password'}
+        )
+        return {'method': 'POST', 'path': '/api/logout/',
+                'headers': {'Authorization': 'Bearer ' + response.get_json()['token']}}
+
+    def delete_announcement(i):
+        number = ctx.db.create_announcement(ctx.master, **_ANNOUNCEMENT)
+        return {'method': 'DELETE', 'path': f'/api/announcements/{ctx.master}/{number}/'}
+
+    def delete_user_feedback(i):
+        ctx.db.create_user_feedback(ctx.buyer, ctx.master, 'Отзыв', 5)
+        return {'method': 'DELETE', 'path': f'/api/users/{ctx.master}/comments/{ctx.buyer}/'}
+
+    def delete_announcement_feedback(i):
+        ctx.db.create_announcement_feedback(ctx.buyer, ctx.master, 1, 'Комментарий')
+        return {'method': 'DELETE',
+                'path': f'/api/announcements/{ctx.master}/1/comments/{ctx.buyer}/'}
+
+    def get(path):
+        return lambda i: {'method': 'GET', 'path': path}
+
+    # Маршруты администратора требуют токен всегда
+    response = app.test_client().post(
+        '/api/login/', json={'login': ctx.admin, 'password': 'password'}
+    )
+    admin = {'Authorization': 'Bearer ' + response.get_json()['token']}
+
+    bulk_announcement = {'login': ctx.master, **_ANNOUNCEMENT}
+    return [
+        ('GET /', '', get('/')),
+        ('GET /api/ready/', '', get('/api/ready/')),
+        ('GET /api/schema/', '', get('/api/schema/')),
+        ('GET /api/metrics/pool/', '', get('/api/metrics/pool/')),
+        ('GET /api/metrics/cache/', '', get('/api/metrics/cache/')),
+        ('GET /metrics', '', get('/metrics')),
+        ('GET /api/metrics/encoding/', '', get('/api/metrics/encoding/')),
+        ('POST /api/users/', '', lambda i: {'method': 'POST', 'path': '/api/users/', 'json': {
+            'login': f'{ctx.prefix}user{ctx.next()}', 'password': 'password',
+            'role': 'buyer', 'full_name': 'Бенчмарк', 'age': 30}}),
+        ('GET /api/users/<login>/', '', lambda i: {'method': 'GET', 'path': f'/api/users/{login(i)}/'}),
+        ('GET /api/batch/users/', '20', lambda i: {
+            'method': 'GET', 'path': '/api/batch/users/',
+            'query_string': [('login', login(i + k)) for k in range(20)]}),
+        ('GET /api/users/<login>/comments/', 'popular',
+         lambda i: {'method': 'GET', 'path': f'/api/users/{seller(i)}/comments/'}),
+        ('POST /api/users/<login>/comments/', '', lambda i: {
+            'method': 'POST', 'path': f'/api/users/{ctx.master}/comments/',
+            'json': {'sender_login': ctx.buyer, 'text': 'Отзыв', 'estimation': 5}}),
+        ('GET /api/announcements/', 'limit=20', get('/api/announcements/?limit=20')),
+        ('GET /api/announcements/', 'price desc',
+         get('/api/announcements/?limit=20&sort=price&order=desc')),
+        ('GET /api/announcements/', 'filters',
+         get('/api/announcements/?limit=20&price_min=500&price_max=5000&weight_max=20')),
+        ('GET /api/announcements/', 'count', get('/api/announcements/?limit=20&count=1')),
+        ('GET /api/announcements/', 'q', get('/api/announcements/?limit=20&q=доска')),
+        ('GET /api/announcements/', 'near',
+         get('/api/announcements/?limit=20&near=55.75,37.62&radius_km=50')),
+        ('GET /api/announcements/', 'expand=master',
+         get('/api/announcements/?limit=20&expand=master')),
+        ('GET /api/announcements/facets/', '', get('/api/announcements/facets/')),
+        ('GET /api/announcements/facets/', 'q', get('/api/announcements/facets/?q=доска')),
+        ('POST /api/announcements/', '', lambda i: {
+            'method': 'POST', 'path': '/api/announcements/', 'json': bulk_announcement}),
+        ('POST /api/bulk/announcements/', '10', lambda i: {
+            'method': 'POST', 'path': '/api/bulk/announcements/', 'headers': admin,
+            'json': {'announcements': [bulk_announcement] * 10}}),
+        ('POST /api/bulk/user-comments/', '10', lambda i: {
+            'method': 'POST', 'path': '/api/bulk/user-comments/', 'headers': admin, 'json': {'feedback': [{
+                'sender_login': ctx.buyer, 'recipient_login': ctx.master,
+                'text': 'Отзыв', 'estimation': 4}] * 10}}),
+        ('POST /api/bulk/announcement-comments/', '10', lambda i: {
+            'method': 'POST', 'path': '/api/bulk/announcement-comments/', 'headers': admin,
+            'json': {'feedback': [{
+                'sender_login': ctx.buyer, 'master_login': ctx.master,
+                'number': 1, 'text': 'Комментарий'}] * 10}}),
+        ('GET /api/announcements/<login>/<number>/', '',
+         lambda i: {'method': 'GET', 'path': '/api/announcements/%s/%d/' % announcement(i)}),
+        ('GET /api/announcements/<login>/<number>/', 'expand',
+         lambda i: {'method': 'GET',
+                    'path': '/api/announcements/%s/%d/?expand=master,feedback' % announcement(i)}),
+        ('GET /api/batch/announcements/', '20', lambda i: {
+            'method': 'GET', 'path': '/api/batch/announcements/',
+            'query_string': [('id', '%s/%d' % announcement(i + k)) for k in range(20)]}),
+        ('GET /api/announcements/<login>/<number>/comments/', '',
+         lambda i: {'method': 'GET', 'path': '/api/announcements/%s/%d/comments/' % announcement(i)}),
+        ('POST /api/announcements/<login>/<number>/comments/', '', lambda i: {
+            'method': 'POST', 'path': f'/api/announcements/{ctx.master}/1/comments/',
+            'json': {'sender_login': ctx.buyer, 'text': 'Комментарий'}}),
+        ('POST /api/login/', '', lambda i: {
+            'method': 'POST', 'path': '/api/login/',
+            'json': {'login': ctx.master, 'password': 'password'}}),
+        ('POST /api/logout/', '', logout),
+        ('GET /api/backup/', 'ndjson', lambda i: {
+            'method': 'GET', 'path': '/api/backup/?format=ndjson', 'headers': admin}),
+        ('PATCH /api/users/<login>/', '', lambda i: {
+            'method': 'PATCH', 'path': f'/api/users/{ctx.master}/', 'json': {
+                'full_name': 'Бенчмарк', 'age': 31, 'description': 'Описание',
+                'education': '', 'photo_url': 'no_photo.png'}}),
+        ('PATCH /api/users/<login>/status/', '', lambda i: {
+            'method': 'PATCH', 'path': f'/api/users/{ctx.buyer}/status/', 'headers': admin,
+            'json': {'status': 'active'}}),
+        ('PATCH /api/announcements/<login>/<number>/', '', lambda i: {
+            'method': 'PATCH', 'path': f'/api/announcements/{ctx.master}/1/',
+            'json': {**_ANNOUNCEMENT, 'price': 2.0, 'description': 'Описание',
+                     'photo_url': 'no_photo.png'}}),
+        ('DELETE /api/announcements/<login>/<number>/', '', delete_announcement),
+        ('DELETE /api/users/<login_user>/comments/<login_author>/', '', delete_user_feedback),
+        ('DELETE /api/announcements/<login_master>/<number>/comments/<login_author>/', '',
+         delete_announcement_feedback),
+    ]
+
+
+def measure(app, request, iterations: int, concurrency: int) -> dict:
+    '''Задержки в миллисекундах и пропускная способность маршрута.
+
+    Пропускная способность считается по общему времени, включая
+    подготовку запросов, задержки - только по самим запросам
+    '''
+    local = threading.local()
+
+    def call(i):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        kwargs = request(i)
+        started = time.perf_counter()
+        response = local.client.open(**kwargs)
+        # Потоковые ответы дочитываются, чтобы учесть их целиком
+        body = response.get_data()
+        elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, response.status_code, len(body)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(iterations)))
+    elapsed = time.perf_counter() - started
+    timings = sorted(result[0] for result in results)
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'iterations': iterations,
+        'rps': iterations / elapsed,
+        'mean_ms': statistics.fmean(timings),
+        'p50_ms': _percentile(timings, 50),
+        'p90_ms': _percentile(timings, 90),
+        'p95_ms': _percentile(timings, 95),
+        'p99_ms': _percentile(timings, 99),
+        'max_ms': timings[-1],
+        'bytes': statistics.fmean(result[2] for result in results),
+        'statuses': statuses,
+    }
+
+
+def _percentile(timings: list, p: float) -> float:
+    '''Перцентиль по отсортированному списку (метод ближайшего ранга)'''
+    rank = max(1, -(-len(timings) * p // 100))
+    return timings[int(rank) - 1]
+
+
+def import_dataset(path: str, db, schema) -> dict:
+    '''Замена базы бэкапом path: время импорта и последующих пересчётов'''
+    importer = DatabaseImporter()
+    started = time.perf_counter()
+    if not importer.import_data(path):
+        raise SystemExit(f'Некорректный бэкап {path}')
+    imported = time.perf_counter() - started
+    started = time.perf_counter()
+    run_migrations(db, force=True)
+    schema.wait_online()
+    db.cache.clear()
+    return {'seconds': imported, 'post_import_seconds': time.perf_counter() - started,
+            'file_bytes': os.path.getsize(path)}
+
+
+def export_dataset() -> dict:
+    '''Время потокового экспорта NDJSON без записи на диск'''
+    exporter = DatabaseExporter()
+    size = lines = 0
+    started = time.perf_counter()
+    for chunk in exporter.iter_ndjson():
+        size += len(chunk.encode('utf-8'))
+        lines += chunk.count('\n')
+    seconds = time.perf_counter() - started
+    return {'seconds': seconds, 'lines': lines, 'bytes': size, 'lines_per_second': lines / seconds}
+
+
+def dataset_counts(db) -> dict:
+    with db.driver.session() as session:
+        return session.run(
+            '''RETURN COUNT { (:User) } AS users, COUNT { (:Announcement) } AS announcements,
+                COUNT { (:Feedback) } AS feedback, COUNT { ()-[]->() } AS relationships'''
+        ).single().data()
+
+
+def index_plans(db) -> dict:
+    '''Операторы планов EXPLAIN запросов INDEX_CHECKS, есть ли в плане
+    поиск по индексу и сканирования из SCAN_OPERATORS'''
+    plans = {}
+    with db.driver.session() as session:
+        for name, (query, params) in INDEX_CHECKS.items():
+            plan = session.run('EXPLAIN ' + query, **params).consume().plan
+            operators = sorted(_plan_operators(plan))
+            plans[name] = {
+                'operators': operators,
+                'index_seek': any('IndexSeek' in operator for operator in operators),
+                'scans': [operator for operator in operators if operator in SCAN_OPERATORS],
+            }
+    return plans
+
+
+def _plan_operators(plan: dict) -> set:
+    '''Операторы плана и его потомков без суффикса среды выполнения (@neo4j)'''
+    operators = {plan['operatorType'].split('@')[0]}
+    for child in plan.get('children', ()):
+        operators |= _plan_operators(child)
+    return operators
+
+
+def git_revision() -> dict:
+    '''Коммит и наличие незакоммиченных изменений, если это репозиторий git'''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def compare(previous: dict, current: dict) -> None:
+    '''Изменение p50 и p95 маршрутов относительно прошлого прогона'''
+    print(f"\nСравнение с {previous.get('commit')} ({previous.get('started_at')})")
+    print(f"{'route':<72}{'p50 ms':>16}{'p95 ms':>16}")
+    for name, result in current['routes'].items():
+        old = previous.get('routes', {}).get(name)
+        if old is None:
+            continue
+        print(f"{name:<72}{_change(old['p50_ms'], result['p50_ms']):>16}"
+              f"{_change(old['p95_ms'], result['p95_ms']):>16}")
+    for stage in ('import', 'export'):
+        if previous.get(stage) and current.get(stage):
+            print(f"{stage:<72}{_change(previous[stage]['seconds'], current[stage]['seconds']):>16}")
+
+
+def _change(old: float, new: float) -> str:
+    return f'{new:.2f} ({(new - old) / old * 100:+.0f}%)' if old else f'{new:.2f}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dataset', help='бэкап, которым заменяется база перед замером')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--heavy-iterations', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--routes', nargs='*', help='подстроки имён маршрутов для замера')
+    parser.add_argument('--no-cache', action='store_true', help='отключить кэш чтения')
+    parser.add_argument('--output', help='файл результата, по умолчанию в bench_results/')
+    parser.add_argument('--compare', help='прошлый результат для сравнения')
+    args = parser.parse_args()
+
+    if args.no_cache:
+        os.environ['CACHE_TTL'] = '0'
+    # Импорт приложения подключается к Neo4j и готовит схему
+    import app as application
+    app, db = application.app, application.db
+    if not application.startup.wait():
+        raise SystemExit(f'Сервер не запустился: {application.startup.error}')
+
+    result = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        **git_revision(),
+        'python': platform.python_version(),
+        'config': vars(args),
+    }
+    if args.dataset:
+        print(f'Импорт {args.dataset}...')
+        result['import'] = import_dataset(args.dataset, db, application.schema)
+        print(f"Импорт: {result['import']['seconds']:.1f} с")
+    result['dataset'] = dataset_counts(db)
+    print('Данные:', result['dataset'])
+    application.schema.wait_online()
+    result['index_plans'] = index_plans(db)
+    for name, plan in result['index_plans'].items():
+        used = plan['index_seek'] and not plan['scans']
+        print(f"План {name}: {'индекс' if used else 'БЕЗ ИНДЕКСА'} ({', '.join(plan['operators'])})")
+
+    ctx = Context(db)
+    result['routes'] = {}
+    try:
+        covered = set()
+        print(f"{'route':<72}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+        for route, variant, request in scenarios(ctx, app):
+            covered.add(route)
+            name = f'{route} [{variant}]' if variant else route
+            if args.routes and not any(part in name for part in args.routes):
+                continue
+            iterations = args.iterations
+            if route in HEAVY_ROUTES:
+                iterations = min(iterations, args.heavy_iterations)
+            else:
+                measure(app, request, args.warmup, args.concurrency)
+            stats = measure(app, request, iterations, args.concurrency)
+            result['routes'][name] = stats
+            print(f"{name:<72}{stats['rps']:>9.1f}{stats['p50_ms']:>9.2f}"
+                  f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}  {stats['statuses']}")
+    finally:
+        ctx.cleanup()
+
+    # Маршруты app.py без сценария попадают в результат, чтобы их не забыли
+    rules = {
+        f'{method} {rule.rule}'
+        for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+        for method in rule.methods - {'HEAD', 'OPTIONS'}
+    }
+    result['skipped'] = {
+        route: SKIPPED_ROUTES.get(route, 'нет сценария')
+        for route in sorted(rules - covered)
+    }
+    for route, reason in result['skipped'].items():
+        print(f'Пропущен {route}: {reason}')
+
+    result['export'] = export_dataset()
+    print(f"Экспорт: {result['export']['seconds']:.1f} с, "
+          f"{result['export']['lines_per_second']:.0f} строк в секунду")
+
+    output = args.output or os.path.join(
+        'bench_results', f"{result['started_at'][:19].replace(':', '')}-{result['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f'Результат: {output}')
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+'''Сравнение числа транзакций и задержки операций записи DatabaseManager.
+
+Прежний вариант операций (проверка существования, затем запись)
+воспроизводится вызовом тех же проверок перед новой однозапросной
+операцией. Кэш отключён (NullCache), иначе проверки прежнего варианта
+после первой итерации отвечали бы из памяти, не обращаясь к Neo4j.
+Нужен запущенный Neo4j, параметры подключения берутся из переменных
+окружения NEO4J_*.
+
+    cd backend && python -m benchmarks.bench_writes --iterations 200
+'''
+import argparse
+import statistics
+import time
+import uuid
+
+from utils.cache import NullCache
+from utils.db_manager import DatabaseManager
+
+
+class _CountingSession:
+    '''Сессия, считающая транзакции (обращения к серверу)'''
+
+    def __init__(self, session, counter):
+        self._session = session
+        self._counter = counter
+
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+
+    def __exit__(self, *args):
+        return self._session.__exit__(*args)
+
+
+    def execute_read(self, *args, **kwargs):
+        self._counter['tx'] += 1
+        return self._session.execute_read(*args, **kwargs)
+
+
+    def execute_write(self, *args, **kwargs):
+        self._counter['tx'] += 1
+        return self._session.execute_write(*args, **kwargs)
+
+
+    def run(self, *args, **kwargs):
+        self._counter['tx'] += 1
+        return self._session.run(*args, **kwargs)
+
+
+class _CountingDriver:
+    '''Драйвер, выдающий считающие сессии'''
+
+    def __init__(self, driver):
+        self._driver = driver
+        self.counter = {'tx': 0}
+
+
+    def session(self, *args, **kwargs):
+        return _CountingSession(self._driver.session(*args, **kwargs), self.counter)
+
+
+def _operations(db: DatabaseManager, master: str, buyer: str) -> dict:
+    '''Пары (прежний вариант, новый вариант) для каждой операции'''
+    announcement = dict(
+        name='Бенчмарк', width=1.0, height=1.0, length=1.0, weight=1.0,
+        amount=1, price=1.0, address='Москва'
+    )
+    profile = dict(
+        full_name='Бенчмарк', age=30, description='', education='', photo_url='no_photo.png'
+    )
+
+    def create_announcement_legacy():
+        db.user_exists(master)
+        db.get_announcement_max_number(master)
+        return db.create_announcement(master, **announcement)
+
+    def edit_user_legacy():
+        db.user_exists(master)
+        db.edit_user(master, **profile)
+
+    def set_user_status_legacy():
+        db.user_exists(buyer)
+        db.set_user_status(buyer, 'active')
+
+    def create_user_feedback_legacy():
+        db.user_exists(buyer)
+        db.user_exists(master)
+        db.create_user_feedback(buyer, master, 'Отзыв', 5)
+
+    def create_announcement_feedback_legacy():
+        db.user_exists(buyer)
+        db.get_announcement(master, 1)
+        db.create_announcement_feedback(buyer, master, 1, 'Комментарий')
+
+    def delete_announcement_legacy():
+        number = db.create_announcement(master, **announcement)
+        db.get_announcement(master, number)
+        db.delete_announcement(master, number)
+
+    def delete_announcement_new():
+        number = db.create_announcement(master, **announcement)
+        db.delete_announcement(master, number)
+
+    return {
+        'create_announcement': (
+            create_announcement_legacy,
+            lambda: db.create_announcement(master, **announcement)
+        ),
+        'edit_user': (edit_user_legacy, lambda: db.edit_user(master, **profile)),
+        'set_user_status': (
+            set_user_status_legacy,
+            lambda: db.set_user_status(buyer, 'active')
+        ),
+        'create_user_feedback': (
+            create_user_feedback_legacy,
+            lambda: db.create_user_feedback(buyer, master, 'Отзыв', 5)
+        ),
+        'create_announcement_feedback': (
+            create_announcement_feedback_legacy,
+            lambda: db.create_announcement_feedback(buyer, master, 1, 'Комментарий')
+        ),
+        # Включает создание удаляемого объявления в обоих вариантах
+        'delete_announcement': (delete_announcement_legacy, delete_announcement_new),
+    }
+
+
+def _measure(driver: _CountingDriver, operation, iterations: int) -> dict:
+    '''Среднее число транзакций и задержка операции в миллисекундах'''
+    driver.counter['tx'] = 0
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        operation()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'tx': driver.counter['tx'] / iterations,
+        'mean': statistics.fmean(timings),
+        'p50': timings[len(timings) // 2],
+        'p95': timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args()
+
+    db = DatabaseManager(cache=NullCache())
+    driver = db.driver
+    db.driver = _CountingDriver(driver)
+    suffix = uuid.uuid4().hex[:8]
+    master, buyer = f'bench_master_{suffix}', f'bench_buyer_{suffix}'
+    db.create_user(master, 'password', 'master', 'Бенчмарк', 30)
+    db.create_user(buyer, 'password', 'buyer', 'Бенчмарк', 30)
+    db.create_announcement(master, 'Бенчмарк', 1.0, 1.0, 1.0, 1.0, 1, 1.0, 'Москва')
+
+    try:
+        print(f"{'operation':<30}{'variant':<8}{'tx/op':>7}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, variants in _operations(db, master, buyer).items():
+            for variant, operation in zip(('legacy', 'new'), variants):
+                result = _measure(db.driver, operation, args.iterations)
+                print(f"{name:<30}{variant:<8}{result['tx']:>7.1f}"
+                      f"{result['mean']:>10.2f}{result['p50']:>10.2f}{result['p95']:>10.2f}")
+    finally:
+        # Удаление пользователей бенчмарка со всеми объявлениями и отзывами
+        with driver.session() as session:
+            session.run(
+                '''MATCH (u:User) WHERE u.login IN $logins
+                OPTIONAL MATCH (u)-[:Create|Make]->(n)
+                OPTIONAL MATCH (f:Feedback)-[:About]->(n)
+                DETACH DELETE f, n, u''',
+                logins=[master, buyer]
+            ).consume()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+'''Генератор синтетического бэкапа заданного размера для нагрузочных тестов.
+
+Бэкап в формате, который читает DatabaseImporter (по расширению файла:
+.ndjson, .ndjson.gz или .json): пользователи (мастера, покупатели
+и администратор), объявления со связями Create и номерами по порядку
+у каждого мастера, отзывы о пользователях и комментарии к объявлениям
+со связями Make и About. Популярность мастеров распределена по закону
+Ципфа: у немногих мастеров большая часть объявлений и отзывов.
+Узлы и отношения записываются потоково, поэтому 1 000 000 объявлений
+не требуют хранения всего графа в памяти. При одних и тех же параметрах,
+включая --seed и --now, файл получается одинаковым.
+
+    cd backend && python -m benchmarks.generate_dataset --announcements 100000 \\
+        --output bench_100k.ndjson.gz
+'''
+import argparse
+import gzip
+import itertools
+import json
+import random
+import time
+import uuid
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from utils.auth import hash_password
+from utils.geocoder import CITIES_TABLE
+from utils.utils import dumps
+
+
+# Пароль всех сгенерированных пользователей; хэш считается один раз
+PASSWORD = 'password'
+# Момент генерации по умолчанию: все даты отсчитываются от него назад
+NOW = datetime(2025, 1, 1, tzinfo=timezone.utc)
+# Оценки в отзывах о пользователях: чаще высокие
+ESTIMATION_WEIGHTS = {1: 0.05, 2: 0.05, 3: 0.15, 4: 0.3, 5: 0.45}
+
+MATERIALS = (
+    'Опилки', 'Доска обрезная', 'Брус', 'Фанера', 'ДСП', 'Обрезки МДФ', 'Стекло',
+    'Обрезки ткани', 'Кожа', 'Металлолом', 'Арматура', 'Профильная труба',
+    'Кирпич', 'Плитка', 'Пеноблок', 'Утеплитель', 'Гипсокартон', 'Линолеум',
+)
+QUALITIES = ('', 'сухие', 'новые', 'б/у', 'в упаковке', 'остатки партии', 'сорт 1', 'сорт 2')
+STREETS = (
+    'ул. Ленина', 'ул. Пушкина', 'ул. Некрасова', 'пр. Мира', 'ул. Гагарина',
+    'Промышленная ул.', 'Заводская ул.', 'ул. Строителей', 'Садовая ул.',
+)
+FIRST_NAMES = ('Иван', 'Пётр', 'Анна', 'Мария', 'Сергей', 'Ольга', 'Алексей', 'Елена', 'Дмитрий')
+LAST_NAMES = ('Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев', 'Козлов')
+FEEDBACK_TEXTS = (
+    'Всё отлично', 'Быстро договорились', 'Материал как на фото', 'Рекомендую',
+    'Были задержки', 'Качество среднее', 'Не всё совпало с описанием', 'Спасибо!',
+)
+
+
+def generate(announcements: int, users: int = None, feedback: int = None,
+        masters_share: float = 0.3, skew: float = 1.1, seed: int = 42, now: datetime = NOW):
+    '''Пары (раздел, элемент) синтетического бэкапа, как у iter_ndjson_items.
+    Все случайные значения, включая соль пароля, берутся из генератора с seed'''
+    rng = random.Random(seed)
+    users = users or max(10, announcements // 10)
+    feedback = announcements // 2 if feedback is None else feedback
+    masters = max(1, int(users * masters_share))
+    with open(CITIES_TABLE, 'r', encoding='utf-8') as f:
+        cities = [(name.title(), point) for name, point in json.load(f).items()]
+    password = hash_password(PASSWORD, salt=rng.randbytes(16))
+
+    yield 'meta', {'kind': 'full', 'until': now.isoformat()}
+
+    # Пользователи 0..masters-1 - мастера по убыванию популярности,
+    # затем покупатели и последним - администратор
+    for i in range(users):
+        role = 'master' if i < masters else 'admin' if i == users - 1 else 'buyer'
+        created = _moment(rng, now, 730)
+        yield 'nodes', {'id': i, 'labels': ['User'], 'properties': {
+            'login': _login(i, masters, users), 'password': password, 'role': role,
+            'full_name': f'{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}',
+            'age': rng.randint(18, 70), 'status': 'active', 'description': '',
+            'education': '', 'photo_url': 'no_photo.png',
+            'created_at': created, 'updated_at': created,
+        }}
+
+    # Мастер каждого объявления выбирается по весам Ципфа
+    master_weights = list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(masters)))
+    announcement_master = array('l', rng.choices(range(masters), cum_weights=master_weights,
+                                                 k=announcements))
+    first_announcement = users
+    for i, master in enumerate(announcement_master):
+        city, (latitude, longitude) = rng.choice(cities)
+        created = _moment(rng, now, 365)
+        yield 'nodes', {'id': first_announcement + i, 'labels': ['Announcement'], 'properties': {
+            'name': f'{rng.choice(MATERIALS)} {rng.choice(QUALITIES)}'.strip(),
+            'width': round(rng.uniform(0.1, 6), 2), 'height': round(rng.uniform(0.01, 3), 2),
+            'length': round(rng.uniform(0.1, 12), 2), 'weight': round(rng.lognormvariate(2, 1.2), 2),
+            'amount': rng.randint(1, 500), 'price': round(rng.lognormvariate(7, 1.3), 2),
+            'address': f'{city}, {rng.choice(STREETS)}, {rng.randint(1, 150)}',
+            'location': {'latitude': latitude + rng.uniform(-0.1, 0.1),
+                         'longitude': longitude + rng.uniform(-0.1, 0.1)},
+            'description': '', 'photo_url': 'no_photo.png',
+            'created_at': created, 'updated_at': created,
+        }}
+
+    # Отзывы: автор - случайный покупатель, предмет - объявление (по весам
+    # его мастера) или сам популярный мастер. Один автор - один отзыв о предмете
+    buyers = range(masters, users - 1)
+    first_feedback = first_announcement + announcements
+    targets = set()
+    feedback_rows = []
+    attempts = 0
+    while len(feedback_rows) < feedback and buyers and attempts < feedback * 3:
+        attempts += 1
+        author = rng.choice(buyers)
+        if announcements and rng.random() < 0.6:
+            target = first_announcement + rng.randrange(announcements)
+            estimation = None
+        else:
+            target = rng.choices(range(masters), cum_weights=master_weights)[0]
+            estimation = rng.choices(list(ESTIMATION_WEIGHTS), list(ESTIMATION_WEIGHTS.values()))[0]
+        if (author, target) in targets:
+            continue
+        targets.add((author, target))
+        feedback_rows.append((author, target, estimation))
+        yield 'nodes', {'id': first_feedback + len(feedback_rows) - 1, 'labels': ['Feedback'],
+                        'properties': {
+            'text': rng.choice(FEEDBACK_TEXTS), 'uid': str(uuid.UUID(int=rng.getrandbits(128))),
+            'created_at': _moment(rng, now, 365),
+        }}
+    del targets
+
+    relationship_id = itertools.count()
+    numbers = [0] * masters
+    for i, master in enumerate(announcement_master):
+        numbers[master] += 1
+        yield 'relationships', {
+            'id': next(relationship_id), 'type': 'Create', 'start_node': master,
+            'end_node': first_announcement + i, 'properties': {'number': numbers[master]}
+        }
+    for i, (author, target, estimation) in enumerate(feedback_rows):
+        node = first_feedback + i
+        yield 'relationships', {
+            'id': next(relationship_id), 'type': 'Make', 'start_node': author,
+            'end_node': node, 'properties': {}
+        }
+        yield 'relationships', {
+            'id': next(relationship_id), 'type': 'About', 'start_node': node, 'end_node': target,
+            'properties': {} if estimation is None else {'estimation': estimation}
+        }
+
+
+def write(items, output: str) -> int:
+    '''Запись пар (раздел, элемент) в файл бэкапа, возвращает число строк'''
+    opener = gzip.open if output.endswith('.gz') else open
+    count = 0
+    with opener(output, 'wt', encoding='utf-8') as f:
+        if output.endswith(('.ndjson', '.ndjson.gz')):
+            for section, item in items:
+                f.write(dumps({'section': section, **item}) + '\n')
+                count += 1
+            return count
+        # JSON: {"nodes": [...], "relationships": [...]}, раздел meta не пишется
+        section = None
+        for key, item in items:
+            if key == 'meta':
+                continue
+            if key != section:
+                f.write('{"nodes": [' if section is None else '], "relationships": [')
+                section = key
+            elif count:
+                f.write(',')
+            f.write('\n' + dumps(item))
+            count += 1
+        f.write('{"nodes": [], "relationships": []}' if section is None else
+                ']}' if section == 'relationships' else '], "relationships": []}')
+    return count
+
+
+def _login(i: int, masters: int, users: int) -> str:
+    if i < masters:
+        return f'master{i}'
+    return 'admin' if i == users - 1 else f'buyer{i - masters}'
+
+
+def _moment(rng: random.Random, now: datetime, days: int) -> str:
+    '''Случайный момент за последние days дней, строка ISO 8601'''
+    return (now - timedelta(seconds=rng.uniform(0, days * 86400))).isoformat()
+
+
+def _moment_arg(value: str) -> datetime:
+    '''Аргумент --now; время без часового пояса считается UTC'''
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--announcements', type=int, default=10000)
+    parser.add_argument('--users', type=int, help='по умолчанию десятая часть объявлений')
+    parser.add_argument('--feedback', type=int, help='по умолчанию половина объявлений')
+    parser.add_argument('--masters-share', type=float, default=0.3, help='доля мастеров')
+    parser.add_argument('--skew', type=float, default=1.1, help='показатель Ципфа')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--now', type=_moment_arg, default=NOW,
+                        help=f'момент генерации, ISO 8601 (по умолчанию {NOW.isoformat()})')
+    parser.add_argument('--output', default='bench_dataset.ndjson.gz')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = write(generate(args.announcements, args.users, args.feedback,
+                          args.masters_share, args.skew, args.seed, args.now), args.output)
+    print(f'{args.output}: {count} записей за {time.perf_counter() - started:.1f} с')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from utils import auth
+from utils.auth import (RevocationList, SessionTokens, hash_password, needs_rehash,
+                        verify_password)
+
+
+SALT = bytes(range(16))
+
+
+def test_hash_and_verify():
+    stored = hash_password('пароль')
+    assert stored.startswith(f'scrypt${auth.SCRYPT_N}$')
+    assert verify_password('пароль', stored)
+    assert not verify_password('Пароль', stored)
+    assert not needs_rehash(stored)
+
+
+def test_salt():
+    assert hash_password('secret', SALT) == hash_password('secret', SALT)
+    assert hash_password('secret') != hash_password('secret')
+
+
+def test_plaintext_and_missing_passwords():
+    assert verify_password('secret', 'secret')
+    assert not verify_password('secret', 'other')
+    assert not verify_password('secret', None)
+    assert needs_rehash('secret')
+    assert needs_rehash(f'scrypt$1024$8$1${"A" * 22}${"A" * 43}')
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    return SessionTokens(RevocationList(), secret=b'test-secret')
+
+
+def test_issue_and_validate(tokens):
+    session = tokens.issue({'login': 'ivan', 'role': 'master'})
+    claims = tokens.validate(session['token'])
+    assert claims['sub'] == 'ivan' and claims['role'] == 'master'
+    assert session['expires_at'] == int(claims['exp'])
+    other = SessionTokens(RevocationList(), secret=b'other-secret')
+    assert other.validate(session['token']) is None
+
+
+@pytest.mark.parametrize('token', ['', 'abc', 'abc.def', '.'])
+def test_malformed_tokens(tokens, token):
+    assert tokens.validate(token) is None
+
+
+def test_tampered_token(tokens):
+    payload, _, signature = tokens.issue({'login': 'ivan'})['token'].partition('.')
+    forged = auth._b64encode(auth._b64decode(payload).replace(b'ivan', b'root'))
+    assert tokens.validate(f'{forged}.{signature}') is None
+
+
+def test_expired_token(monkeypatch):
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    tokens = SessionTokens(RevocationList(), secret=b'test-secret', ttl=-1)
+    assert tokens.validate(tokens.issue({'login': 'ivan'})['token']) is None
+
+
+def test_revoke_token(tokens):
+    first = tokens.issue({'login': 'ivan'})['token']
+    second = tokens.issue({'login': 'ivan'})['token']
+    tokens.revoke(tokens.validate(first))
+    assert tokens.validate(first) is None
+    assert tokens.validate(second) is not None
+
+
+def test_revoke_user(tokens):
+    old = tokens.issue({'login': 'ivan'})['token']
+    other = tokens.issue({'login': 'petr'})['token']
+    tokens.revocations.revoke_user('ivan')
+    time.sleep(0.01)
+    new = tokens.issue({'login': 'ivan'})['token']
+    assert tokens.validate(old) is None
+    assert tokens.validate(other) is not None
+    assert tokens.validate(new) is not None
+
+
+def test_blocked_users(tokens):
+    revocations = tokens.revocations
+    token = tokens.issue({'login': 'ivan'})['token']
+    revocations.set_blocked('ivan', True)
+    assert revocations.is_blocked('ivan')
+    assert tokens.validate(token) is None
+    revocations.set_blocked('ivan', False)
+    assert not revocations.is_blocked('ivan')
+    revocations.reset_blocked(['petr', 'olga'])
+    assert revocations.is_blocked('petr') and revocations.is_blocked('olga')
+    assert not revocations.is_blocked(None)
+    assert not revocations.is_blocked(['petr'])
+
+
+def test_secret_required_for_several_workers(monkeypatch):
+    monkeypatch.setenv('WEB_CONCURRENCY', '2')
+    monkeypatch.delenv('SESSION_SECRET', raising=False)
+    with pytest.raises(RuntimeError):
+        SessionTokens(RevocationList())
+    monkeypatch.setenv('SESSION_SECRET', 'shared')
+    first, second = SessionTokens(RevocationList()), SessionTokens(RevocationList())
+    assert second.validate(first.issue({'login': 'ivan'})['token']) is not None
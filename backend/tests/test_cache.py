@@ -0,0 +1,92 @@
+import pytest
+
+from utils import cache as cache_module
+from utils.cache import Cache, LRUCache, NullCache, default_cache
+
+
+class _Clock:
+    '''Подменяемое time.monotonic'''
+
+    def __init__(self):
+        self.now = 1000.0
+
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_module.time, 'monotonic', clock)
+    return clock
+
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        Cache()
+
+
+def test_get_set_delete_clear():
+    cache = LRUCache()
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    cache.set(('user', 'b'), {'login': 'b'})
+    assert cache.get('a') == 1
+    assert cache.get(('user', 'b')) == {'login': 'b'}
+    cache.delete('a')
+    cache.delete('missing')
+    assert cache.get('a') is None
+    cache.clear()
+    assert cache.get(('user', 'b')) is None
+    assert cache.stats() == {'size': 0, 'hits': 2, 'misses': 3, 'evictions': 0}
+
+
+def test_least_recently_used_is_evicted():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire(clock):
+    cache = LRUCache(ttl=10)
+    cache.set('a', 1)
+    clock.now += 9.9
+    assert cache.get('a') == 1
+    clock.now += 0.1
+    assert cache.get('a') is None
+    assert cache.stats() == {'size': 0, 'hits': 1, 'misses': 1, 'evictions': 1}
+
+
+def test_set_renews_expiry(clock):
+    cache = LRUCache(ttl=10)
+    cache.set('a', 1)
+    clock.now += 8
+    cache.set('a', 2)
+    clock.now += 8
+    assert cache.get('a') == 2
+
+
+def test_null_cache_stores_nothing():
+    cache = NullCache()
+    cache.set('a', 1)
+    assert cache.get('a') is None
+    assert cache.stats() == {'size': 0, 'hits': 0, 'misses': 1, 'evictions': 0}
+
+
+@pytest.mark.parametrize('env, expected', [
+    ({}, LRUCache),
+    ({'CACHE_TTL': '0'}, NullCache),
+    ({'CACHE_MAX_SIZE': '0'}, NullCache),
+])
+def test_default_cache(monkeypatch, env, expected):
+    monkeypatch.delenv('CACHE_TTL', raising=False)
+    monkeypatch.delenv('CACHE_MAX_SIZE', raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    assert type(default_cache()) is expected
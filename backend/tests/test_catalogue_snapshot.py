@@ -0,0 +1,229 @@
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from utils.catalogue_snapshot import SNAPSHOT_FIELDS, SNAPSHOT_SORTS, CatalogueSnapshot, _micros
+from utils.db_manager import ANNOUNCEMENT_FILTERS
+from utils.pagination import announcement_keys, decode_cursor, encode_cursor
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+FULL_NAMES = ('Иванов Пётр', 'Смирнова Анна', 'Petrov', None)
+
+
+class Catalogue:
+    '''Каталог в словарях с семантикой фильтров и ORDER BY запроса Cypher
+    (отсутствующее значение не проходит фильтр, равные ключи упорядочены
+    по времени создания, логину и номеру) и снимок, изменяемый так же'''
+
+    def __init__(self, seed: int):
+        self.random = random.Random(seed)
+        self.masters = {f'm{i}': self.random.choice(FULL_NAMES) for i in range(20)}
+        self.rows = {}
+        self.numbers = {}
+        # Маленькая ёмкость, чтобы проверить и рост массивов
+        self.snapshot = CatalogueSnapshot(capacity=4)
+        self.snapshot.loaded = True
+
+
+    def row(self, login: str, number: int) -> dict:
+        choice = self.random.choice
+        row = {
+            'login': login, 'number': number, 'full_name': self.masters[login],
+            'name': choice(('Доска', 'Брус сухой', 'ФАНЕРА', None)),
+            'address': choice(('Москва, ул. Ленина', 'Тверь', None)),
+            'created_us': _micros((START + timedelta(seconds=choice(range(20)))).isoformat())
+        }
+        for field in SNAPSHOT_FIELDS:
+            row[field] = choice((None, 1, 2, 5.5)) if self.random.random() < .1 else choice((1, 2, 3, 5.5, 10, 20))
+        return row
+
+
+    def add(self) -> None:
+        login = self.random.choice(list(self.masters))
+        number = self.numbers[login] = self.numbers.get(login, 0) + 1
+        row = self.rows[login, number] = self.row(login, number)
+        self.snapshot.upsert(row)
+
+
+    def mutate(self) -> None:
+        key = self.random.choice(list(self.rows))
+        action = self.random.random()
+        if action < .4:
+            del self.rows[key]
+            self.snapshot.remove(*key)
+        elif action < .8:
+            # Редактирование не меняет время создания и не знает имени мастера
+            row = self.row(*key)
+            row['created_us'] = self.rows[key]['created_us']
+            self.rows[key] = row
+            self.snapshot.upsert({field: value for field, value in row.items()
+                                  if field not in ('created_us', 'full_name')})
+        else:
+            login = self.random.choice(list(self.masters))
+            self.masters[login] = self.random.choice(FULL_NAMES)
+            self.snapshot.rename_master(login, self.masters[login])
+
+
+    def matches(self, row: dict, params: dict) -> bool:
+        full_name = self.masters[row['login']]
+        if row['name'] is None or row['address'] is None or full_name is None:
+            return False
+        for field, value in (('name', row['name']), ('address', row['address']),
+                             ('master', full_name)):
+            if params[field].lower() not in value.lower():
+                return False
+        for field in SNAPSHOT_FIELDS:
+            value = row[field]
+            if value is None or value < params[f'{field}_min']:
+                return False
+            if params[f'{field}_max'] != 0 and value > params[f'{field}_max']:
+                return False
+        return True
+
+
+    def query(self, params: dict) -> list:
+        sort = params['sort']
+
+        def key(row):
+            primary = row['created_us'] if sort == 'created_at' else row[sort]
+            return (primary, row['created_us'], row['login'], row['number'])
+
+        rows = [row for row in self.rows.values() if self.matches(row, params)]
+        if params['after'] is not None:
+            after = params['after']
+            created = _micros(after['created_at'])
+            cursor = (created if sort == 'created_at' else after[sort], created,
+                      after['master'], after['number'])
+            rows = [row for row in rows if (key(row) < cursor if params['descending'] else key(row) > cursor)]
+        rows.sort(key=key, reverse=params['descending'])
+        if params['limit']:
+            rows = rows[:params['limit']]
+        return [(row['login'], row['number']) for row in rows]
+
+
+    def params(self) -> dict:
+        choice = self.random.choice
+        params = dict(ANNOUNCEMENT_FILTERS, q='', near=None, sort=choice(SNAPSHOT_SORTS),
+                      descending=self.random.random() < .5, limit=choice((0, 1, 5, 17)),
+                      after=None, expand=())
+        for field in SNAPSHOT_FIELDS:
+            if self.random.random() < .3:
+                params[f'{field}_min'] = choice((0, 2, 3))
+            if self.random.random() < .3:
+                params[f'{field}_max'] = choice((0, 5.5, 10))
+        for field, values in (('name', ('до', 'ФАН', 'x')), ('master', ('иван', 'pet')),
+                              ('address', ('моск', ''))):
+            if self.random.random() < .3:
+                params[field] = choice(values)
+        return params
+
+
+    def cursor(self, key: tuple, sort: str) -> dict:
+        '''Курсор после объявления, как его возвращает decode_cursor'''
+        row = self.rows[key]
+        created = EPOCH + timedelta(microseconds=int(row['created_us']))
+        after = {'created_at': created.isoformat().replace('+00:00', '.000000000+00:00'),
+                 'master': row['login'], 'number': row['number']}
+        if sort != 'created_at':
+            after[sort] = row[sort]
+        return after
+
+
+@pytest.fixture
+def catalogue():
+    catalogue = Catalogue(seed=1)
+    for _ in range(500):
+        catalogue.add()
+    return catalogue
+
+
+def test_query_and_count_match_cypher_semantics(catalogue):
+    for _ in range(100):
+        for _ in range(10):
+            catalogue.mutate()
+        params = catalogue.params()
+        assert catalogue.snapshot.query(params) == catalogue.query(params), params
+        assert catalogue.snapshot.count(params) == len(catalogue.query({**params, 'limit': 0}))
+
+
+def test_pages_by_cursor_cover_whole_list(catalogue):
+    for _ in range(30):
+        params = {**catalogue.params(), 'limit': 7}
+        pages = []
+        while True:
+            page = catalogue.snapshot.query(params)
+            assert page == catalogue.query(params), params
+            if not page:
+                break
+            pages += page
+            params = {**params, 'after': catalogue.cursor(page[-1], params['sort'])}
+        assert pages == catalogue.query({**params, 'after': None, 'limit': 0})
+
+
+def test_compaction_keeps_rows():
+    catalogue = Catalogue(seed=2)
+    for _ in range(3000):
+        catalogue.add()
+    for key in list(catalogue.rows)[:2000]:
+        del catalogue.rows[key]
+        catalogue.snapshot.remove(*key)
+    assert catalogue.snapshot.stats()['capacity'] < 4096
+    params = {**catalogue.params(), 'limit': 0}
+    assert catalogue.snapshot.query(params) == catalogue.query(params)
+
+
+def test_can_answer():
+    snapshot = CatalogueSnapshot()
+    assert not snapshot.can_answer({})
+    snapshot.loaded = True
+    assert snapshot.can_answer({'sort': 'price'})
+    assert not snapshot.can_answer({'q': 'доска'})
+    assert not snapshot.can_answer({'near': {'latitude': 0, 'longitude': 0}})
+    assert not snapshot.can_answer({'sort': 'distance'})
+
+
+@pytest.mark.skipif(os.environ.get('NEO4J_TEST') != '1',
+                    reason='нужна Neo4j с данными (NEO4J_TEST=1 и NEO4J_URI)')
+def test_snapshot_matches_database():
+    from utils.db_manager import DatabaseManager
+    from utils.cache import NullCache
+
+    db = DatabaseManager(cache=NullCache(), snapshot=CatalogueSnapshot())
+    db.load_snapshot()
+    snapshot = db.snapshot
+    cases = [
+        {}, {'sort': 'price', 'descending': True}, {'sort': 'weight', 'price_min': 100.0},
+        {'amount_min': 2, 'width_max': 500.0}, {'name': 'а', 'address': 'а'}, {'master': 'а'},
+    ]
+    for filters in cases:
+        for limit in (0, 25):
+            params = {'limit': limit, **filters}
+            sort = params.get('sort', 'created_at')
+            db.snapshot = snapshot
+            expected_count = db.count_announcements(
+                **{k: v for k, v in filters.items() if k in ANNOUNCEMENT_FILTERS})
+            by_snapshot = db.get_announcements(**params)
+            db.snapshot = None
+            by_cypher = db.get_announcements(**params)
+            keys = [(item['master'], item['number']) for item in by_cypher]
+            assert [(item['master'], item['number']) for item in by_snapshot] == keys
+            if not limit:
+                assert expected_count == len(keys)
+            elif by_cypher:
+                # Курсор проходит те же преобразования, что и в ответе API
+                keys = announcement_keys(sort)
+                descending = params.get('descending', False)
+                after = decode_cursor(encode_cursor(sort, descending, by_cypher[-1], keys),
+                                      sort, descending, keys)
+                db.snapshot = snapshot
+                next_by_snapshot = db.get_announcements(after=after, **params)
+                db.snapshot = None
+                next_by_cypher = db.get_announcements(after=after, **params)
+                assert ([(item['master'], item['number']) for item in next_by_snapshot] ==
+                        [(item['master'], item['number']) for item in next_by_cypher])
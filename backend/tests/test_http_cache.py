@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta, timezone
+
+from neo4j.time import DateTime
+
+from utils.http_cache import is_not_modified, set_validators, validators
+
+
+MAY = datetime(2024, 5, 1, 10, 0, 0, 500000, tzinfo=timezone.utc)
+
+
+def test_etag_depends_on_version_and_variant():
+    etag, _ = validators([1, 2])
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert validators([1, 2])[0] == etag
+    assert validators([1, 3])[0] != etag
+    assert validators([1, 2], b'limit=5')[0] != etag
+
+
+def test_last_modified_is_latest_time_in_utc():
+    moscow = timezone(timedelta(hours=3))
+    version = [3, [MAY, None], DateTime(2024, 5, 2, 12, 0, 0, tzinfo=moscow), datetime(2024, 4, 1)]
+    _, last_modified = validators(version)
+    assert last_modified == datetime(2024, 5, 2, 9, 0, tzinfo=timezone.utc)
+    assert validators([1, 2])[1] is None
+
+
+def test_if_none_match():
+    etag, last_modified = validators([1])
+    strong = etag[2:]
+    assert is_not_modified({'If-None-Match': etag}, etag, last_modified)
+    assert is_not_modified({'If-None-Match': f'"other", {strong}'}, etag, last_modified)
+    assert is_not_modified({'If-None-Match': '*'}, etag, last_modified)
+    assert not is_not_modified({'If-None-Match': '"other"'}, etag, last_modified)
+    # If-None-Match важнее If-Modified-Since
+    assert not is_not_modified({'If-None-Match': '"other"',
+                                'If-Modified-Since': 'Thu, 01 Jan 2099 00:00:00 GMT'}, etag, MAY)
+
+
+def test_if_modified_since_has_second_precision():
+    etag = validators([1])[0]
+    assert is_not_modified({'If-Modified-Since': 'Wed, 01 May 2024 10:00:00 GMT'}, etag, MAY)
+    assert not is_not_modified({'If-Modified-Since': 'Wed, 01 May 2024 09:59:59 GMT'}, etag, MAY)
+    assert not is_not_modified({'If-Modified-Since': 'вчера'}, etag, MAY)
+    assert not is_not_modified({'If-Modified-Since': 'Wed, 01 May 2024 10:00:00 GMT'}, etag, None)
+    assert not is_not_modified({}, etag, MAY)
+
+
+def test_set_validators():
+    headers = {}
+    set_validators(headers, 'W/"x"', MAY)
+    assert headers == {
+        'ETag': 'W/"x"', 'Last-Modified': 'Wed, 01 May 2024 10:00:00 GMT', 'Cache-Control': 'no-cache'
+    }
+    headers = {}
+    set_validators(headers, 'W/"x"', None)
+    assert 'Last-Modified' not in headers
@@ -0,0 +1,55 @@
+import pytest
+
+from utils.pagination import (
+    announcement_keys, decode_cursor, encode_cursor, keyset_condition, order_by
+)
+
+
+ITEM = {
+    'price': 10.5, 'created_at': '2024-05-01T10:00:00.000000000+00:00',
+    'master': 'seller', 'number': 3, 'name': 'Доска'
+}
+
+
+def test_keys_end_with_tie_breakers():
+    assert [key for key, _ in announcement_keys('price')] == ['price', 'created_at', 'master', 'number']
+    assert [key for key, _ in announcement_keys('created_at')] == ['created_at', 'master', 'number']
+    assert announcement_keys('relevance')[0] == ('score', 'score')
+
+
+def test_cursor_round_trip():
+    keys = announcement_keys('price')
+    cursor = encode_cursor('price', True, ITEM, keys)
+    assert decode_cursor(cursor, 'price', True, keys) == {
+        'price': 10.5, 'created_at': ITEM['created_at'], 'master': 'seller', 'number': 3
+    }
+
+
+def test_cursor_for_other_sort_is_rejected():
+    keys = announcement_keys('price')
+    cursor = encode_cursor('price', False, ITEM, keys)
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 'price', True, keys)
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 'weight', False, announcement_keys('weight'))
+
+
+@pytest.mark.parametrize('cursor', ['', '!!!', 'bm90IGpzb24', 'WzFd', 'eyJzb3J0IjoicHJpY2UiLCJkZXNjIjpmYWxzZX0'])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 'price', False, announcement_keys('price'))
+
+
+def test_keyset_condition():
+    keys = [('price', 'a.price'), ('created_at', 'a.created_at')]
+    assert keyset_condition(keys) == (
+        '((a.price > $after.price) OR '
+        '(a.price = $after.price AND a.created_at > datetime($after.created_at)))'
+    )
+    assert '<' in keyset_condition(keys, descending=True)
+
+
+def test_order_by():
+    keys = [('price', 'a.price'), ('number', 'c.number')]
+    assert order_by(keys) == 'ORDER BY a.price, c.number'
+    assert order_by(keys, descending=True) == 'ORDER BY a.price DESC, c.number DESC'
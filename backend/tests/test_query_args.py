@@ -0,0 +1,114 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from utils.query_args import (
+    MAX_BATCH_SIZE, MAX_PAGE_SIZE, page_headers, parse_announcement_args,
+    parse_announcement_expand, parse_batch_announcement_keys, parse_batch_logins,
+    parse_facet_args, parse_point
+)
+
+
+def parse(**args):
+    return parse_announcement_args(MultiDict(args))
+
+
+def test_defaults():
+    query = parse()
+    assert query['sort'] == 'created_at' and not query['descending']
+    assert query['limit'] == 0 and query['after'] is None and query['expand'] == ()
+    assert query['filters']['price_min'] == .0 and query['filters']['amount_max'] == 0
+    assert query['filters']['q'] == '' and query['filters']['near'] is None
+
+
+def test_filters_are_converted():
+    filters = parse(price_min='10', amount_max='3', name='Доска')['filters']
+    assert filters['price_min'] == 10.0 and filters['amount_max'] == 3 and filters['name'] == 'Доска'
+    with pytest.raises(ValueError):
+        parse(price_min='дорого')
+
+
+def test_default_sort_follows_search():
+    query = parse(q=' доска ')
+    assert query['filters']['q'] == 'доска'
+    assert query['sort'] == 'relevance' and query['descending']
+    query = parse(near='55.75,37.62', radius_km='5')
+    assert query['sort'] == 'distance' and not query['descending']
+    assert query['filters']['near'] == {'latitude': 55.75, 'longitude': 37.62}
+
+
+@pytest.mark.parametrize('args', [
+    {'sort': 'name'},
+    {'sort': 'relevance'},
+    {'sort': 'distance'},
+    {'order': 'up'},
+    {'limit': '-1'},
+    {'limit': str(MAX_PAGE_SIZE + 1)},
+    {'limit': 'много'},
+    {'radius_km': '5'},
+    {'near': '55.75,37.62', 'radius_km': '-1'},
+    {'expand': 'feedback'},
+    {'cursor': 'мусор'},
+])
+def test_invalid_args(args):
+    with pytest.raises(ValueError):
+        parse(**args)
+
+
+def test_cursor_from_page_headers():
+    query = parse(sort='price', order='desc', limit='2')
+    page = [
+        {'price': 20.0, 'created_at': '2024-05-02', 'master': 'b', 'number': 1},
+        {'price': 10.0, 'created_at': '2024-05-01', 'master': 'a', 'number': 2},
+    ]
+    cursor = page_headers(query, page)['X-Next-Cursor']
+    assert parse(sort='price', order='desc', limit='2', cursor=cursor)['after'] == page[-1]
+    with pytest.raises(ValueError):
+        parse(sort='price', limit='2', cursor=cursor)
+    # Неполная страница - последняя
+    assert page_headers(query, page[:1]) == {}
+    assert page_headers(parse(), page) == {}
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('', None),
+    ('0,0', {'latitude': 0.0, 'longitude': 0.0}),
+    ('-90,180', {'latitude': -90.0, 'longitude': 180.0}),
+])
+def test_parse_point(value, expected):
+    assert parse_point(value) == expected
+
+
+@pytest.mark.parametrize('value', ['55.75', '55.75,37.62,1', 'a,b', '91,0', '0,-181'])
+def test_parse_point_invalid(value):
+    with pytest.raises(ValueError):
+        parse_point(value)
+
+
+def test_announcement_expand():
+    args = parse_announcement_expand(MultiDict({'expand': 'feedback, master,feedback'}))
+    assert args['expand'] == ('feedback', 'master')
+    assert parse_announcement_expand(MultiDict())['feedback_offset'] == 0
+    for bad in ({'expand': 'owner'}, {'feedback_limit': '101'}, {'feedback_offset': '-1'},
+                {'feedback_limit': 'x'}):
+        with pytest.raises(ValueError):
+            parse_announcement_expand(MultiDict(bad))
+
+
+def test_batch_keys():
+    args = MultiDict([('id', 'ivan/1'), ('id', 'a/b/20'), ('login', 'ivan')])
+    assert parse_batch_announcement_keys(args) == [('ivan', 1), ('a/b', 20)]
+    assert parse_batch_logins(args) == ['ivan']
+    for ids in (['ivan'], ['/1'], ['ivan/x'], ['ivan/-1']):
+        with pytest.raises(ValueError):
+            parse_batch_announcement_keys(MultiDict([('id', id) for id in ids]))
+    with pytest.raises(ValueError):
+        parse_batch_logins(MultiDict())
+    with pytest.raises(ValueError):
+        parse_batch_logins(MultiDict([('login', 'u')] * (MAX_BATCH_SIZE + 1)))
+
+
+def test_facet_buckets():
+    assert parse_facet_args(MultiDict({'buckets': '5'}))['buckets'] == 5
+    for buckets in ('0', '51', 'x'):
+        with pytest.raises(ValueError):
+            parse_facet_args(MultiDict({'buckets': buckets}))
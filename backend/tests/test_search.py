@@ -0,0 +1,22 @@
+from utils.search import fulltext_query
+
+
+def test_words_are_exact_prefix_and_fuzzy():
+    assert fulltext_query('Опилки') == '(опилки OR опилки* OR опилки~)'
+
+
+def test_short_words_are_not_fuzzy():
+    assert fulltext_query('дуб') == '(дуб OR дуб*)'
+
+
+def test_all_words_are_required():
+    assert fulltext_query('сухая доска') == '(сухая OR сухая* OR сухая~) AND (доска OR доска* OR доска~)'
+
+
+def test_lucene_syntax_is_escaped():
+    assert fulltext_query('a+b', fuzzy=False) == r'(a\+b OR a\+b*)'
+    assert fulltext_query('(x)', prefix=False, fuzzy=False) == r'(\(x\))'
+
+
+def test_text_without_words():
+    assert fulltext_query('   ') == ''
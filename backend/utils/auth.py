@@ -0,0 +1,242 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+# Параметры scrypt: около 16 МБ памяти и десятков миллисекунд на пароль
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+# Число потоков хэширования паролей и запросов, ожидающих в очереди к ним
+PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', min(4, os.cpu_count() or 1)))
+PASSWORD_QUEUE = int(os.environ.get('PASSWORD_QUEUE', 64))
+# Время жизни токена сессии в секундах
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 12 * 60 * 60))
+
+_PREFIX = 'scrypt'
+
+
+class PasswordPoolBusy(Exception):
+    '''Очередь хэширования паролей заполнена, запрос нужно повторить позже'''
+
+
+class _PasswordPool:
+    '''Ограниченный пул потоков для scrypt.
+
+    hashlib.scrypt освобождает GIL, поэтому потоки обработки запросов
+    не блокируются, а одновременно считается не больше PASSWORD_WORKERS
+    хэшей; сверх PASSWORD_QUEUE ожидающих запросов - PasswordPoolBusy
+    '''
+
+    def __init__(self, workers: int, queue: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+
+    def run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+
+_pool = _PasswordPool(PASSWORD_WORKERS, PASSWORD_QUEUE)
+
+
+def hash_password(password: str, salt: bytes = None) -> str:
+    '''Солёный хэш scrypt в виде scrypt$n$r$p$соль$хэш (считается в пуле).
+    salt - 16 байт соли, по умолчанию случайная; заданная нужна только
+    для воспроизводимых данных, например в генераторе бэкапов'''
+    if salt is None:
+        salt = secrets.token_bytes(16)
+    return _pool.run(_hash, password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def verify_password(password: str, stored: str) -> bool:
+    '''Проверка пароля по хэшу из hash_password (считается в пуле).
+
+    Пароли, сохранённые до появления хэшей открытым текстом, сравниваются
+    как есть; их нужно перехэшировать (см. needs_rehash). stored=None
+    (пользователя нет) проверяется по фиктивному хэшу, чтобы время ответа
+    не выдавало существование логина
+    '''
+    if stored is None:
+        _pool.run(_hash, password, b'\0' * 16, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return False
+    parts = stored.split('$')
+    if len(parts) != 6 or parts[0] != _PREFIX:
+        return hmac.compare_digest(password.encode(), stored.encode())
+    _, n, r, p, salt, _ = parts
+    expected = _pool.run(_hash, password, _b64decode(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(expected.encode(), stored.encode())
+
+
+def needs_rehash(stored: str) -> bool:
+    '''Хранится ли пароль открытым текстом или с устаревшими параметрами'''
+    return not stored.startswith(f'{_PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$')
+
+
+def _hash(password: str, salt: bytes, n: int, r: int, p: int) -> str:
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                            maxmem=256 * n * r, dklen=32)
+    return f'{_PREFIX}${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}'
+
+
+class RevocationList:
+    '''Отозванные токены сессий и заблокированные пользователи.
+
+    Пользователю запоминается время отзыва: недействительны все его токены,
+    выданные не позже. Отдельный токен отзывается по идентификатору jti.
+    Записи старше SESSION_TTL удаляются, так как их токены истекли.
+    Множество заблокированных логинов нужно запросам без токена
+    и проверяется без обращения к БД.
+
+    Список хранится в памяти процесса: выход и блокировка в одном процессе
+    не видны другим, пока они не перезапущены. При нескольких процессах
+    нужен общий список (например, в Redis) с теми же методами
+    '''
+
+    def __init__(self, ttl: int = SESSION_TTL):
+        self.ttl = ttl
+        self._users = {}
+        self._tokens = {}
+        self._blocked = set()
+        self._lock = threading.Lock()
+
+
+    def revoke_user(self, login: str) -> None:
+        '''Отзыв всех выданных пользователю токенов'''
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            self._users[login] = now
+
+
+    def revoke_token(self, jti: str, expires_at: float) -> None:
+        '''Отзыв одного токена до его истечения'''
+        with self._lock:
+            self._prune(time.time())
+            self._tokens[jti] = expires_at
+
+
+    def set_blocked(self, login: str, blocked: bool) -> None:
+        '''Блокировка пользователя для запросов без токена; при блокировке
+        его токены отзываются'''
+        if blocked:
+            self.revoke_user(login)
+        with self._lock:
+            if blocked:
+                self._blocked.add(login)
+            else:
+                self._blocked.discard(login)
+
+
+    def reset_blocked(self, logins) -> None:
+        '''Замена множества заблокированных пользователей, например после
+        запуска или загрузки бэкапа; их токены отзываются'''
+        logins = set(logins)
+        for login in logins:
+            self.revoke_user(login)
+        with self._lock:
+            self._blocked = logins
+
+
+    def is_blocked(self, login: str) -> bool:
+        return isinstance(login, str) and login in self._blocked
+
+
+    def is_revoked(self, claims: dict) -> bool:
+        revoked_at = self._users.get(claims['sub'])
+        return ((revoked_at is not None and claims['iat'] <= revoked_at) or
+                claims['jti'] in self._tokens)
+
+
+    def _prune(self, now: float) -> None:
+        self._users = {login: at for login, at in self._users.items() if at > now - self.ttl}
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+
+
+class SessionTokens:
+    '''Подписанные HMAC-SHA256 токены сессий.
+
+    Токен содержит логин (sub), роль, время выдачи и истечения и jti,
+    поэтому проверка не обращается к базе данных: подпись, срок
+    и словари RevocationList. Ключ берётся из SESSION_SECRET.
+
+    Без SESSION_SECRET ключ случаен в каждом процессе, поэтому при
+    WEB_CONCURRENCY > 1 (несколько процессов сервера) запуск прерывается:
+    токен одного процесса был бы недействителен в другом
+    '''
+
+    def __init__(self, revocations: RevocationList, secret: bytes = None, ttl: int = SESSION_TTL):
+        workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+        if secret is None:
+            secret = os.environ.get('SESSION_SECRET', '').encode()
+        if not secret:
+            if workers > 1:
+                raise RuntimeError('SESSION_SECRET обязателен при WEB_CONCURRENCY > 1')
+            logger.warning('SESSION_SECRET не задан: токены действуют до перезапуска процесса')
+            secret = secrets.token_bytes(32)
+        if workers > 1:
+            logger.warning('Выход и блокировка пользователей отзывают сессии только '
+                           'в своём процессе: список отзыва хранится в памяти')
+        self._secret = secret
+        self.revocations = revocations
+        self.ttl = ttl
+
+
+    def issue(self, user: dict) -> dict:
+        '''Новый токен для пользователя: поля token и expires_at (Unix-время)'''
+        now = time.time()
+        claims = {
+            'sub': user['login'], 'role': user.get('role', ''),
+            'iat': now, 'exp': now + self.ttl, 'jti': uuid.uuid4().hex
+        }
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+        return {'token': f'{payload}.{self._sign(payload)}', 'expires_at': int(claims['exp'])}
+
+
+    def validate(self, token: str) -> dict:
+        '''Данные токена или None, если он подделан, истёк или отозван'''
+        payload, _, signature = token.partition('.')
+        if not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+        except (ValueError, UnicodeDecodeError):
+            return None
+        if claims['exp'] <= time.time() or self.revocations.is_revoked(claims):
+            return None
+        return claims
+
+
+    def revoke(self, claims: dict) -> None:
+        '''Выход из сессии: отзыв токена с данными claims'''
+        self.revocations.revoke_token(claims['jti'], claims['exp'])
+
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._secret, payload.encode(), hashlib.sha256).digest())
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
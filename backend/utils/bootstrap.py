@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, AuthError
+
+from .db_backup import DatabaseImporter
+from .db_manager import DatabaseManager
+from .db_schema import DatabaseSchema
+
+
+logger = logging.getLogger(__name__)
+
+# Однократные миграции данных - методы DatabaseManager в порядке выполнения.
+# Число выполненных хранится в узле SchemaVersion, поэтому при следующих
+# запусках они не выполняются; новая миграция добавляется в конец
+MIGRATIONS = (
+    'ensure_zoned_timestamps',        # даты с часовым поясом
+    'ensure_user_ratings',            # агрегаты оценок пользователей
+    'ensure_feedback_uids',           # идентификаторы отзывов
+    'ensure_announcement_locations',  # координаты объявлений
+)
+
+
+def run_migrations(db: DatabaseManager, force: bool = False) -> int:
+    '''Выполнение миграций, ещё не выполненных в базе; force - всех,
+    например после загрузки бэкапа, данные которого могли быть созданы
+    до них. Возвращает число выполненных миграций'''
+    version = 0 if force else db.get_schema_version()
+    pending = MIGRATIONS[version:]
+    for name in pending:
+        logger.info('Миграция %s', name)
+        getattr(db, name)()
+    if pending:
+        db.set_schema_version(len(MIGRATIONS))
+    return len(pending)
+
+
+class Startup:
+    '''Подготовка базы данных при запуске сервера и время каждого этапа'''
+
+    def __init__(self, db: DatabaseManager, schema: DatabaseSchema, seed_file: str = 'data.json'):
+        self.db = db
+        self.schema = schema
+        self.seed_file = seed_file
+        self.timings = {}
+        self.ready = False
+        # Текст ошибки, если запуск не удался
+        self.error = None
+        self._done = threading.Event()
+
+
+    def start(self) -> None:
+        '''Запуск run в фоновом потоке: сервер сразу отвечает на /api/ready/
+        (503 до готовности базы), ошибка запуска попадает в error'''
+        threading.Thread(target=self._run_logged, name='startup', daemon=True).start()
+
+
+    def wait(self, timeout: float = None) -> bool:
+        '''Ожидание окончания запуска, True - база готова'''
+        self._done.wait(timeout)
+        return self.ready
+
+
+    def run(self, timeout: float = None) -> dict:
+        '''Все этапы запуска, возвращает время этапов в секундах'''
+        if timeout is None:
+            timeout = float(os.environ.get('NEO4J_STARTUP_TIMEOUT', 120))
+        try:
+            self._run_phases(timeout)
+        except Exception as error:
+            self.error = f'{type(error).__name__}: {error}'
+            raise
+        finally:
+            self._done.set()
+        return self.timings
+
+
+    def _run_phases(self, timeout: float) -> None:
+        with self._phase('total'):
+            with self._phase('connect'):
+                self.wait_for_database(timeout)
+            with self._phase('schema'):
+                self.schema.apply()
+            with self._phase('seed'):
+                # Начальные данные загружаются только в пустую базу
+                if self.db.is_empty():
+                    DatabaseImporter().import_data(self.seed_file)
+            with self._phase('migrate'):
+                run_migrations(self.db)
+            with self._phase('sessions'):
+                self.db.revoke_inactive_sessions()
+            with self._phase('snapshot'):
+                self.db.load_snapshot()
+        self.ready = True
+
+
+    def _run_logged(self) -> None:
+        try:
+            self.run()
+        except Exception:
+            logger.exception('Запуск не удался')
+
+
+    def wait_for_database(self, timeout: float) -> None:
+        '''Ожидание доступности Neo4j с экспоненциальной задержкой между попытками'''
+        deadline = time.monotonic() + timeout
+        delay = 0.5
+        attempt = 1
+        while True:
+            try:
+                self.db.driver.verify_connectivity()
+                return
+            except AuthError:
+                # Неверные учётные данные не исправятся повторными попытками
+                raise
+            except (ServiceUnavailable, SessionExpired, OSError) as error:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise
+                logger.warning('Neo4j недоступен (попытка %d): %s', attempt, error)
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 10)
+                attempt += 1
+
+
+    @contextmanager
+    def _phase(self, name: str):
+        '''Замер времени этапа запуска'''
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - started, 3)
+            logger.info('Запуск: этап %s за %.3f с', name, self.timings[name])
@@ -0,0 +1,134 @@
+import abc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class Cache(abc.ABC):
+    '''Интерфейс кэша для чтения DatabaseManager.
+
+    Общий кэш (например, Redis) должен реализовать те же методы.
+    Значения хранятся как есть, поэтому их нельзя изменять после записи
+    '''
+
+    @abc.abstractmethod
+    def get(self, key):
+        '''Значение по ключу или None, если его нет'''
+
+
+    @abc.abstractmethod
+    def set(self, key, value) -> None:
+        '''Запись значения'''
+
+
+    @abc.abstractmethod
+    def delete(self, key) -> None:
+        '''Удаление значения, если оно есть'''
+
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        '''Удаление всех значений'''
+
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        '''Счётчики попаданий, промахов и вытеснений'''
+
+
+class NullCache(Cache):
+    '''Отключённый кэш: ничего не хранит'''
+
+    def __init__(self):
+        self.misses = 0
+
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+
+    def set(self, key, value) -> None:
+        pass
+
+
+    def delete(self, key) -> None:
+        pass
+
+
+    def clear(self) -> None:
+        pass
+
+
+    def stats(self) -> dict:
+        return {'size': 0, 'hits': 0, 'misses': self.misses, 'evictions': 0}
+
+
+class LRUCache(Cache):
+    '''Кэш в памяти процесса с вытеснением давно не используемых значений
+    и ограничением времени жизни записи'''
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                self.evictions += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def default_cache() -> Cache:
+    '''Кэш по переменным окружения CACHE_MAX_SIZE и CACHE_TTL (0 - отключён)'''
+    max_size = int(os.environ.get('CACHE_MAX_SIZE', 10000))
+    ttl = float(os.environ.get('CACHE_TTL', 60))
+    if max_size <= 0 or ttl <= 0:
+        return NullCache()
+    return LRUCache(max_size, ttl)
@@ -0,0 +1,298 @@
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+# Числовые поля объявлений, хранящиеся в снимке столбцами
+SNAPSHOT_FIELDS = ('width', 'height', 'length', 'weight', 'amount', 'price')
+# Сортировки, которые снимок выполняет сам (остальные - в Neo4j)
+SNAPSHOT_SORTS = ('created_at', 'price', 'weight')
+# Время создания в микросекундах Unix для сортировки и курсоров;
+# время без пояса считается UTC, как в datetime({datetime: ...})
+CREATED_US = '''datetime({datetime: a.created_at}).epochSeconds * 1000000
+        + datetime({datetime: a.created_at}).microsecond'''
+# Строка снимка для объявления a мастера u со связью c
+SNAPSHOT_ROW = f'''{{
+        login: u.login, number: c.number, full_name: u.full_name,
+        name: a.name, address: a.address,
+        {', '.join(f'{field}: a.{field}' for field in SNAPSHOT_FIELDS)},
+        created_us: {CREATED_US}
+    }}'''
+
+_NO_TIME = -2 ** 63
+
+
+class CatalogueSnapshot:
+    '''Столбцовый снимок каталога в памяти процесса для фильтрации диапазонами.
+
+    Числовые поля, время создания, номер и код мастера хранятся массивами
+    NumPy, поэтому фильтры списка объявлений считаются векторными масками,
+    а Neo4j получает только ключи найденной страницы. Названия, адреса
+    и имена мастеров хранятся в нижнем регистре, подстроки в них ищутся
+    только среди строк, прошедших числовые фильтры.
+
+    Снимок обновляется методами upsert, remove и rename_master при записи
+    через DatabaseManager этого процесса и заново строится load после
+    загрузки бэкапа. Изменения, сделанные в обход процесса, он не видит
+    '''
+
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._reset(capacity)
+        self.loaded = False
+        self.answered = 0
+
+
+    def _reset(self, capacity: int) -> None:
+        self._size = 0
+        self._columns = {field: np.full(capacity, np.nan) for field in SNAPSHOT_FIELDS}
+        self._created = np.full(capacity, _NO_TIME, dtype=np.int64)
+        self._number = np.zeros(capacity, dtype=np.int64)
+        self._master = np.zeros(capacity, dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._has_name = np.zeros(capacity, dtype=bool)
+        self._has_address = np.zeros(capacity, dtype=bool)
+        self._names = []
+        self._addresses = []
+        # Мастера: код -> логин и имя, логин -> код
+        self._logins = []
+        self._full_names = []
+        self._codes = {}
+        self._rows = {}
+
+
+    def load(self, rows) -> None:
+        '''Построение снимка заново из строк SNAPSHOT_ROW'''
+        with self._lock:
+            self._reset(1024)
+            for row in rows:
+                self._upsert(row)
+            self.loaded = True
+        logger.info('Снимок каталога: %d объявлений', len(self._rows))
+
+
+    def upsert(self, row: dict) -> None:
+        '''Добавление или замена объявления по строке SNAPSHOT_ROW.
+        created_us=None сохраняет прежнее время создания'''
+        with self._lock:
+            self._upsert(row)
+
+
+    def remove(self, login: str, number: int) -> None:
+        '''Удаление объявления из снимка'''
+        with self._lock:
+            index = self._rows.pop((login, number), None)
+            if index is not None:
+                self._alive[index] = False
+            if self._size > 1024 and len(self._rows) < self._size // 2:
+                self._compact()
+
+
+    def rename_master(self, login: str, full_name: str) -> None:
+        '''Новое имя мастера для фильтра master'''
+        with self._lock:
+            code = self._codes.get(login)
+            if code is not None:
+                self._full_names[code] = _lower(full_name)
+
+
+    def can_answer(self, params: dict) -> bool:
+        '''Может ли снимок выполнить запрос get_announcements: без
+        полнотекстового и геопоиска и с сортировкой из SNAPSHOT_SORTS'''
+        return (self.loaded and not params.get('q') and params.get('near') is None and
+                params.get('sort', 'created_at') in SNAPSHOT_SORTS)
+
+
+    def count(self, params: dict) -> int:
+        '''Количество объявлений, подходящих под фильтры'''
+        with self._lock:
+            self.answered += 1
+            return int(np.count_nonzero(self._mask(params)))
+
+
+    def query(self, params: dict) -> list:
+        '''Пары (логин мастера, номер) страницы списка объявлений в порядке
+        сортировки; параметры как у get_announcements'''
+        with self._lock:
+            self.answered += 1
+            indexes = np.flatnonzero(self._mask(params))
+            sort = params.get('sort', 'created_at')
+            descending = params.get('descending', False)
+            created = self._created[indexes]
+            primary = created if sort == 'created_at' else self._columns[sort][indexes]
+            if params.get('after') is not None:
+                keep = self._after(indexes, primary, created, sort, params['after'], descending)
+                indexes, primary, created = indexes[keep], primary[keep], created[keep]
+            order = np.lexsort((created, primary))
+            if descending:
+                order = order[::-1]
+            limit = params.get('limit') or 0
+            if limit and len(order) > limit:
+                # Строки, равные последней по первым двум ключам, упорядочиваются
+                # по логину и номеру ниже, поэтому берутся все
+                last = order[limit - 1]
+                ties = np.flatnonzero((primary[order] == primary[last]) &
+                                      (created[order] == created[last]))
+                order = order[:max(limit, ties[-1] + 1)]
+            page = sorted(
+                ((primary[i], created[i], self._logins[self._master[indexes[i]]],
+                  int(self._number[indexes[i]])) for i in order),
+                reverse=descending
+            )
+            if limit:
+                page = page[:limit]
+            return [(login, number) for _, _, login, number in page]
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'rows': len(self._rows), 'capacity': len(self._alive),
+                    'answered': self.answered, 'loaded': self.loaded}
+
+
+    def _upsert(self, row: dict) -> None:
+        key = (row['login'], row['number'])
+        index = self._rows.get(key)
+        if index is None:
+            if row.get('created_us') is None:
+                return
+            index = self._size
+            if index == len(self._alive):
+                self._grow()
+            self._size += 1
+            self._rows[key] = index
+            self._names.append(None)
+            self._addresses.append(None)
+        code = self._codes.get(row['login'])
+        if code is None:
+            code = self._codes[row['login']] = len(self._logins)
+            self._logins.append(row['login'])
+            self._full_names.append(None)
+        if 'full_name' in row:
+            self._full_names[code] = _lower(row['full_name'])
+        for field in SNAPSHOT_FIELDS:
+            value = row.get(field)
+            self._columns[field][index] = np.nan if value is None else value
+        if row.get('created_us') is not None:
+            self._created[index] = row['created_us']
+        self._number[index] = row['number']
+        self._master[index] = code
+        self._alive[index] = True
+        self._names[index] = _lower(row.get('name'))
+        self._addresses[index] = _lower(row.get('address'))
+        self._has_name[index] = self._names[index] is not None
+        self._has_address[index] = self._addresses[index] is not None
+
+
+    def _grow(self) -> None:
+        '''Удвоение ёмкости массивов'''
+        def grown(array, fill):
+            extra = np.full(len(array), fill, dtype=array.dtype)
+            return np.concatenate((array, extra))
+        for field in SNAPSHOT_FIELDS:
+            self._columns[field] = grown(self._columns[field], np.nan)
+        self._created = grown(self._created, _NO_TIME)
+        self._number = grown(self._number, 0)
+        self._master = grown(self._master, 0)
+        self._alive = grown(self._alive, False)
+        self._has_name = grown(self._has_name, False)
+        self._has_address = grown(self._has_address, False)
+
+
+    def _compact(self) -> None:
+        '''Удаление строк удалённых объявлений, когда их больше половины'''
+        live = np.flatnonzero(self._alive[:self._size])
+        for field in SNAPSHOT_FIELDS:
+            self._columns[field] = self._columns[field][live]
+        self._created = self._created[live]
+        self._number = self._number[live]
+        self._master = self._master[live]
+        self._alive = self._alive[live]
+        self._has_name = self._has_name[live]
+        self._has_address = self._has_address[live]
+        self._names = [self._names[i] for i in live]
+        self._addresses = [self._addresses[i] for i in live]
+        self._size = len(live)
+        self._rows = {
+            (self._logins[self._master[i]], int(self._number[i])): i for i in range(self._size)
+        }
+
+
+    def _mask(self, params: dict):
+        '''Маска строк, подходящих под фильтры, с той же семантикой, что
+        _announcement_filter: отсутствующее значение не проходит фильтр'''
+        size = self._size
+        mask = self._alive[:size].copy()
+        for field in SNAPSHOT_FIELDS:
+            column = self._columns[field][:size]
+            mask &= column >= params.get(f'{field}_min', 0)
+            maximum = params.get(f'{field}_max', 0)
+            if maximum != 0:
+                mask &= column <= maximum
+        mask &= self._has_name[:size] & self._has_address[:size]
+        master = (params.get('master') or '').lower()
+        codes = [code for code, name in enumerate(self._full_names)
+                 if name is not None and master in name]
+        mask &= np.isin(self._master[:size], codes)
+        for values, needle in ((self._names, params.get('name')),
+                               (self._addresses, params.get('address'))):
+            if needle:
+                needle = needle.lower()
+                indexes = np.flatnonzero(mask)
+                mask[indexes] = [needle in values[i] for i in indexes]
+        return mask
+
+
+    def _after(self, indexes, primary, created, sort: str, after: dict, descending: bool):
+        '''Маска строк строго после курсора в порядке сортировки'''
+        after_created = _micros(after['created_at'])
+        after_primary = after_created if sort == 'created_at' else after[sort]
+        if descending:
+            keep = (primary < after_primary) | ((primary == after_primary) & (created < after_created))
+        else:
+            keep = (primary > after_primary) | ((primary == after_primary) & (created > after_created))
+        ties = np.flatnonzero((primary == after_primary) & (created == after_created))
+        cursor = (after['master'], after['number'])
+        for i in ties:
+            key = (self._logins[self._master[indexes[i]]], int(self._number[indexes[i]]))
+            keep[i] = key < cursor if descending else key > cursor
+        return keep
+
+
+def default_snapshot() -> CatalogueSnapshot:
+    '''Снимок каталога, если CATALOGUE_SNAPSHOT=1 и установлен NumPy, иначе None'''
+    if os.environ.get('CATALOGUE_SNAPSHOT', '0') != '1':
+        return None
+    if np is None:
+        logger.warning('CATALOGUE_SNAPSHOT=1, но NumPy не установлен: снимок каталога отключён')
+        return None
+    return CatalogueSnapshot()
+
+
+def _lower(value):
+    return value.lower() if isinstance(value, str) else None
+
+
+def _micros(value) -> int:
+    '''Время создания из курсора в микросекундах Unix, как CREATED_US'''
+    if value is None:
+        return _NO_TIME
+    parsed = datetime.fromisoformat(value[:26] + value[29:] if _has_nanoseconds(value) else value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    delta = parsed - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _has_nanoseconds(value: str) -> bool:
+    '''Строка ISO 8601 с 9 знаками долей секунды, как у neo4j DateTime'''
+    dot = value.find('.', 19)
+    return dot == 19 and len(value) >= 29 and value[20:29].isdigit()
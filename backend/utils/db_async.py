@@ -0,0 +1,214 @@
+import asyncio
+
+from neo4j import AsyncGraphDatabase
+
+from .cache import Cache, NullCache
+from .db_main import driver_config
+from .instrumentation import InstrumentedAsyncDriver, instrument_methods
+from .db_manager import (
+    ANNOUNCEMENT_FILTERS, GEO_FILTERS, USER_QUERY, USERS_QUERY, ANNOUNCEMENT_QUERY,
+    ANNOUNCEMENTS_BY_KEY_QUERY, USER_FEEDBACK_QUERY, USER_VERSION_QUERY,
+    ANNOUNCEMENT_VERSION_QUERY, DATA_VERSION_QUERY, ANNOUNCEMENT_FEEDBACK_QUERY,
+    FEEDBACK_PAGE_SIZE, FACET_BUCKETS, announcements_query, count_announcements_query,
+    expanded_announcement_query, announcement_record, facets_query, facets_record,
+    facets_cache_key
+)
+
+
+# Асинхронный драйвер привязан к циклу событий, поэтому он один на процесс
+# и создаётся при запуске асинхронного сервера
+_async_driver = None
+
+
+def get_async_driver():
+    '''Общий асинхронный драйвер с параметрами из переменных окружения'''
+    global _async_driver
+    if _async_driver is None:
+        config = driver_config()
+        uri, user, password = config.pop('uri'), config.pop('user'), config.pop('password')
+        _async_driver = InstrumentedAsyncDriver(
+            AsyncGraphDatabase.driver(uri, auth=(user, password), **config)
+        )
+    return _async_driver
+
+
+async def close_async_driver() -> None:
+    '''Закрытие асинхронного драйвера при остановке сервера'''
+    global _async_driver
+    if _async_driver is not None:
+        await _async_driver.close()
+        _async_driver = None
+
+
+async def _fetch(tx, query: str, params: dict) -> list:
+    result = await tx.run(query, params)
+    return await result.data()
+
+
+@instrument_methods
+class AsyncDatabaseManager:
+    '''Асинхронный вариант чтения DatabaseManager на AsyncGraphDatabase.
+
+    Независимые запросы одного обращения выполняются одновременно
+    в отдельных сессиях
+    '''
+
+    def __init__(self, driver=None, cache: Cache = None):
+        '''По умолчанию без кэша: записи идут через другой процесс и не могут
+        сбросить кэш этого, а устаревшее тело ответа получило бы новый ETag.
+        Кэш можно передать, только если его сбрасывает пишущий процесс (общий кэш)'''
+        self.driver = driver or get_async_driver()
+        self.cache = cache if cache is not None else NullCache()
+
+
+    async def _read(self, query: str, **params) -> list:
+        '''Выполнение запроса чтения в отдельной сессии'''
+        async with self.driver.session() as session:
+            return await session.execute_read(_fetch, query, params)
+
+
+    async def get_user(self, login: str) -> dict:
+        '''Получение пользователя по его логину'''
+        cached = self.cache.get(('user', login))
+        if cached is not None:
+            return dict(cached)
+        records = await self._read(USER_QUERY, login=login)
+        if not records:
+            return None
+        self.cache.set(('user', login), records[0]['u'])
+        return dict(records[0]['u'])
+
+
+    async def get_users(self, logins: list) -> dict:
+        '''Получение пользователей по списку логинов, как DatabaseManager.get_users'''
+        users = {}
+        missing = []
+        for login in dict.fromkeys(logins):
+            cached = self.cache.get(('user', login))
+            if cached is not None:
+                users[login] = dict(cached)
+            else:
+                users[login] = None
+                missing.append(login)
+        if missing:
+            for record in await self._read(USERS_QUERY, logins=missing):
+                user = record['u']
+                self.cache.set(('user', user['login']), user)
+                users[user['login']] = dict(user)
+        return users
+
+
+    async def get_user_version(self, login: str) -> list:
+        '''Версия пользователя для заголовков ETag, как у DatabaseManager'''
+        records = await self._read(USER_VERSION_QUERY, login=login)
+        return records[0]['version'] if records else None
+
+
+    async def get_announcement_version(self, login: str, number: int) -> list:
+        '''Версия объявления для заголовков ETag, как у DatabaseManager'''
+        records = await self._read(ANNOUNCEMENT_VERSION_QUERY, login=login, number=number)
+        return records[0]['version'] if records else None
+
+
+    async def get_data_version(self) -> list:
+        '''Версия всех данных для списков, как у DatabaseManager'''
+        records = await self._read(DATA_VERSION_QUERY)
+        return records[0]['version']
+
+
+    async def user_exists(self, login: str) -> bool:
+        '''Проверка, существуют ли пользователь с заданным логином'''
+        return await self.get_user(login) is not None
+
+
+    async def get_announcement(self, login: str, number: int, expand: tuple = (),
+            feedback_limit: int = FEEDBACK_PAGE_SIZE, feedback_offset: int = 0) -> dict:
+        '''Получение объявления по мастеру и номеру, expand как у DatabaseManager'''
+        if expand:
+            records = await self._read(
+                expanded_announcement_query(expand), login=login, number=number,
+                feedback_limit=feedback_limit, feedback_offset=feedback_offset
+            )
+            return announcement_record(records[0]) if records else None
+        cached = self.cache.get(('announcement', login, number))
+        if cached is not None:
+            return dict(cached)
+        records = await self._read(ANNOUNCEMENT_QUERY, login=login, number=number)
+        if not records:
+            return None
+        announcement = {**records[0]['a'], 'master': records[0]['master']}
+        self.cache.set(('announcement', login, number), announcement)
+        return dict(announcement)
+
+
+    async def get_announcements_by_key(self, keys: list) -> dict:
+        '''Получение объявлений по парам (логин мастера, номер),
+        как DatabaseManager.get_announcements_by_key'''
+        announcements = {}
+        missing = []
+        for login, number in dict.fromkeys(keys):
+            cached = self.cache.get(('announcement', login, number))
+            if cached is not None:
+                announcements[(login, number)] = dict(cached)
+            else:
+                announcements[(login, number)] = None
+                missing.append({'login': login, 'number': number})
+        if missing:
+            for record in await self._read(ANNOUNCEMENTS_BY_KEY_QUERY, keys=missing):
+                key = (record['master'], record['number'])
+                announcement = {**record['a'], 'master': record['master']}
+                self.cache.set(('announcement', *key), announcement)
+                announcements[key] = dict(announcement)
+        return announcements
+
+
+    async def get_announcements(self,
+            sort: str = 'created_at', descending: bool = False,
+            limit: int = 0, after: dict = None, **filters
+    ) -> list:
+        '''Получение списка объявлений, параметры как у DatabaseManager.get_announcements'''
+        params = {**ANNOUNCEMENT_FILTERS, **GEO_FILTERS, 'q': '', **filters,
+                  'sort': sort, 'descending': descending, 'limit': limit, 'after': after}
+        query = announcements_query(params)
+        records = await self._read(query, **params)
+        return [announcement_record(record) for record in records]
+
+
+    async def count_announcements(self, **filters) -> int:
+        '''Количество объявлений, подходящих под фильтры get_announcements'''
+        params = {**ANNOUNCEMENT_FILTERS, **GEO_FILTERS, **filters}
+        query = count_announcements_query(params)
+        records = await self._read(query, **params)
+        return records[0]['total']
+
+
+    async def get_facets(self, buckets: int = FACET_BUCKETS, **filters) -> dict:
+        '''Фасеты каталога, как DatabaseManager.get_facets'''
+        key = facets_cache_key(filters, buckets)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        params = {**ANNOUNCEMENT_FILTERS, **GEO_FILTERS, **filters, 'buckets': buckets}
+        query = facets_query(params)
+        records = await self._read(query, **params)
+        facets = facets_record(records[0], buckets)
+        self.cache.set(key, facets)
+        return facets
+
+
+    async def get_user_feedback(self, login: str) -> list:
+        '''Получение всех отзывов об определённом пользователе'''
+        exists, feedback = await asyncio.gather(
+            self.user_exists(login),
+            self._read(USER_FEEDBACK_QUERY, login=login)
+        )
+        return feedback if exists else None
+
+
+    async def get_announcement_feedback(self, login: str, number: int) -> list:
+        '''Получение всех отзывов об определённом объявлении'''
+        announcement, feedback = await asyncio.gather(
+            self.get_announcement(login, number),
+            self._read(ANNOUNCEMENT_FEEDBACK_QUERY, login=login, number=number)
+        )
+        return feedback if announcement is not None else None
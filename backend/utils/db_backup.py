@@ -1,12 +1,60 @@
+import gzip
 import json
+import logging
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from itertools import chain
+
+from neo4j import READ_ACCESS
 
 from .db_main import DatabaseConnection
-from .utils import convert, back_convert
+from .db_manager import REBUILD_RATINGS_QUERY
+from .instrumentation import record_summary
+from .json_stream import iter_json_items, iter_ndjson_items, iter_gzip
+from .utils import convert, back_convert, dumps
+
+
+logger = logging.getLogger(__name__)
+
+# Разделы инкрементального бэкапа в порядке применения
+INCREMENTAL_SECTIONS = ('tombstones', 'users', 'announcements', 'feedback')
+# Отметка о загрузке бэкапа: данные могли измениться целиком,
+# поэтому меняется версия данных для заголовков ETag списков
+RESTORE_MARKER_QUERY = "CREATE (:Tombstone {entity: 'restore', deleted_at: datetime()})"
+# Отставание границы until от времени сервера в секундах: транзакция,
+# которая началась раньше границы, но зафиксирована после чтения данных,
+# попадёт в следующий инкрементальный бэкап, если длилась не дольше
+WATERMARK_LAG = 60
+# Размер страницы при потоковом экспорте
+EXPORT_PAGE_SIZE = 5000
+# Узлы и отношения полного бэкапа. id - непрозрачный идентификатор
+# (elementId), нужный только для связи отношений с узлами внутри бэкапа
+NODES_QUERY = '''
+    MATCH (n)
+    RETURN elementId(n) AS id, labels(n) AS labels, properties(n) AS properties
+'''
+RELATIONSHIPS_QUERY = '''
+    MATCH (n)-[r]->(m)
+    RETURN elementId(r) AS id, type(r) AS type,
+        elementId(n) AS start_node, elementId(m) AS end_node,
+        properties(r) AS properties
+'''
+# Размер пакета при импорте, переопределяется параметром batch_size
+IMPORT_BATCH_SIZE = 5000
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
 
 
 class DatabaseExporter(DatabaseConnection):
     '''Создание бэкапа базы данных'''
 
+    def __init__(self, *args, page_size: int = EXPORT_PAGE_SIZE, **kwargs):
+        '''Инициализация с размером страницы потокового экспорта'''
+        super().__init__(*args, **kwargs)
+        self.page_size = page_size
+
+
     def export_data_to_json(self, output_file: str = 'neo4j_export.json') -> None:
         '''Экспорт БД в файл'''
         graph_data = convert(self.get_graph_data())
@@ -25,15 +73,15 @@ class DatabaseExporter(DatabaseConnection):
         # Получение всех узлов с их свойствами
         nodes_query = '''
             MATCH (n)
-            RETURN id(n) as id, labels(n) as labels, properties(n) as properties
+            RETURN elementId(n) as id, labels(n) as labels, properties(n) as properties
         '''
         nodes_result = tx.run(nodes_query)
         
         # Получение всех отношений
         rels_query = '''
             MATCH (n)-[r]->(m)
-            RETURN id(r) as rel_id, type(r) as type, 
-                id(n) as start_node, id(m) as end_node,
+            RETURN elementId(r) as rel_id, type(r) as type, 
+                elementId(n) as start_node, elementId(m) as end_node,
                 properties(r) as properties
         '''
         rels_result = tx.run(rels_query)
@@ -64,76 +112,760 @@ class DatabaseExporter(DatabaseConnection):
         }
 
 
+    def export_data_to_ndjson(self,
+            output_file: str = 'neo4j_export.ndjson',
+            compress: bool = False
+    ) -> None:
+        '''Потоковый экспорт БД в файл NDJSON, при compress - со сжатием gzip'''
+        if compress:
+            with open(output_file, 'wb') as f:
+                for chunk in iter_gzip(self.iter_ndjson()):
+                    f.write(chunk)
+        else:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                for chunk in self.iter_ndjson():
+                    f.write(chunk)
+
+
+    def iter_graph(self):
+        '''Пары (раздел, страница): все узлы ('nodes'), затем все отношения
+        ('relationships') из одной транзакции чтения (см. _iter_sections)'''
+        return self._iter_sections((('nodes', NODES_QUERY),
+                                    ('relationships', RELATIONSHIPS_QUERY)))
+
+
+    def _iter_sections(self, queries, **params):
+        '''Выполнение запросов (раздел, запрос) по очереди в одной транзакции
+        чтения. Возвращает пары (раздел, страница до page_size записей).
+
+        Записи передаются с сервера порциями по page_size (fetch_size), поэтому
+        в памяти находится не больше одной страницы, а каждый запрос проходит
+        по данным один раз. Neo4j читает с изоляцией read committed: запись,
+        зафиксированная во время обхода, может попасть в бэкап частично,
+        например отношение без созданного после обхода узлов конца. Такие
+        отношения при загрузке пропускаются
+        '''
+        with self.driver.session(default_access_mode=READ_ACCESS,
+                                 fetch_size=self.page_size) as session:
+            with session.begin_transaction() as tx:
+                for section, query in queries:
+                    result = tx.run(query, **params)
+                    page = []
+                    for record in result:
+                        page.append(record.data())
+                        if len(page) == self.page_size:
+                            yield section, page
+                            page = []
+                    if page:
+                        yield section, page
+                    record_summary(result.consume())
+
+
+    def get_watermark(self) -> str:
+        '''Граница изменений, попавших в бэкап: время сервера БД минус
+        WATERMARK_LAG. Изменения новее границы, уже попавшие в бэкап,
+        повторяются в следующем инкрементальном, их применение идемпотентно'''
+        with self.driver.session() as session:
+            until = session.execute_read(
+                lambda tx: tx.run(
+                    'RETURN datetime() - duration({seconds: $lag}) AS until',
+                    lag=WATERMARK_LAG
+                ).single()
+            )
+        return until['until'].iso_format()
+
+
+    def iter_ndjson(self):
+        '''Бэкап в формате NDJSON: по строке на узел или отношение.
+
+        Раздел записи хранится в поле section ('nodes' или 'relationships'),
+        узлы идут раньше отношений. Первая строка (раздел meta) содержит
+        границу until, от которой можно строить инкрементальные бэкапы.
+        Возвращает текст по странице за раз.
+        '''
+        meta = {'section': 'meta', 'kind': 'full', 'until': self.get_watermark()}
+        yield dumps(meta) + '\n'
+        for section, page in self.iter_graph():
+            yield ''.join(
+                dumps({'section': section, **item}) + '\n'
+                for item in page
+            )
+
+
+    def iter_incremental(self, since: str):
+        '''Инкрементальный бэкап NDJSON: изменения после границы since.
+
+        Содержит пользователей и объявления с updated_at, отзывы с created_at
+        в промежутке (since, until] и отметки об удалении (tombstones).
+        Сущности задаются естественными ключами: логином, логином мастера
+        и номером объявления, uid отзыва. Отметки идут первыми, чтобы
+        удалённое и созданное заново объявление с тем же номером
+        восстанавливалось правильно.
+        '''
+        until = self.get_watermark()
+        meta = {'section': 'meta', 'kind': 'incremental', 'since': since, 'until': until}
+        yield dumps(meta) + '\n'
+        sections = (
+            ('tombstones', '''
+                MATCH (t:Tombstone)
+                WHERE t.deleted_at > datetime($since) AND t.deleted_at <= datetime($until)
+                RETURN properties(t) AS properties
+            '''),
+            ('users', '''
+                MATCH (u:User)
+                WHERE u.updated_at > datetime($since) AND u.updated_at <= datetime($until)
+                RETURN properties(u) AS properties
+            '''),
+            ('announcements', '''
+                MATCH (u:User)-[c:Create]->(a:Announcement)
+                WHERE a.updated_at > datetime($since) AND a.updated_at <= datetime($until)
+                RETURN u.login AS master, c.number AS number,
+                    properties(a) AS properties
+            '''),
+            ('feedback', '''
+                MATCH (author:User)-[:Make]->(f:Feedback)-[ab:About]->(target)
+                WHERE f.created_at > datetime($since) AND f.created_at <= datetime($until)
+                OPTIONAL MATCH (m:User)-[c:Create]->(target:Announcement)
+                RETURN author.login AS author,
+                    CASE WHEN target:User THEN target.login END AS user,
+                    m.login AS master, c.number AS number,
+                    ab.estimation AS estimation, properties(f) AS properties
+            '''),
+        )
+        for section, page in self._iter_sections(sections, since=since, until=until):
+            yield ''.join(
+                dumps({'section': section, **item}) + '\n'
+                for item in page
+            )
+
+
+    def prune_tombstones(self, before: str) -> None:
+        '''Удаление отметок об удалении, попавших в полный бэкап с границей before'''
+        with self.driver.session() as session:
+            session.run(
+                '''MATCH (t:Tombstone) WHERE t.deleted_at <= datetime($before)
+                CALL { WITH t DELETE t } IN TRANSACTIONS OF 1000 ROWS''',
+                before=before
+            ).consume()
+
+
+    def iter_json(self):
+        '''Бэкап в формате get_graph_data, сериализуемый потоково по странице'''
+        yield '{"nodes": ['
+        current = 'nodes'
+        separator = ''
+        for section, page in self.iter_graph():
+            if section != current:
+                current = section
+                separator = ''
+                yield '], "relationships": ['
+            yield separator + ', '.join(
+                dumps(item) for item in page
+            )
+            separator = ', '
+        if current == 'nodes':
+            yield '], "relationships": ['
+        yield ']}'
+
+
 class DatabaseImporter(DatabaseConnection):
     '''Загрузка бэкапа базы данных'''
 
-    def import_data(self, input_file='neo4j_export.json'):
-        '''Импорт из файла данных для БД'''
-        with open(input_file, 'r', encoding='utf-8') as f:
-            graph_data = json.load(f)
-        self.set_graph_data(back_convert(graph_data))
-    
-    
+    def __init__(self, *args, batch_size: int = IMPORT_BATCH_SIZE, progress=None, **kwargs):
+        '''Инициализация с размером пакета и функцией отчёта о прогрессе.
+
+        progress вызывается как progress(stage, count, rate), где stage -
+        'nodes' или 'relationships', count - число записанных элементов,
+        rate - скорость записи в элементах в секунду
+        '''
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self.progress = progress or _log_progress
+
+
+    def import_data(self, input_file='neo4j_export.json', merge: bool = False) -> bool:
+        '''Импорт из файла данных для БД.
+
+        При merge=True текущие данные не удаляются заранее, а сопоставляются
+        с бэкапом (см. _merge_items)
+        '''
+        # Файл читается потоково дважды: сначала проверка, затем запись,
+        # чтобы некорректный бэкап не удалил текущие данные
+        keys = _MergeKeys() if merge else None
+        with _open_backup(input_file) as f:
+            if not self._check_items(_iter_backup(input_file, f), keys):
+                return False
+        with _open_backup(input_file) as f:
+            items = ((key, back_convert(item)) for key, item in _iter_backup(input_file, f))
+            if merge:
+                self._merge_items(items, keys)
+            else:
+                self._import_items(items)
+        return True
+
+
+    def _check_node(self, node) -> bool:
+        '''Проверка корректности узла'''
+        return (isinstance(node, dict) and 'id' in node and
+                'labels' in node and 'properties' in node and
+                all(_is_identifier(label) for label in node['labels']))
+
+
+    def _check_relationship(self, relationship) -> bool:
+        '''Проверка корректности отношения'''
+        return (isinstance(relationship, dict) and 'id' in relationship and
+                'properties' in relationship and 'type' in relationship and
+                'start_node' in relationship and 'end_node' in relationship and
+                _is_identifier(relationship['type']))
+
+
     def _check_data(self, data: dict) -> bool:
         '''Проверка корректности данных для импорта в БД'''
         nodes = data.get('nodes')
         relationships = data.get('relationships')
         if nodes is None or relationships is None:
             return False
-        for node in nodes:
-            if 'id' not in node or 'labels' not in node or 'properties' not in node:
+        return (all(self._check_node(node) for node in nodes) and
+                all(self._check_relationship(rel) for rel in relationships))
+
+
+    def _check_items(self, items, keys=None) -> bool:
+        '''Проверка корректности потока пар (раздел, элемент).
+
+        Если передан keys, в него попутно собираются естественные ключи узлов
+        '''
+        try:
+            for key, item in items:
+                if key == 'nodes' and not self._check_node(item):
+                    return False
+                if key == 'relationships' and not self._check_relationship(item):
+                    return False
+                if keys is not None:
+                    keys.add(key, item)
+        except ValueError:
+            # Повреждённый JSON
+            return False
+        return True
+
+
+    def read_meta(self, input_file: str) -> dict:
+        '''Первая строка бэкапа NDJSON с границами since и until или None'''
+        with _open_backup(input_file) as f:
+            try:
+                for key, item in _iter_backup(input_file, f):
+                    return item if key == 'meta' else None
+            except ValueError:
+                return None
+        return None
+
+
+    def import_incremental(self, input_file: str) -> bool:
+        '''Применение инкрементального бэкапа поверх текущих данных.
+
+        Сущности сопоставляются по естественным ключам, поэтому повторное
+        применение того же файла не создаёт дубликатов. Перед записью файл
+        целиком проверяется, как и в import_data
+        '''
+        meta = self.read_meta(input_file)
+        if meta is None or meta.get('kind') != 'incremental':
+            return False
+        with _open_backup(input_file) as f:
+            if not self._check_incremental(_iter_backup(input_file, f)):
+                return False
+        with _open_backup(input_file) as f:
+            self._apply_incremental(_iter_backup(input_file, f))
+        return True
+
+
+    def import_chain(self, full_file: str, incremental_files: list) -> bool:
+        '''Восстановление из полного бэкапа и цепочки инкрементальных.
+
+        Каждый следующий файл должен начинаться не позже границы until
+        предыдущего, иначе между ними были бы потеряны изменения
+        '''
+        until = (self.read_meta(full_file) or {}).get('until')
+        for input_file in incremental_files:
+            meta = self.read_meta(input_file)
+            if until is None or meta is None or meta.get('kind') != 'incremental':
                 return False
-        for relationship in relationships:
-            if ('id' not in relationship or 'properties' not in relationship or
-                'type' not in relationship or 'start_node' not in relationship or
-                'end_node' not in relationship):
+            if _parse_time(meta['since']) > _parse_time(until):
+                logger.error('Пропуск изменений между %s и %s перед %s',
+                             until, meta['since'], input_file)
                 return False
+            until = meta['until']
+        if not self.import_data(full_file):
+            return False
+        return all(self.import_incremental(input_file) for input_file in incremental_files)
+
+
+    def _check_incremental(self, items) -> bool:
+        '''Проверка корректности элементов инкрементального бэкапа'''
+        required = {
+            'tombstones': ('properties',),
+            'users': ('properties',),
+            'announcements': ('master', 'number', 'properties'),
+            'feedback': ('author', 'properties'),
+        }
+        try:
+            for key, item in items:
+                if key not in required:
+                    continue
+                if not isinstance(item, dict) or any(k not in item for k in required[key]):
+                    return False
+                if not isinstance(item['properties'], dict):
+                    return False
+                if key == 'users' and 'login' not in item['properties']:
+                    return False
+                if key == 'feedback' and 'uid' not in item['properties']:
+                    return False
+        except ValueError:
+            return False
         return True
-    
 
-    def set_graph_data(self, graph_data: dict) -> bool:
+
+    def _apply_incremental(self, items) -> None:
+        '''Пакетное применение разделов инкрементального бэкапа'''
+        with self.driver.session() as session:
+            counter = _Counter(self.progress)
+            batch = []
+            stage = INCREMENTAL_SECTIONS[0]
+            for key, item in items:
+                if key not in INCREMENTAL_SECTIONS:
+                    continue
+                if key != stage or len(batch) >= self.batch_size:
+                    self._apply_batch(session, stage, batch, counter)
+                    batch = []
+                    if key != stage:
+                        counter.finish(stage)
+                        stage = key
+                item['properties'] = back_convert(item['properties'])
+                batch.append(item)
+            self._apply_batch(session, stage, batch, counter)
+            counter.finish(stage)
+            session.run(REBUILD_RATINGS_QUERY).consume()
+            session.run(RESTORE_MARKER_QUERY).consume()
+
+
+    def _apply_batch(self, session, stage: str, batch: list, counter) -> None:
+        '''Применение пакета одного раздела одной транзакцией'''
+        if not batch:
+            return
+        session.execute_write(
+            lambda tx: tx.run(_INCREMENTAL_QUERIES[stage], rows=batch).consume()
+        )
+        counter.add(stage, len(batch))
+
+
+    def set_graph_data(self, graph_data: dict, merge: bool = False) -> bool:
         '''Запись данных в БД'''
         if not self._check_data(graph_data):
             return False
-        with self.driver.session() as session:
-            session.execute_write(self._import_graph, graph_data)
+        items = lambda: chain(
+            (('nodes', node) for node in graph_data['nodes']),
+            (('relationships', rel) for rel in graph_data['relationships'])
+        )
+        if merge:
+            keys = _MergeKeys()
+            for key, item in items():
+                keys.add(key, item)
+            self._merge_items(items(), keys)
+        else:
+            self._import_items(items())
         return True
 
-    
-    def _import_graph(self, tx, graph_data):
-        # Удаление предыдущих данных
-        tx.run('MATCH ()-[e]->() DELETE e')
-        tx.run('MATCH (n) DELETE n')
-
-        # Создание всех узлов
-        for node in graph_data.get('nodes', []):
-            node_id = node.get('id')
-            labels = ':'.join(node.get('labels', []))
-            properties = node.get('properties', {})
-            
-            query = f'''
-                CREATE (n:{labels} $props)
-                SET n._import_id = $node_id
-            '''
-            tx.run(query, props=properties, node_id=node_id)
-        
-        # Создание отношений между узлами
-        for rel in graph_data.get('relationships', []):
-            rel_type = rel.get('type')
-            start_id = rel.get('start_node')
-            end_id = rel.get('end_node')
-            properties = rel.get('properties', {})
-            
-            query = '''
-                MATCH (a {_import_id: $start_id}), (b {_import_id: $end_id})
-                CREATE (a)-[r:%s]->(b)
-                SET r = $props
-            ''' % rel_type
-            
-            tx.run(query, start_id=start_id, end_id=end_id, props=properties)
-        
-        # Удаление временных идентификаторов
-        tx.run('MATCH (n) REMOVE n._import_id')
+
+    def _import_items(self, items) -> None:
+        '''Пакетная запись потока пар (раздел, элемент) в БД.
+
+        Узлы должны идти раньше отношений, как при экспорте. Каждый пакет
+        записывается отдельной транзакцией, поэтому объём памяти транзакции
+        не зависит от размера бэкапа.
+        '''
+        with self.driver.session() as session:
+            self._clear(session)
+            # Временный индекс для поиска концов отношений
+            session.run(
+                'CREATE INDEX import_id IF NOT EXISTS FOR (n:_Import) ON (n._import_id)'
+            ).consume()
+            session.run('CALL db.awaitIndexes(300)').consume()
+
+            counter = _Counter(self.progress)
+            batch = []
+            stage = 'nodes'
+            for key, item in items:
+                if key not in ('nodes', 'relationships'):
+                    continue
+                if key != stage or len(batch) >= self.batch_size:
+                    self._write_batch(session, stage, batch, counter)
+                    batch = []
+                    if key != stage:
+                        counter.finish(stage)
+                        stage = key
+                batch.append(item)
+            self._write_batch(session, stage, batch, counter)
+            counter.finish(stage)
+
+            # Удаление временных идентификаторов
+            session.run(
+                '''MATCH (n:_Import)
+                CALL { WITH n REMOVE n:_Import, n._import_id }
+                IN TRANSACTIONS OF $batch_size ROWS''',
+                batch_size=self.batch_size
+            ).consume()
+            session.run('DROP INDEX import_id IF EXISTS').consume()
+            # Агрегаты оценок пользователей пересчитываются по загруженным отзывам
+            session.run(REBUILD_RATINGS_QUERY).consume()
+            session.run(RESTORE_MARKER_QUERY).consume()
+
+
+    def _merge_items(self, items, keys) -> None:
+        '''Слияние потока пар (раздел, элемент) с текущими данными.
+
+        Пользователи сопоставляются по логину, объявления - по логину мастера
+        и номеру в отношении Create, отзывы - по uid, отметки Tombstone -
+        по сущности, её ключу и времени удаления; узлы без естественного
+        ключа создаются заново. Затронутые узлы помечаются меткой _Import,
+        отношения - номером запуска, после чего удаляются узлы пользователей,
+        объявлений и отзывов, которых нет в бэкапе, и отношения между
+        загруженными узлами, которых нет в бэкапе. Узлы, созданные или
+        изменённые во время загрузки, и их отношения сохраняются. Все шаги
+        выполняются пакетами, поэтому данные остаются доступными для чтения
+        и записи во время загрузки.
+        '''
+        run = uuid.uuid4().hex
+        with self.driver.session() as session:
+            started = session.run('RETURN datetime() AS started').single()['started']
+            # Метки, оставшиеся после прерванной загрузки
+            session.run(
+                '''MATCH (n:_Import)
+                CALL { WITH n REMOVE n:_Import, n._import_id }
+                IN TRANSACTIONS OF $batch_size ROWS''',
+                batch_size=self.batch_size
+            ).consume()
+            session.run(
+                'CREATE INDEX import_id IF NOT EXISTS FOR (n:_Import) ON (n._import_id)'
+            ).consume()
+            session.run('CALL db.awaitIndexes(300)').consume()
+
+            counter = _Counter(self.progress)
+            batch = []
+            stage = 'nodes'
+            for key, item in items:
+                if key not in ('nodes', 'relationships'):
+                    continue
+                if key != stage or len(batch) >= self.batch_size:
+                    self._merge_batch(session, stage, batch, keys, run, counter)
+                    batch = []
+                    if key != stage:
+                        counter.finish(stage)
+                        stage = key
+                batch.append(item)
+            self._merge_batch(session, stage, batch, keys, run, counter)
+            counter.finish(stage)
+
+            # Удаление того, чего нет в бэкапе. Служебные узлы (отметки
+            # Tombstone для инкрементальных бэкапов) и узлы, записанные
+            # после начала загрузки, не затрагиваются
+            session.run(
+                '''MATCH (n:User|Announcement|Feedback) WHERE NOT n:_Import
+                AND NOT coalesce(n.created_at >= $started OR n.updated_at >= $started, false)
+                CALL { WITH n DETACH DELETE n }
+                IN TRANSACTIONS OF $batch_size ROWS''',
+                started=started, batch_size=self.batch_size
+            ).consume()
+            session.run(
+                '''MATCH (:_Import)-[r]->(:_Import)
+                WHERE r._merge_run IS NULL OR r._merge_run <> $run
+                CALL { WITH r DELETE r }
+                IN TRANSACTIONS OF $batch_size ROWS''',
+                run=run, batch_size=self.batch_size
+            ).consume()
+            # Удаление служебных отметок
+            session.run(
+                '''MATCH ()-[r]->() WHERE r._merge_run IS NOT NULL
+                CALL { WITH r REMOVE r._merge_run }
+                IN TRANSACTIONS OF $batch_size ROWS''',
+                batch_size=self.batch_size
+            ).consume()
+            session.run(
+                '''MATCH (n:_Import)
+                CALL { WITH n REMOVE n:_Import, n._import_id }
+                IN TRANSACTIONS OF $batch_size ROWS''',
+                batch_size=self.batch_size
+            ).consume()
+            session.run('DROP INDEX import_id IF EXISTS').consume()
+            session.run(REBUILD_RATINGS_QUERY).consume()
+            session.run(RESTORE_MARKER_QUERY).consume()
+
+
+    def _merge_batch(self, session, stage: str, batch: list, keys, run: str, counter) -> None:
+        '''Слияние пакета узлов или отношений одной транзакцией'''
+        if not batch:
+            return
+        if stage == 'nodes':
+            session.execute_write(self._merge_nodes, batch, keys)
+        else:
+            session.execute_write(self._merge_relationships, batch, run)
+        counter.add(stage, len(batch))
+
+
+    def _merge_nodes(self, tx, nodes: list, keys) -> None:
+        # Узлы группируются по меткам и способу поиска существующего узла
+        groups = {}
+        for node in nodes:
+            kind, row = keys.match(node)
+            groups.setdefault((tuple(node['labels']), kind), []).append(row)
+        for (labels, kind), rows in groups.items():
+            labels = ''.join(f':`{label}`' for label in labels)
+            tx.run(
+                f'''UNWIND $rows AS row
+                {_MERGE_MATCH[kind]}
+                WITH row, head(collect(old)) AS old
+                FOREACH (_ IN CASE WHEN old IS NULL THEN [1] ELSE [] END |
+                    CREATE (:_Import {{_import_id: row.id}}))
+                FOREACH (n IN CASE WHEN old IS NULL THEN [] ELSE [old] END |
+                    SET n:_Import, n._import_id = row.id)
+                WITH row
+                MATCH (n:_Import {{_import_id: row.id}})
+                SET n = row.properties, n{labels}, n._import_id = row.id''',
+                rows=rows
+            ).consume()
+
+
+    def _merge_relationships(self, tx, relationships: list, run: str) -> None:
+        groups = {}
+        for rel in relationships:
+            groups.setdefault(rel['type'], []).append({
+                'start_node': rel['start_node'],
+                'end_node': rel['end_node'],
+                'properties': rel['properties']
+            })
+        for rel_type, rows in groups.items():
+            tx.run(
+                f'''UNWIND $rows AS row
+                MATCH (a:_Import {{_import_id: row.start_node}})
+                MATCH (b:_Import {{_import_id: row.end_node}})
+                MERGE (a)-[r:`{rel_type}`]->(b)
+                SET r = row.properties, r._merge_run = $run''',
+                rows=rows, run=run
+            ).consume()
+
+
+    def _clear(self, session) -> None:
+        '''Удаление предыдущих данных пакетами'''
+        session.run(
+            '''MATCH (n)
+            CALL { WITH n DETACH DELETE n }
+            IN TRANSACTIONS OF $batch_size ROWS''',
+            batch_size=self.batch_size
+        ).consume()
+
+
+    def _write_batch(self, session, stage: str, batch: list, counter) -> None:
+        '''Запись пакета узлов или отношений одной транзакцией'''
+        if not batch:
+            return
+        if stage == 'nodes':
+            session.execute_write(self._create_nodes, batch)
+        else:
+            session.execute_write(self._create_relationships, batch)
+        counter.add(stage, len(batch))
+
+
+    def _create_nodes(self, tx, nodes: list) -> None:
+        # Метки нельзя передать параметром, поэтому узлы группируются по меткам
+        groups = {}
+        for node in nodes:
+            groups.setdefault(tuple(node['labels']), []).append({
+                'id': node['id'],
+                'properties': node['properties']
+            })
+        for labels, rows in groups.items():
+            labels = ''.join(f':`{label}`' for label in labels)
+            tx.run(
+                f'''UNWIND $rows AS row
+                CREATE (n{labels}:_Import)
+                SET n = row.properties, n._import_id = row.id''',
+                rows=rows
+            ).consume()
+
+
+    def _create_relationships(self, tx, relationships: list) -> None:
+        groups = {}
+        for rel in relationships:
+            groups.setdefault(rel['type'], []).append({
+                'start_node': rel['start_node'],
+                'end_node': rel['end_node'],
+                'properties': rel['properties']
+            })
+        for rel_type, rows in groups.items():
+            tx.run(
+                f'''UNWIND $rows AS row
+                MATCH (a:_Import {{_import_id: row.start_node}})
+                MATCH (b:_Import {{_import_id: row.end_node}})
+                CREATE (a)-[r:`{rel_type}`]->(b)
+                SET r = row.properties''',
+                rows=rows
+            ).consume()
+
+
+# Поиск существующего узла при слиянии по виду естественного ключа
+_MERGE_MATCH = {
+    'user': 'OPTIONAL MATCH (old:User {login: row.login})',
+    'announcement': '''OPTIONAL MATCH (:User {login: row.master})
+                -[:Create {number: row.number}]->(old:Announcement)''',
+    'feedback': 'OPTIONAL MATCH (old:Feedback {uid: row.uid})',
+    'tombstone': '''OPTIONAL MATCH (old:Tombstone {deleted_at: row.deleted_at, entity: row.entity})
+                WHERE coalesce(old.login, '') = coalesce(row.login, '')
+                AND coalesce(old.number, -1) = coalesce(row.number, -1)
+                AND coalesce(old.uid, '') = coalesce(row.uid, '')''',
+    None: 'WITH row, null AS old',
+}
+# Свойства, задающие отметку Tombstone при слиянии
+_TOMBSTONE_KEY = ('entity', 'login', 'number', 'uid', 'deleted_at')
+
+
+class _MergeKeys:
+    '''Естественные ключи узлов бэкапа, собранные при проверке.
+
+    Ключ объявления известен только из отношения Create, которое идёт после
+    узлов, поэтому ключи собираются заранее: для пользователей хранится
+    логин, для объявлений - id мастера и номер. Ключ отметки Tombstone
+    (сущность, логин и номер или uid, время удаления) берётся из её свойств
+    '''
+
+    def __init__(self):
+        self.logins = {}
+        self.announcements = {}
+
+
+    def add(self, key: str, item: dict) -> None:
+        if key == 'nodes' and 'User' in item['labels']:
+            login = item['properties'].get('login')
+            if login is not None:
+                self.logins[item['id']] = login
+        elif key == 'relationships' and item['type'] == 'Create':
+            number = item['properties'].get('number')
+            if number is not None:
+                self.announcements[item['end_node']] = (item['start_node'], number)
+
+
+    def match(self, node: dict) -> tuple:
+        '''Вид ключа и строка параметров запроса для узла'''
+        row = {'id': node['id'], 'properties': node['properties']}
+        labels = node['labels']
+        if 'User' in labels and node['id'] in self.logins:
+            return 'user', {**row, 'login': self.logins[node['id']]}
+        if 'Announcement' in labels and node['id'] in self.announcements:
+            master, number = self.announcements[node['id']]
+            if master in self.logins:
+                return 'announcement', {**row, 'master': self.logins[master], 'number': number}
+        if 'Feedback' in labels and node['properties'].get('uid') is not None:
+            return 'feedback', {**row, 'uid': node['properties']['uid']}
+        if 'Tombstone' in labels and node['properties'].get('deleted_at') is not None:
+            # Время удаления сравнивается как дата, а не строка из JSON
+            properties = back_convert(node['properties'])
+            return 'tombstone', {
+                'id': node['id'], 'properties': properties,
+                **{field: properties.get(field) for field in _TOMBSTONE_KEY}
+            }
+        return None, row
+
+
+# Запросы применения разделов инкрементального бэкапа
+_INCREMENTAL_QUERIES = {
+    'tombstones': '''
+        UNWIND $rows AS row
+        WITH row.properties AS t
+        OPTIONAL MATCH (:User {login: t.login})-[:Create {number: t.number}]->(a:Announcement)
+        WHERE t.entity = 'announcement'
+        OPTIONAL MATCH (af:Feedback)-[:About]->(a)
+        OPTIONAL MATCH (f:Feedback {uid: t.uid})
+        WHERE t.entity = 'feedback'
+        DETACH DELETE af, a, f
+    ''',
+    'users': '''
+        UNWIND $rows AS row
+        MERGE (u:User {login: row.properties.login})
+        SET u = row.properties
+    ''',
+    'announcements': '''
+        UNWIND $rows AS row
+        MATCH (u:User {login: row.master})
+        MERGE (u)-[:Create {number: row.number}]->(a:Announcement)
+        SET a = row.properties
+    ''',
+    'feedback': '''
+        UNWIND $rows AS row
+        MATCH (author:User {login: row.author})
+        OPTIONAL MATCH (target:User {login: row.user})
+        OPTIONAL MATCH (:User {login: row.master})-[:Create {number: row.number}]->(a:Announcement)
+        WITH row, author, coalesce(target, a) AS target
+        WHERE target IS NOT NULL
+        MERGE (f:Feedback {uid: row.properties.uid})
+        SET f = row.properties
+        MERGE (author)-[:Make]->(f)
+        MERGE (f)-[about:About]->(target)
+        SET about.estimation = row.estimation
+    ''',
+}
+
+
+class _Counter:
+    '''Подсчёт записанных элементов и скорости записи'''
+
+    def __init__(self, progress):
+        self.progress = progress
+        self.count = 0
+        self.started = time.monotonic()
+
+
+    def add(self, stage: str, count: int) -> None:
+        self.count += count
+        self.progress(stage, self.count, self.rate())
+
+
+    def finish(self, stage: str) -> None:
+        logger.info('Импорт %s завершён: %d за %.1f с (%.0f в секунду)',
+                    stage, self.count, time.monotonic() - self.started, self.rate())
+        self.count = 0
+        self.started = time.monotonic()
+
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+
+def _open_backup(input_file: str):
+    '''Открытие файла бэкапа, файлы .gz распаковываются на лету'''
+    if input_file.endswith('.gz'):
+        return gzip.open(input_file, 'rt', encoding='utf-8')
+    return open(input_file, 'r', encoding='utf-8')
+
+
+def _iter_backup(input_file: str, f):
+    '''Пары (раздел, элемент) из бэкапа в формате JSON или NDJSON'''
+    if input_file.endswith(('.ndjson', '.ndjson.gz')):
+        return iter_ndjson_items(f)
+    return iter_json_items(f)
+
+
+def _parse_time(value: str) -> datetime:
+    '''Граница бэкапа как datetime, время без пояса считается UTC'''
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _is_identifier(name) -> bool:
+    '''Проверка, что метку или тип отношения можно подставить в запрос'''
+    return isinstance(name, str) and _IDENTIFIER.fullmatch(name) is not None
+
+
+def _log_progress(stage: str, count: int, rate: float) -> None:
+    logger.info('Импорт %s: %d (%.0f в секунду)', stage, count, rate)
 
 
 if __name__ == '__main__':
@@ -1,19 +1,145 @@
+import atexit
+import os
+import threading
+
 from neo4j import GraphDatabase
 
+from .instrumentation import InstrumentedDriver
+
+
+# Драйверы, общие для всего процесса, по параметрам подключения
+_drivers = {}
+_lock = threading.Lock()
+
+
+def driver_config() -> dict:
+    '''Параметры подключения и пула соединений из переменных окружения'''
+    return {
+        'uri': os.environ.get('NEO4J_URI', 'bolt://db:7687'),
+        'user': os.environ.get('NEO4J_USER', 'neo4j'),
+        'password': os.environ.get('NEO4J_PASSWORD', '12345678'),
+        'max_connection_pool_size': int(os.environ.get('NEO4J_MAX_POOL_SIZE', 100)),
+        'connection_acquisition_timeout': float(os.environ.get('NEO4J_ACQUISITION_TIMEOUT', 60)),
+        'max_connection_lifetime': float(os.environ.get('NEO4J_MAX_CONNECTION_LIFETIME', 3600)),
+    }
+
+
+def get_driver(uri: str = None, user: str = None, password: str = None):
+    '''Общий драйвер для заданных параметров, создаётся при первом обращении'''
+    config = driver_config()
+    key = (uri or config['uri'], user or config['user'], password or config['password'])
+    # Остальные параметры относятся к пулу соединений
+    pool_config = {k: v for k, v in config.items() if k not in ('uri', 'user', 'password')}
+    with _lock:
+        driver = _drivers.get(key)
+        if driver is None:
+            driver = GraphDatabase.driver(key[0], auth=key[1:], **pool_config)
+            _instrument_pool(driver)
+            # Сводки запросов передаются в метрики и лог медленных запросов
+            driver = InstrumentedDriver(driver)
+            _drivers[key] = driver
+        return driver
+
+
+def init_driver():
+    '''Запуск приложения: создание драйвера и закрытие его при выходе'''
+    driver = get_driver()
+    atexit.register(close_drivers)
+    return driver
+
+
+def close_drivers() -> None:
+    '''Остановка приложения: закрытие всех драйверов'''
+    with _lock:
+        drivers = list(_drivers.values())
+        _drivers.clear()
+    for driver in drivers:
+        driver.close()
+
+
+def get_pool_metrics() -> list:
+    '''Состояние пулов соединений всех драйверов.
+
+    in_use и idle - занятые и свободные соединения, waits - сколько раз
+    сессия ждала освобождения соединения из-за заполненного пула,
+    wait_timeouts - сколько из этих ожиданий закончились по таймауту
+    '''
+    with _lock:
+        drivers = list(_drivers.items())
+    metrics = []
+    for (uri, user, _), driver in drivers:
+        pool = getattr(driver, '_pool', None)
+        connections = getattr(pool, 'connections', {})
+        # Пул меняется из других потоков, поэтому читается под его блокировкой
+        with getattr(pool, 'lock', threading.Lock()):
+            in_use = sum(c.in_use for address in connections for c in connections[address])
+            total = sum(len(connections[address]) for address in connections)
+        cond = getattr(pool, 'cond', None)
+        metrics.append({
+            'uri': uri,
+            'user': user,
+            'max_size': getattr(getattr(pool, 'pool_config', None), 'max_connection_pool_size', None),
+            'in_use': in_use,
+            'idle': total - in_use,
+            'waits': getattr(cond, 'waits', 0),
+            'wait_timeouts': getattr(cond, 'timeouts', 0),
+        })
+    return metrics
+
+
+class _CountingCondition:
+    '''Обёртка над Condition пула, считающая ожидания свободного соединения'''
+
+    def __init__(self, cond):
+        self._cond = cond
+        self.waits = 0
+        self.timeouts = 0
+
+
+    def wait(self, timeout=None):
+        self.waits += 1
+        result = self._cond.wait(timeout)
+        if not result:
+            self.timeouts += 1
+        return result
+
+
+    def __getattr__(self, name):
+        return getattr(self._cond, name)
+
+
+    def __enter__(self):
+        return self._cond.__enter__()
+
+
+    def __exit__(self, *args):
+        return self._cond.__exit__(*args)
+
+
+def _instrument_pool(driver) -> None:
+    '''Подсчёт ожиданий в пуле драйвера.
+
+    Драйвер не публикует метрики пула, поэтому используется его внутреннее
+    устройство; если оно изменится, метрики ожиданий просто останутся нулевыми
+    '''
+    pool = getattr(driver, '_pool', None)
+    if pool is None or not hasattr(pool, 'cond'):
+        return
+    pool.cond = _CountingCondition(pool.cond)
+
 
 class DatabaseConnection:
-    '''Основа для классов работы с БД, выполняющая подключение к базе данных'''
+    '''Основа для классов работы с БД, использующая общий драйвер процесса'''
 
     def __init__(
         self,
-        uri: str = 'bolt://db:7687',
-        user: str = 'neo4j',
-        password: str = '12345678'
+        uri: str = None,
+        user: str = None,
+        password: str = None
     ):
-        '''Инициализация с подключением к базе данных'''
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-    
+        '''Инициализация с подключением к базе данных.
 
-    def __del__(self):
-        '''Деструктор, закрывающий драйвер'''
-        self.driver.close()
+        По умолчанию параметры берутся из переменных окружения NEO4J_*,
+        все объекты с одинаковыми параметрами используют один драйвер
+        '''
+        self.driver = get_driver(uri, user, password)
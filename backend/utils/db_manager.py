@@ -1,49 +1,609 @@
+import os
+import threading
+import time
+
+from neo4j.exceptions import ConstraintError
+
+from .auth import RevocationList, hash_password, needs_rehash, verify_password
+from .cache import Cache, default_cache
+from .catalogue_snapshot import CREATED_US, SNAPSHOT_ROW, CatalogueSnapshot, default_snapshot
 from .db_main import DatabaseConnection
+from .geocoder import Geocoder, default_geocoder
+from .instrumentation import instrument_methods
+from .pagination import ANNOUNCEMENT_SORT_KEYS, announcement_keys, keyset_condition, order_by
+from .search import fulltext_query
+from .validation import (
+    ANNOUNCEMENT_SCHEMA, USER_FEEDBACK_SCHEMA,
+    ANNOUNCEMENT_FEEDBACK_SCHEMA, RATING_SCALE, validate_item
+)
+
+
+# Фильтры объявлений и их значения по умолчанию
+ANNOUNCEMENT_FILTERS = {
+    'name': '', 'master': '', 'width_min': .0, 'width_max': .0,
+    'height_min': .0, 'height_max': .0, 'length_min': .0,
+    'length_max': .0, 'weight_min': .0, 'weight_max': .0,
+    'amount_min': 0, 'amount_max': 0, 'price_min': .0,
+    'price_max': .0, 'address': ''
+}
+# Поиск рядом с точкой: near - {'latitude': ..., 'longitude': ...} или None,
+# radius_km - радиус в километрах (0 - без ограничения, только сортировка)
+GEO_FILTERS = {'near': None, 'radius_km': .0}
+
+
+# Время в секундах, на которое запоминается версия всех данных
+# (get_data_version); 0 - читать её из БД при каждом запросе
+DATA_VERSION_TTL = float(os.environ.get('DATA_VERSION_TTL', 1))
+
+
+# Числовые поля объявлений, для которых строятся фасеты каталога
+FACET_FIELDS = ('width', 'height', 'length', 'weight', 'amount', 'price')
+# Число интервалов гистограммы фасета по умолчанию
+FACET_BUCKETS = 10
+
+
+# Связанные данные, которые можно встроить в ответ с объявлением (expand)
+ANNOUNCEMENT_EXPANSIONS = ('master', 'feedback')
+# Размер страницы отзывов, встроенных в объявление, по умолчанию
+FEEDBACK_PAGE_SIZE = 20
+
+
+# Размер части пакетной записи, записываемой одной транзакцией
+BULK_CHUNK_SIZE = 500
+# Средняя оценка пользователя u по хранимым в нём агрегатам
+RATING_AVERAGE = 'CASE WHEN u.rating_count > 0 THEN toFloat(u.rating_sum) / u.rating_count END'
+# Обновление агрегатов оценок пользователя u на список оценок $sign * estimations:
+# число отзывов, сумма оценок и количество отзывов с каждой оценкой.
+# Перед чтением старых значений берётся блокировка записи, чтобы
+# параллельные отзывы не потеряли обновления. rating_updated_at - время
+# изменения агрегатов для заголовка Last-Modified
+UPDATE_RATING = f'''
+    SET u._lock = true
+    REMOVE u._lock
+    SET u.rating_updated_at = datetime(),
+        u.rating_count = coalesce(u.rating_count, 0) + $sign * size(estimations),
+        u.rating_sum = coalesce(u.rating_sum, 0)
+            + $sign * reduce(total = 0, e IN estimations | total + e),
+        u.rating_histogram = [i IN range(1, {RATING_SCALE}) |
+            coalesce(u.rating_histogram[i - 1], 0)
+            + $sign * size([e IN estimations WHERE e = i])]
+'''
+# Отметки об удалении отзывов с идентификаторами uids для инкрементального бэкапа
+FEEDBACK_TOMBSTONES = '''
+    FOREACH (uid IN uids |
+        CREATE (:Tombstone {entity: 'feedback', uid: uid, deleted_at: datetime()})
+    )
+'''
+# Пересчёт агрегатов оценок всех пользователей, например после загрузки бэкапа
+REBUILD_RATINGS_QUERY = f'''
+    MATCH (u:User)
+    CALL {{
+        WITH u
+        OPTIONAL MATCH (:Feedback)-[a:About]->(u)
+        WITH u, collect(a.estimation) AS estimations
+        SET u.rating_count = size(estimations),
+            u.rating_sum = reduce(total = 0, e IN estimations | total + e),
+            u.rating_histogram = [i IN range(1, {RATING_SCALE}) |
+                size([e IN estimations WHERE e = i])],
+            u.rating_updated_at = datetime()
+    }} IN TRANSACTIONS OF 1000 ROWS
+'''
+
+
+# Запросы чтения, общие для DatabaseManager и AsyncDatabaseManager
+USER_PROJECTION = f'''u {{
+        .login, .role, .full_name, .age,
+        .status, .description, .education,
+        .created_at, .updated_at, .photo_url,
+        rating_count: coalesce(u.rating_count, 0),
+        rating_histogram: coalesce(u.rating_histogram, [i IN range(1, {RATING_SCALE}) | 0]),
+        rating: {RATING_AVERAGE}
+    }}'''
+USER_QUERY = f'''
+    MATCH (u:User {{login: $login}})
+    RETURN {USER_PROJECTION} AS u
+'''
+# Пользователь и хэш его пароля для входа одним запросом
+LOGIN_QUERY = f'''
+    OPTIONAL MATCH (u:User {{login: $login}})
+    RETURN u.password AS password,
+        CASE WHEN u IS NOT NULL THEN {USER_PROJECTION} END AS u
+'''
+USERS_QUERY = f'''
+    UNWIND $logins AS login
+    MATCH (u:User {{login: login}})
+    RETURN {USER_PROJECTION} AS u
+'''
+ANNOUNCEMENT_QUERY = '''
+    MATCH (u:User {login: $login})
+            -[c:Create {number: $number}]->
+            (a:Announcement)
+    RETURN a, u.login AS master
+'''
+# Краткие сведения о мастере u для карточки объявления
+SELLER_PROJECTION = f'''u {{
+        .login, .full_name, .photo_url, .status,
+        rating_count: coalesce(u.rating_count, 0),
+        rating: {RATING_AVERAGE}
+    }}'''
+ANNOUNCEMENTS_BY_KEY_QUERY = '''
+    UNWIND $keys AS key
+    MATCH (u:User {login: key.login})
+            -[c:Create {number: key.number}]->
+            (a:Announcement)
+    RETURN a, u.login AS master, c.number AS number
+'''
+# Строки снимка каталога: все объявления и объявления по ключам
+SNAPSHOT_QUERY = f'''
+    MATCH (u:User)-[c:Create]->(a:Announcement)
+    RETURN {SNAPSHOT_ROW} AS row
+'''
+SNAPSHOT_BY_KEY_QUERY = f'''
+    UNWIND $keys AS key
+    MATCH (u:User {{login: key.login}})
+            -[c:Create {{number: key.number}}]->
+            (a:Announcement)
+    RETURN {SNAPSHOT_ROW} AS row
+'''
+USER_FEEDBACK_QUERY = '''
+    MATCH (u:User)-[:Make]->(f:Feedback)-[a:About]->(:User {login: $login})
+    RETURN f.text AS text, 
+        a.estimation AS estimation,
+        u.login AS author
+'''
+ANNOUNCEMENT_FEEDBACK_QUERY = '''
+    MATCH (:User {login: $login})
+        -[:Create {number: $number}]->
+        (a:Announcement)
+    MATCH (u:User)-[:Make]->(f:Feedback)-[:About]->(a)
+    RETURN f.text AS text,
+        u.login AS author
+'''
+
+
+# Версии данных для заголовков ETag и Last-Modified: списки значений,
+# меняющиеся при любом изменении ответа. Запрашиваются до основного запроса
+USER_VERSION_QUERY = '''
+    MATCH (u:User {login: $login})
+    RETURN [u.updated_at, u.rating_updated_at, u.rating_count, u.rating_sum] AS version
+'''
+ANNOUNCEMENT_VERSION_QUERY = '''
+    MATCH (u:User {login: $login})
+            -[c:Create {number: $number}]->
+            (a:Announcement)
+    RETURN [
+        a.updated_at, u.updated_at, u.rating_updated_at,
+        COUNT { (:Feedback)-[:About]->(a) },
+        COLLECT {
+            MATCH (f:Feedback)-[:About]->(a) WHERE f.created_at IS NOT NULL
+            RETURN f.created_at ORDER BY f.created_at DESC LIMIT 1
+        }
+    ] AS version
+'''
+# Версия всех данных для списков: количества узлов из счётчиков БД и последние
+# времена изменений по индексам. Удаления оставляют отметки Tombstone,
+# загрузка бэкапа - отметку с entity = 'restore'. Все времена хранятся
+# с часовым поясом (ZONED_TIMESTAMPS_QUERY): в ORDER BY время без пояса
+# стоит выше любого времени с поясом и скрыло бы новые изменения
+DATA_VERSION_QUERY = '''
+    RETURN [
+        COUNT { (:User) }, COUNT { (:Announcement) },
+        COUNT { (:Feedback) }, COUNT { (:Tombstone) },
+        COLLECT {
+            MATCH (u:User) WHERE u.updated_at IS NOT NULL
+            RETURN u.updated_at ORDER BY u.updated_at DESC LIMIT 1
+        },
+        COLLECT {
+            MATCH (a:Announcement) WHERE a.updated_at IS NOT NULL
+            RETURN a.updated_at ORDER BY a.updated_at DESC LIMIT 1
+        },
+        COLLECT {
+            MATCH (f:Feedback) WHERE f.created_at IS NOT NULL
+            RETURN f.created_at ORDER BY f.created_at DESC LIMIT 1
+        },
+        COLLECT {
+            MATCH (t:Tombstone) WHERE t.deleted_at IS NOT NULL
+            RETURN t.deleted_at ORDER BY t.deleted_at DESC LIMIT 1
+        }
+    ] AS version
+'''
+
+
+# Перевод времени без часового пояса (из бэкапов и начальных данных)
+# во время с поясом, как в datetime({datetime: ...}): пояс базы, по умолчанию UTC
+ZONED_TIMESTAMPS_QUERY = '''
+    MATCH (n)
+    WHERE (n:User OR n:Announcement OR n:Feedback OR n:Tombstone)
+        AND (n.created_at IS :: LOCAL DATETIME NOT NULL
+            OR n.updated_at IS :: LOCAL DATETIME NOT NULL
+            OR n.deleted_at IS :: LOCAL DATETIME NOT NULL)
+    CALL {
+        WITH n
+        SET n.created_at = CASE WHEN n.created_at IS :: LOCAL DATETIME NOT NULL
+                THEN datetime({datetime: n.created_at}) ELSE n.created_at END,
+            n.updated_at = CASE WHEN n.updated_at IS :: LOCAL DATETIME NOT NULL
+                THEN datetime({datetime: n.updated_at}) ELSE n.updated_at END,
+            n.deleted_at = CASE WHEN n.deleted_at IS :: LOCAL DATETIME NOT NULL
+                THEN datetime({datetime: n.deleted_at}) ELSE n.deleted_at END
+    } IN TRANSACTIONS OF 10000 ROWS
+'''
+
+
+def expanded_announcement_query(expand) -> str:
+    '''Запрос объявления со связанными данными из ANNOUNCEMENT_EXPANSIONS.
+
+    master - поле seller со сведениями о мастере, feedback - поля
+    feedback_count и feedback со страницей отзывов от новых к старым
+    (параметры $feedback_offset и $feedback_limit)
+    '''
+    returns = 'a, u.login AS master'
+    if 'master' in expand:
+        returns += f', {SELLER_PROJECTION} AS seller'
+    if 'feedback' in expand:
+        returns += '''
+        , COUNT { (:Feedback)-[:About]->(a) } AS feedback_count
+        , COLLECT {
+            MATCH (author:User)-[:Make]->(f:Feedback)-[:About]->(a)
+            RETURN {text: f.text, author: author.login, created_at: f.created_at}
+            ORDER BY f.created_at IS NULL, f.created_at DESC, f.uid
+            SKIP $feedback_offset LIMIT $feedback_limit
+        } AS feedback'''
+    return f'''
+    MATCH (u:User {{login: $login}})
+            -[c:Create {{number: $number}}]->
+            (a:Announcement)
+    RETURN {returns}
+    '''
+
+
+def announcements_query(params: dict) -> str:
+    '''Запрос списка объявлений по параметрам get_announcements.
+
+    params изменяется: q заменяется запросом Lucene, sort - доступным ключом
+    '''
+    params['q'] = fulltext_query(params['q'])
+    if params['sort'] == 'relevance' and not params['q']:
+        params['sort'] = 'created_at'
+    if params['sort'] == 'distance' and params.get('near') is None:
+        params['sort'] = 'created_at'
+    keys = announcement_keys(params['sort'])
+    query = _announcement_match(params)
+    returns = _announcement_returns(params.get('expand', ()))
+    if params['q']:
+        returns += ', score'
+    if params.get('near') is not None:
+        returns += f", {ANNOUNCEMENT_SORT_KEYS['distance']} AS distance_km"
+    query += _announcement_filter(params)
+    if params['after'] is not None:
+        query += ' AND ' + keyset_condition(keys, params['descending'])
+    query += f'''
+        RETURN {returns}
+    ''' + order_by(keys, params['descending'])
+    if params['limit']:
+        query += ' LIMIT $limit'
+    return query
+
+
+def announcements_by_key_query(expand) -> str:
+    '''Запрос объявлений по списку $keys с полями ответа announcements_query:
+    дозагрузка страницы, найденной снимком каталога'''
+    return f'''
+    UNWIND $keys AS key
+    MATCH (u:User {{login: key.login}})
+            -[c:Create {{number: key.number}}]->
+            (a:Announcement)
+    RETURN {_announcement_returns(expand)}
+    '''
+
+
+def count_announcements_query(params: dict) -> str:
+    '''Запрос количества объявлений по фильтрам, params изменяется как выше'''
+    params['q'] = fulltext_query(params.get('q', ''))
+    return _announcement_match(params) + _announcement_filter(params) + '''
+        RETURN count(a) AS total
+    '''
+
+
+def facets_query(params: dict) -> str:
+    '''Запрос фасетов FACET_FIELDS по фильтрам, params изменяется как выше.
+
+    Два прохода по подходящим объявлениям без сбора их в список: первая
+    агрегация считает total и диапазоны полей, вторая - число значений
+    каждого поля в каждом из $buckets равных интервалов от min до max
+    (группировка по полю и номеру интервала)
+    '''
+    params['q'] = fulltext_query(params.get('q', ''))
+    ranges = ', '.join(
+        f'min(a.{field}) AS {field}_min, max(a.{field}) AS {field}_max'
+        for field in FACET_FIELDS
+    )
+    range_map = ', '.join(
+        f'{field}: {{min: {field}_min, max: {field}_max}}' for field in FACET_FIELDS
+    )
+    values = ', '.join(f"['{field}', a.{field}]" for field in FACET_FIELDS)
+    return _announcement_match(params) + _announcement_filter(params) + f'''
+        WITH count(a) AS total, {ranges}
+        WITH total, {{{range_map}}} AS ranges
+        CALL {{
+            WITH ranges
+            {_announcement_match(params, keep='ranges, ')}
+            {_announcement_filter(params)}
+            UNWIND [{values}] AS pair
+            WITH ranges[pair[0]] AS r, pair[0] AS field, pair[1] AS value
+            WHERE value IS NOT NULL
+            WITH field, CASE WHEN r.max = r.min THEN 0
+                ELSE toInteger($buckets * (value - r.min) / toFloat(r.max - r.min)) END AS i
+            WITH field, CASE WHEN i >= $buckets THEN $buckets - 1 ELSE i END AS i, count(*) AS n
+            WITH field, collect([i, n]) AS counts
+            RETURN collect({{field: field, counts: counts}}) AS histograms
+        }}
+        RETURN total, ranges, histograms
+    '''
 
 
+def facets_record(record: dict, buckets: int) -> dict:
+    '''Ответ фасетов из записи facets_query: total и для каждого поля min, max,
+    count (объявлений со значением поля) и buckets - интервалы from, to, count'''
+    histograms = {histogram['field']: histogram['counts'] for histogram in record['histograms']}
+    facets = {}
+    for field in FACET_FIELDS:
+        low, high = record['ranges'][field]['min'], record['ranges'][field]['max']
+        counts = [0] * buckets
+        for i, n in histograms.get(field, ()):
+            counts[i] = n
+        width = (high - low) / buckets if low is not None else 0
+        facets[field] = {
+            'min': low, 'max': high, 'count': sum(counts),
+            'buckets': [] if low is None else [
+                {'from': low + i * width, 'to': high if i == buckets - 1 else low + (i + 1) * width,
+                 'count': counts[i]}
+                for i in range(buckets)
+            ]
+        }
+    return {'total': record['total'], 'facets': {field: facets[field] for field in FACET_FIELDS}}
+
+
+def facets_cache_key(filters: dict, buckets: int) -> tuple:
+    '''Ключ кэша фасетов: фильтры со значениями не по умолчанию, строки
+    в нижнем регистре - запрос сравнивает их через toLower, а пробелы
+    не меняет, поэтому они входят в ключ как есть'''
+    defaults = {**ANNOUNCEMENT_FILTERS, **GEO_FILTERS, 'q': ''}
+    key = []
+    for name, value in sorted(filters.items()):
+        if isinstance(value, str):
+            value = value.lower()
+        elif isinstance(value, dict):
+            value = tuple(sorted(value.items()))
+        if value != defaults.get(name):
+            key.append((name, value))
+    return ('facets', tuple(key), buckets)
+
+
+def announcement_record(record: dict) -> dict:
+    '''Объявление из записи результата: свойства узла a и остальные поля'''
+    return {**record['a'], **{key: value for key, value in record.items() if key != 'a'}}
+
+
+def _announcement_returns(expand) -> str:
+    '''Поля объявления в ответе списка'''
+    # Рейтинг мастера хранится в его узле и не требует отдельного запроса
+    returns = f'''a, u.login AS master, c.number AS number,
+        coalesce(u.rating_count, 0) AS master_rating_count,
+        {RATING_AVERAGE} AS master_rating'''
+    if 'master' in expand:
+        returns += f', {SELLER_PROJECTION} AS seller'
+    return returns
+
+
+def _announcement_match(params: dict, keep: str = '') -> str:
+    '''Начало запроса объявлений: переменные u, c, a и score при поиске.
+    keep - переменные предыдущей части запроса, сохраняемые при поиске
+    (например, 'ranges, ')'''
+    if not params['q']:
+        return '''
+            MATCH (u:User)-[c:Create]->(a:Announcement)
+        '''
+    # Совпадения в объявлении и в имени его мастера складываются
+    return f'''
+        CALL {{
+            CALL db.index.fulltext.queryNodes('announcement_search', $q)
+            YIELD node, score
+            RETURN node AS a, score
+            UNION ALL
+            CALL db.index.fulltext.queryNodes('master_search', $q)
+            YIELD node, score
+            MATCH (node)-[:Create]->(a:Announcement)
+            RETURN a, score
+        }}
+        WITH {keep}a, sum(score) AS score
+        MATCH (u:User)-[c:Create]->(a)
+    '''
+
+
+def _announcement_filter(params: dict) -> str:
+    '''Условие WHERE для фильтров объявлений'''
+    query = '''
+        WHERE toLower(a.name) CONTAINS toLower($name)
+        AND toLower(u.full_name) CONTAINS toLower($master)
+        AND a.width >= $width_min
+        AND a.height >= $height_min
+        AND a.length >= $length_min
+        AND a.weight >= $weight_min
+        AND a.amount >= $amount_min
+        AND a.price >= $price_min
+        AND toLower(a.address) CONTAINS toLower($address)
+    '''
+    if params['width_max'] != .0: query += ' AND a.width <= $width_max'
+    if params['height_max'] != .0: query += ' AND a.height <= $height_max'
+    if params['length_max'] != .0: query += ' AND a.length <= $length_max'
+    if params['weight_max'] != .0: query += ' AND a.weight <= $weight_max'
+    if params['amount_max'] != 0: query += ' AND a.amount <= $amount_max'
+    if params['price_max'] != .0: query += ' AND a.price <= $price_max'
+    # Расстояние считается в Neo4j, условие на радиус использует точечный индекс
+    if params.get('near') is not None:
+        query += ' AND a.location IS NOT NULL'
+        if params.get('radius_km'):
+            query += ' AND point.distance(a.location, point($near)) <= $radius_km * 1000'
+    return query
+
+
+@instrument_methods
 class DatabaseManager(DatabaseConnection):
     '''База данных для сервиса по купле/продаже остатков производства'''
 
+    def __init__(self, *args, cache: Cache = None, geocoder: Geocoder = None,
+            revocations: RevocationList = None, snapshot: CatalogueSnapshot = None, **kwargs):
+        '''Инициализация с кэшем профилей и объявлений (по умолчанию LRU в памяти),
+        геокодером адресов объявлений (по умолчанию default_geocoder),
+        списком отозванных сессий, пополняемым при блокировке пользователей,
+        и снимком каталога для фильтрации списка объявлений (по умолчанию
+        default_snapshot: включается CATALOGUE_SNAPSHOT=1 при установленном NumPy)'''
+        super().__init__(*args, **kwargs)
+        self.cache = cache if cache is not None else default_cache()
+        self.geocoder = geocoder if geocoder is not None else default_geocoder()
+        self.revocations = revocations if revocations is not None else RevocationList()
+        self.snapshot = snapshot if snapshot is not None else default_snapshot()
+        # Поколение фасетов: входит в ключ кэша и меняется при изменении
+        # объявлений, поэтому старые фасеты перестают использоваться
+        self.facets_generation = 0
+        # Запомненная версия данных: (время чтения, поколение, версия)
+        self._data_version = None
+        self._data_version_generation = 0
+        self._data_version_lock = threading.Lock()
+
+
     def is_empty(self) -> bool:
         '''Проверка базы данных на отсутствие в ней каких-либо элементов'''
+        # Достаточно найти один узел, сами узлы не передаются
         with self.driver.session() as session:
-            nodes = session.execute_read(
+            node = session.execute_read(
                 lambda tx: tx.run(
-                    'MATCH (n) RETURN n'
-                ).data()
+                    'MATCH (n) RETURN 1 AS found LIMIT 1'
+                ).single()
             )
-        return len(nodes) == 0
+        return node is None
 
     
     def get_user(self, login: str) -> dict:
         '''Получение пользователя по его логину'''
+        cached = self.cache.get(('user', login))
+        if cached is not None:
+            return dict(cached)
         with self.driver.session() as session:
             user = session.execute_read(
-                lambda tx: tx.run(
-                    '''MATCH (u:User {login: $login})
-                    RETURN u {
-                        .login, .role, .full_name, .age,
-                        .status, .description, .education,
-                        .created_at, .updated_at, .photo_url
-                    } AS u''',
-                    login=login
-                ).single()
+                lambda tx: tx.run(USER_QUERY, login=login).single()
             )
-        return dict(user['u']) if user else None
+        if not user:
+            return None
+        self.cache.set(('user', login), dict(user['u']))
+        return dict(user['u'])
     
 
-    def authorize_user(self, login: str, password: str) -> bool:
-        '''Авторизация пользователя по логину и паролю'''
+    def get_users(self, logins: list) -> dict:
+        '''Получение пользователей по списку логинов одним запросом.
+
+        Возвращает словарь логин -> пользователь, для несуществующих
+        логинов значение None
+        '''
+        users = {}
+        missing = []
+        for login in dict.fromkeys(logins):
+            cached = self.cache.get(('user', login))
+            if cached is not None:
+                users[login] = dict(cached)
+            else:
+                users[login] = None
+                missing.append(login)
+        if missing:
+            with self.driver.session() as session:
+                records = session.execute_read(
+                    lambda tx: tx.run(USERS_QUERY, logins=missing).data()
+                )
+            for record in records:
+                user = record['u']
+                self.cache.set(('user', user['login']), user)
+                users[user['login']] = dict(user)
+        return users
+
+
+    def get_user_version(self, login: str) -> list:
+        '''Версия пользователя и отзывов о нём или None, если его нет'''
+        return self._read_version(USER_VERSION_QUERY, login=login)
+
+
+    def get_announcement_version(self, login: str, number: int) -> list:
+        '''Версия объявления, его мастера и отзывов или None, если его нет'''
+        return self._read_version(ANNOUNCEMENT_VERSION_QUERY, login=login, number=number)
+
+
+    def get_data_version(self) -> list:
+        '''Версия всех данных для списков и пакетного получения.
+
+        Запоминается на DATA_VERSION_TTL секунд, поэтому условные запросы
+        списков в это время не обращаются к Neo4j. Изменения через этот
+        процесс сбрасывают её (invalidate_data_version), сделанные в обход
+        него становятся видны в ETag с задержкой до DATA_VERSION_TTL
+        '''
+        now = time.monotonic()
+        with self._data_version_lock:
+            cached = self._data_version
+            generation = self._data_version_generation
+        if cached is not None and now - cached[0] < DATA_VERSION_TTL:
+            return cached[1]
+        version = self._read_version(DATA_VERSION_QUERY)
+        with self._data_version_lock:
+            # Версия, прочитанная до сброса, могла не учесть изменение
+            if generation == self._data_version_generation:
+                self._data_version = (now, version)
+        return version
+
+
+    def invalidate_data_version(self) -> None:
+        '''Сброс запомненной версии данных после изменения'''
+        with self._data_version_lock:
+            self._data_version = None
+            self._data_version_generation += 1
+
+
+    def _read_version(self, query: str, **params) -> list:
         with self.driver.session() as session:
-            user = session.execute_read(
-                lambda tx: tx.run(
-                    '''MATCH (u:User {login: $login, password: $password})
-                    RETURN u AS u''',
-                    login=login,
-                    password=password
-                ).single()
+            record = session.execute_read(lambda tx: tx.run(query, **params).single())
+        return record['version'] if record else None
+
+
+    def login_user(self, login: str, password: str) -> dict:
+        '''Проверка пароля и получение пользователя одним запросом.
+
+        Возвращает пользователя или None при неверном логине или пароле.
+        Хэш проверяется в пуле потоков auth; пароль, хранящийся открытым
+        текстом или с устаревшими параметрами, при входе перехэшируется
+        '''
+        with self.driver.session() as session:
+            record = session.execute_read(
+                lambda tx: tx.run(LOGIN_QUERY, login=login).single()
             )
-        return True if user else False
+        stored = record['password'] if record else None
+        if not verify_password(password, stored):
+            return None
+        if needs_rehash(stored):
+            hashed = hash_password(password)
+            with self.driver.session() as session:
+                session.execute_write(
+                    lambda tx: tx.run(
+                        '''MATCH (u:User {login: $login})
+                        WHERE u.password = $stored
+                        SET u.password = $hashed''',
+                        login=login, stored=stored, hashed=hashed
+                    ).consume()
+                )
+        user = record['u']
+        self.cache.set(('user', login), user)
+        return dict(user)
+
+
+    def authorize_user(self, login: str, password: str) -> bool:
+        '''Авторизация пользователя по логину и паролю'''
+        return self.login_user(login, password) is not None
 
 
     def user_exists(self, login: str) -> bool:
@@ -57,27 +617,33 @@ class DatabaseManager(DatabaseConnection):
             education: str = '', photo_url: str = 'no_photo.png'
     ) -> bool:
         '''Создание нового пользователя в базе данных'''
-        # Проверка, что пользователя с таким логином не существует
-        if self.user_exists(login):
-            return False
-        # Создание пользователя
-        with self.driver.session() as session:
-            session.execute_write(
-                lambda tx: tx.run(
-                    '''CREATE (u:User {
-                            login: $login, password: $password, role: $role, 
-                            full_name: $full_name, age: $age, status: $status, 
-                            created_at: datetime(), updated_at: datetime(),
-                            description: $description, education: $education, 
-                            photo_url: $photo_url
-                        })''',
-                    login=login, password=password, role=role, 
-                    full_name=full_name, age=age, status=status,
-                    description=description, education=education,
-                    photo_url=photo_url
+        # Пароль хэшируется до открытия сессии, чтобы не занимать соединение
+        hashed = hash_password(password)
+        # Пользователь создаётся, только если логин свободен; одновременное
+        # создание одного логина отсекает ограничение уникальности
+        try:
+            with self.driver.session() as session:
+                created = session.execute_write(
+                    lambda tx: tx.run(
+                        '''OPTIONAL MATCH (e:User {login: $login})
+                        WITH e WHERE e IS NULL
+                        CREATE (u:User {
+                                login: $login, password: $password, role: $role, 
+                                full_name: $full_name, age: $age, status: $status, 
+                                created_at: datetime(), updated_at: datetime(),
+                                description: $description, education: $education, 
+                                photo_url: $photo_url
+                            })
+                        RETURN true AS created''',
+                        login=login, password=hashed, role=role, 
+                        full_name=full_name, age=age, status=status,
+                        description=description, education=education,
+                        photo_url=photo_url
+                    ).single()
                 )
-            )
-        return True
+        except ConstraintError:
+            return False
+        return created is not None
 
 
     def edit_user(self,
@@ -85,11 +651,8 @@ class DatabaseManager(DatabaseConnection):
             description: str, education: str, photo_url: str
     ) -> bool:
         '''Редактирование существующего пользователя в БД'''
-        # Проверка на существование пользователя с таким логином
-        if not self.user_exists(login):
-            return False
         with self.driver.session() as session:
-            session.execute_write(
+            edited = session.execute_write(
                 lambda tx: tx.run(
                     '''MATCH (u:User {login: $login}) 
                        SET u.full_name = $full_name, 
@@ -97,30 +660,191 @@ class DatabaseManager(DatabaseConnection):
                            u.updated_at = datetime(),
                            u.description = $description, 
                            u.education = $education, 
-                           u.photo_url = $photo_url''',
+                           u.photo_url = $photo_url
+                       RETURN true AS edited''',
                     login=login, full_name=full_name, age=age, 
                     description=description, education=education,
                     photo_url=photo_url
-                )
+                ).single()
             )
-        return True
+        self.cache.delete(('user', login))
+        # Имя мастера участвует в фильтре master
+        self.facets_generation += 1
+        if edited is not None and self.snapshot is not None:
+            self.snapshot.rename_master(login, full_name)
+        return edited is not None
 
 
     def set_user_status(self, login: str, new_status: str):
-        '''Блокировка и разблокировка пользователя'''
-        if not self.user_exists(login):
-            return False
+        '''Блокировка и разблокировка пользователя.
+
+        При любом статусе, кроме active, выданные пользователю сессии отзываются
+        '''
         with self.driver.session() as session:
-            session.execute_write(
+            edited = session.execute_write(
                 lambda tx: tx.run(
                     '''MATCH (u:User {login: $login}) 
-                       SET u.status = $status''',
+                       SET u.status = $status, u.updated_at = datetime()
+                       RETURN true AS edited''',
                     login=login, status=new_status
-                )
+                ).single()
+            )
+        if edited is not None:
+            self.revocations.set_blocked(login, new_status != 'active')
+        self.cache.delete(('user', login))
+        return edited is not None
+
+
+    def revoke_inactive_sessions(self) -> None:
+        '''Отзыв сессий всех заблокированных пользователей при запуске
+        и после загрузки бэкапа: список отзыва хранится в памяти
+        и после перезапуска пуст'''
+        with self.driver.session() as session:
+            logins = session.execute_read(
+                lambda tx: tx.run(
+                    '''MATCH (u:User) WHERE u.status <> 'active'
+                    RETURN u.login AS login'''
+                ).value()
             )
-        return True
+        self.revocations.reset_blocked(logins)
     
 
+    def get_schema_version(self) -> int:
+        '''Число выполненных в этой базе миграций (узел SchemaVersion), 0 - ни одной'''
+        with self.driver.session() as session:
+            record = session.execute_read(
+                lambda tx: tx.run(
+                    'MATCH (v:SchemaVersion) RETURN max(v.version) AS version'
+                ).single()
+            )
+        return record['version'] or 0
+
+
+    def set_schema_version(self, version: int) -> None:
+        '''Запись числа выполненных миграций в единственный узел SchemaVersion'''
+        with self.driver.session() as session:
+            session.execute_write(
+                lambda tx: tx.run(
+                    '''OPTIONAL MATCH (old:SchemaVersion)
+                    WITH collect(old) AS old
+                    FOREACH (n IN old | DETACH DELETE n)
+                    CREATE (:SchemaVersion {version: $version, applied_at: datetime()})''',
+                    version=version
+                ).consume()
+            )
+
+
+    def ensure_zoned_timestamps(self) -> None:
+        '''Перевод дат без часового пояса в даты с поясом (ZONED_TIMESTAMPS_QUERY),
+        после загрузки начальных данных и бэкапов'''
+        with self.driver.session() as session:
+            updated = session.run(ZONED_TIMESTAMPS_QUERY).consume().counters.properties_set
+        if updated:
+            self.cache.clear()
+
+
+    def ensure_feedback_uids(self) -> None:
+        '''Присвоение идентификаторов отзывам, созданным до их появления'''
+        with self.driver.session() as session:
+            session.run(
+                '''MATCH (f:Feedback) WHERE f.uid IS NULL
+                CALL { WITH f SET f.uid = randomUUID() }
+                IN TRANSACTIONS OF 1000 ROWS'''
+            ).consume()
+
+
+    def ensure_announcement_locations(self) -> None:
+        '''Определение координат объявлений без location, например созданных
+        до её появления или загруженных из бэкапа. Каждый адрес геокодируется один раз;
+        не найденные адреса запоминаются узлами GeocodeMiss и при следующих
+        запусках не геокодируются. После замены таблицы геокодера эти узлы
+        нужно удалить, чтобы адреса геокодировались заново
+        '''
+        with self.driver.session() as session:
+            addresses = session.execute_read(
+                lambda tx: tx.run(
+                    '''MATCH (a:Announcement)
+                    WHERE a.location IS NULL AND a.address IS NOT NULL
+                    AND NOT EXISTS { MATCH (:GeocodeMiss {address: a.address}) }
+                    RETURN DISTINCT a.address AS address'''
+                ).value()
+            )
+            rows = []
+            misses = []
+            for address in addresses:
+                location = self.geocoder.locate(address)
+                if location is not None:
+                    rows.append({'address': address, 'location': location})
+                else:
+                    misses.append(address)
+            for start in range(0, len(misses), BULK_CHUNK_SIZE):
+                chunk = misses[start:start + BULK_CHUNK_SIZE]
+                session.execute_write(
+                    lambda tx: tx.run(
+                        '''UNWIND $addresses AS address
+                        MERGE (:GeocodeMiss {address: address})''',
+                        addresses=chunk
+                    ).consume()
+                )
+            for start in range(0, len(rows), BULK_CHUNK_SIZE):
+                chunk = rows[start:start + BULK_CHUNK_SIZE]
+                session.execute_write(
+                    lambda tx: tx.run(
+                        '''UNWIND $rows AS row
+                        MATCH (a:Announcement {address: row.address})
+                        WHERE a.location IS NULL
+                        SET a.location = row.location''',
+                        rows=chunk
+                    ).consume()
+                )
+        if rows:
+            self.cache.clear()
+
+
+    def ensure_user_ratings(self) -> None:
+        '''Пересчёт агрегатов оценок, если они есть не у всех пользователей'''
+        with self.driver.session() as session:
+            missing = session.execute_read(
+                lambda tx: tx.run(
+                    '''MATCH (u:User) WHERE u.rating_count IS NULL
+                    RETURN u.login AS login LIMIT 1'''
+                ).single()
+            )
+        if missing:
+            self.rebuild_user_ratings()
+
+
+    def rebuild_user_ratings(self) -> None:
+        '''Пересчёт агрегатов оценок всех пользователей по отзывам'''
+        with self.driver.session() as session:
+            session.run(REBUILD_RATINGS_QUERY).consume()
+        self.cache.clear()
+
+
+    def load_snapshot(self) -> None:
+        '''Построение снимка каталога заново (при запуске и после загрузки бэкапа)'''
+        if self.snapshot is None:
+            return
+        # Строки читаются потоком, без списка всех объявлений в памяти
+        with self.driver.session() as session:
+            self.snapshot.load(record['row'] for record in session.run(SNAPSHOT_QUERY))
+
+
+    def _refresh_snapshot(self, keys: list) -> None:
+        '''Загрузка в снимок каталога объявлений по парам (логин мастера, номер)'''
+        if not keys:
+            return
+        with self.driver.session() as session:
+            records = session.execute_read(
+                lambda tx: tx.run(
+                    SNAPSHOT_BY_KEY_QUERY,
+                    keys=[{'login': login, 'number': number} for login, number in keys]
+                ).data()
+            )
+        for record in records:
+            self.snapshot.upsert(record['row'])
+
+
     def get_announcement_max_number(self, login: str) -> int:
         '''Возвращает максимальный номер объявления пользователя'''
         with self.driver.session() as session:
@@ -138,48 +862,107 @@ class DatabaseManager(DatabaseConnection):
             name: str, width: float, height: float, length: float,
             weight: float, amount: int, price: float, address: str,
             description: str = '', photo_url: str = 'no_photo.png'
-    ) -> bool:
-        '''Создание объявления от определённого пользователя с определёнными параметрами'''
-        # Проверка пользователя на существование
-        if not self.user_exists(login):
-            return False
-        # Получение количества объявлений пользователя
-        number = self.get_announcement_max_number(login)
-        # Создание нового объявления
+    ) -> int:
+        '''Создание объявления от определённого пользователя с определёнными параметрами.
+
+        Координаты адреса (свойство location) определяет геокодер.
+        Возвращает номер нового объявления или None, если пользователя нет
+        '''
         with self.driver.session() as session:
-            session.execute_write(
+            result = session.execute_write(
                 lambda tx: tx.run(
-                    '''MATCH (u:User {login: $login})
-                    CREATE (u)-[c:Create {number: $number}]->(a:Announcement {
+                    f'''MATCH (u:User {{login: $login}})
+                    // Блокировка пользователя до конца транзакции, чтобы
+                    // параллельные запросы не получили одинаковый номер
+                    SET u._lock = true
+                    REMOVE u._lock
+                    WITH u
+                    OPTIONAL MATCH (u)-[old:Create]->(:Announcement)
+                    WITH u, coalesce(max(old.number), 0) + 1 AS number
+                    CREATE (u)-[c:Create {{number: number}}]->(a:Announcement {{
                             name: $name, width: $width, height: $height, length: $length, 
                             weight: $weight, amount: $amount, price: $price,
                             created_at: datetime(), updated_at: datetime(),
-                            address: $address, description: $description, photo_url: $photo_url
-                        })''',
-                    login=login, number=number + 1, name=name, 
+                            address: $address, location: $location,
+                            description: $description, photo_url: $photo_url
+                        }})
+                    RETURN number, u.full_name AS full_name, {CREATED_US} AS created_us''',
+                    login=login, name=name, 
                     width=width, height=height, length=length, 
                     weight=weight, amount=amount, price=price, 
-                    address=address, description=description,
-                    photo_url=photo_url
-                )
+                    address=address, location=self.geocoder.locate(address),
+                    description=description, photo_url=photo_url
+                ).single()
             )
-        return True
+        if result:
+            self.facets_generation += 1
+            if self.snapshot is not None:
+                self.snapshot.upsert({
+                    'login': login, 'number': result['number'], 'full_name': result['full_name'],
+                    'name': name, 'address': address, 'width': width, 'height': height,
+                    'length': length, 'weight': weight, 'amount': amount, 'price': price,
+                    'created_us': result['created_us']
+                })
+        return result['number'] if result else None
 
 
-    def get_announcement(self, login: str, number: int) -> dict:
-        '''Получение объявления по мастеру и номеру'''
+    def get_announcement(self, login: str, number: int, expand: tuple = (),
+            feedback_limit: int = FEEDBACK_PAGE_SIZE, feedback_offset: int = 0) -> dict:
+        '''Получение объявления по мастеру и номеру.
+
+        expand - связанные данные из ANNOUNCEMENT_EXPANSIONS, получаемые
+        тем же запросом (см. expanded_announcement_query); такие ответы
+        не кэшируются
+        '''
+        if expand:
+            with self.driver.session() as session:
+                record = session.execute_read(
+                    lambda tx: tx.run(
+                        expanded_announcement_query(expand), login=login, number=number,
+                        feedback_limit=feedback_limit, feedback_offset=feedback_offset
+                    ).single()
+                )
+            return announcement_record(record.data()) if record else None
+        cached = self.cache.get(('announcement', login, number))
+        if cached is not None:
+            return dict(cached)
         with self.driver.session() as session:
             announcement = session.execute_read(
-                lambda tx: tx.run(
-                    '''MATCH (u:User {login: $login})
-                            -[c:Create {number: $number}]->
-                            (a:Announcement)
-                    RETURN a, u.login AS master''',
-                    login=login,
-                    number=number
-                ).single()
+                lambda tx: tx.run(ANNOUNCEMENT_QUERY, login=login, number=number).single()
             )
-        return {**announcement['a'], 'master': announcement['master']} if announcement else None
+        if not announcement:
+            return None
+        announcement = {**announcement['a'], 'master': announcement['master']}
+        self.cache.set(('announcement', login, number), announcement)
+        return dict(announcement)
+
+
+    def get_announcements_by_key(self, keys: list) -> dict:
+        '''Получение объявлений по списку пар (логин мастера, номер) одним запросом.
+
+        Возвращает словарь (логин, номер) -> объявление, для несуществующих
+        объявлений значение None
+        '''
+        announcements = {}
+        missing = []
+        for login, number in dict.fromkeys(keys):
+            cached = self.cache.get(('announcement', login, number))
+            if cached is not None:
+                announcements[(login, number)] = dict(cached)
+            else:
+                announcements[(login, number)] = None
+                missing.append({'login': login, 'number': number})
+        if missing:
+            with self.driver.session() as session:
+                records = session.execute_read(
+                    lambda tx: tx.run(ANNOUNCEMENTS_BY_KEY_QUERY, keys=missing).data()
+                )
+            for record in records:
+                key = (record['master'], record['number'])
+                announcement = {**record['a'], 'master': record['master']}
+                self.cache.set(('announcement', *key), announcement)
+                announcements[key] = dict(announcement)
+        return announcements
 
 
     def get_announcements(self,
@@ -190,37 +973,84 @@ class DatabaseManager(DatabaseConnection):
             weight_min: float = .0, weight_max: float = .0,
             amount_min: int = 0, amount_max: int = 0,
             price_min: float = .0, price_max: float = .0,
-            address: str = ''
+            address: str = '', q: str = '',
+            near: dict = None, radius_km: float = .0,
+            sort: str = 'created_at', descending: bool = False,
+            limit: int = 0, after: dict = None, expand: tuple = ()
     ) -> list:
-        '''Получение списка объявлений по заданным параметрам'''
+        '''Получение списка объявлений по заданным параметрам.
+
+        q - полнотекстовый поиск по названию, адресу, описанию и имени
+        мастера, найденные объявления получают поле score. near и radius_km -
+        объявления в радиусе от точки (GEO_FILTERS) с полем distance_km. sort - ключ
+        сортировки из ANNOUNCEMENT_SORT_KEYS, limit - размер страницы
+        (0 - без ограничения), after - значения ключей последнего
+        объявления предыдущей страницы (из decode_cursor), expand=('master',)
+        добавляет поле seller со сведениями о мастере
+        '''
         # Представление переданных параметров в словаре
         params = locals()
         del params['self']
-        # Начальный текст запроса
-        query = '''
-            MATCH (u:User)-[c:Create]->(a:Announcement)
-            WHERE toLower(a.name) CONTAINS toLower($name)
-            AND toLower(u.full_name) CONTAINS toLower($master)
-            AND a.width >= $width_min
-            AND a.height >= $height_min
-            AND a.length >= $length_min
-            AND a.weight >= $weight_min
-            AND a.amount >= $amount_min
-            AND a.price >= $price_min
-            AND toLower(a.address) CONTAINS toLower($address)
-        '''
-        if width_max != .0: query += ' AND a.width <= $width_max'
-        if height_max != .0: query += ' AND a.height <= $height_max'
-        if length_max != .0: query += ' AND a.length <= $length_max'
-        if weight_max != .0: query += ' AND a.weight <= $weight_max'
-        if amount_max != 0: query += ' AND a.amount <= $amount_max'
-        if price_max != .0: query += ' AND a.price <= $price_max'
-        query += ' RETURN a, u.login AS master, c.number AS number'
+        if self.snapshot is not None and self.snapshot.can_answer(params):
+            return self._get_announcements_by_snapshot(params)
+        query = announcements_query(params)
         with self.driver.session() as session:
             announcements = session.execute_read(
                 lambda tx: tx.run(query, **params).data()
             )
-        return [{**record['a'], 'master': record['master'], 'number': record['number']} for record in announcements]
+        return [announcement_record(record) for record in announcements]
+
+
+    def _get_announcements_by_snapshot(self, params: dict) -> list:
+        '''Страница списка объявлений по снимку каталога: фильтры и сортировка
+        считаются в памяти, из Neo4j загружаются только объявления страницы'''
+        keys = self.snapshot.query(params)
+        if not keys:
+            return []
+        with self.driver.session() as session:
+            records = session.execute_read(
+                lambda tx: tx.run(
+                    announcements_by_key_query(params['expand']),
+                    keys=[{'login': login, 'number': number} for login, number in keys]
+                ).data()
+            )
+        # Объявления, удалённые в обход снимка, пропускаются
+        found = {(record['master'], record['number']): record for record in records}
+        return [announcement_record(found[key]) for key in keys if key in found]
+
+
+    def count_announcements(self, **filters) -> int:
+        '''Количество объявлений, подходящих под фильтры get_announcements'''
+        params = {**ANNOUNCEMENT_FILTERS, **GEO_FILTERS, **filters}
+        if self.snapshot is not None and self.snapshot.can_answer(params):
+            return self.snapshot.count(params)
+        query = count_announcements_query(params)
+        with self.driver.session() as session:
+            result = session.execute_read(
+                lambda tx: tx.run(query, **params).single()
+            )
+        return result['total']
+
+
+    def get_facets(self, buckets: int = FACET_BUCKETS, **filters) -> dict:
+        '''Фасеты каталога по фильтрам get_announcements (см. facets_record).
+
+        Результат кэшируется по нормализованным фильтрам до изменения
+        объявлений или имён мастеров
+        '''
+        key = (self.facets_generation, *facets_cache_key(filters, buckets))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        params = {**ANNOUNCEMENT_FILTERS, **GEO_FILTERS, **filters, 'buckets': buckets}
+        query = facets_query(params)
+        with self.driver.session() as session:
+            record = session.execute_read(
+                lambda tx: tx.run(query, **params).single()
+            )
+        facets = facets_record(record, buckets)
+        self.cache.set(key, facets)
+        return facets
 
 
     def edit_announcement(self, 
@@ -230,40 +1060,63 @@ class DatabaseManager(DatabaseConnection):
             description, photo_url
     ) -> bool:
         '''Редактирование существубщего объявления'''
-        # Проверка пользователя на существование
-        if not self.get_announcement(login, number):
-            return False
         with self.driver.session() as session:
-            session.execute_write(
+            edited = session.execute_write(
                 lambda tx: tx.run(
                     '''MATCH (:User {login: $login})-[:Create {number: $number}]->(a:Announcement)
                        SET a.name = $name, a.width = $width, a.height = $height, 
                            a.length = $length, a.weight = $weight, a.amount = $amount, 
                            a.price = $price, a.updated_at = datetime(), a.address = $address, 
-                           a.description = $description, a.photo_url = $photo_url''',
+                           a.location = $location,
+                           a.description = $description, a.photo_url = $photo_url
+                       RETURN true AS edited''',
                     login=login, number=number, name=name, 
                     width=width, height=height, length=length, 
                     weight=weight, amount=amount, price=price, 
-                    address=address, description=description,
-                    photo_url=photo_url
-                )
+                    address=address, location=self.geocoder.locate(address),
+                    description=description, photo_url=photo_url
+                ).single()
             )
-        return True
+        self.cache.delete(('announcement', login, number))
+        self.facets_generation += 1
+        if edited is not None and self.snapshot is not None:
+            # Время создания и имя мастера не меняются и сохраняются в снимке
+            self.snapshot.upsert({
+                'login': login, 'number': number, 'name': name, 'address': address,
+                'width': width, 'height': height, 'length': length,
+                'weight': weight, 'amount': amount, 'price': price
+            })
+        return edited is not None
 
 
     def delete_announcement(self, login: str, number: int) -> bool:
-        '''Удаление объявления'''
-        if not self.get_announcement(login, number):
-            return False
+        '''Удаление объявления вместе с отзывами о нём, как при применении
+        его отметки об удалении из инкрементального бэкапа'''
         with self.driver.session() as session:
-            session.execute_write(
+            result = session.execute_write(
                 lambda tx: tx.run(
                     '''MATCH (:User {login: $login})-[:Create {number: $number}]->(a:Announcement)
-                       DETACH DELETE a''',
+                       OPTIONAL MATCH (f:Feedback)-[:About]->(a)
+                       WITH a, collect(f) AS feedback
+                       WITH a, feedback, [f IN feedback WHERE f.uid IS NOT NULL | f.uid] AS uids
+                       FOREACH (f IN feedback | DETACH DELETE f)
+                       DETACH DELETE a
+                       // Отметки об удалении для инкрементального бэкапа
+                       CREATE (:Tombstone {
+                           entity: 'announcement', login: $login,
+                           number: $number, deleted_at: datetime()
+                       })
+                       WITH uids
+                       ''' + FEEDBACK_TOMBSTONES + '''
+                       RETURN true AS deleted''',
                     login=login, number=number
-                )
+                ).single()
             )
-        return True
+        self.cache.delete(('announcement', login, number))
+        self.facets_generation += 1
+        if self.snapshot is not None:
+            self.snapshot.remove(login, number)
+        return result is not None
 
 
     def get_feedback_user_user(self,
@@ -292,24 +1145,28 @@ class DatabaseManager(DatabaseConnection):
             estimation: int
     ) -> bool:
         '''Создание отзыва с оценкой о пользователе'''
-        if not self.user_exists(sender_login) or not self.user_exists(recipient_login):
-            return False
-        # Создание нового отзыва
+        # Отзыв создаётся, только если найдены оба пользователя
         with self.driver.session() as session:
-            session.execute_write(
+            created = session.execute_write(
                 lambda tx: tx.run(
                     '''MATCH (u1:User {login: $login1}),
-                    (u2:User {login: $login2})
+                    (u:User {login: $login2})
                     CREATE (u1)-[:Make]->
-                        (:Feedback {text: $text})
-                        -[:About {estimation: $estimation}]->(u2)''',
+                        (:Feedback {text: $text, uid: randomUUID(), created_at: datetime()})
+                        -[:About {estimation: $estimation}]->(u)
+                    WITH u, [$estimation] AS estimations
+                    ''' + UPDATE_RATING + '''
+                    RETURN true AS created''',
                     login1=sender_login,
                     login2=recipient_login,
                     text=text,
-                    estimation=estimation
-                )
+                    estimation=estimation,
+                    sign=1
+                ).single()
             )
-        return True
+        # Агрегаты оценок входят в профиль получателя
+        self.cache.delete(('user', recipient_login))
+        return created is not None
 
 
     def delete_user_feedback(self,
@@ -317,20 +1174,24 @@ class DatabaseManager(DatabaseConnection):
             recipient_login: str
     ) -> bool:
         '''Удаление отзыва о пользователе'''
-        if self.get_feedback_user_user(sender_login, recipient_login) is None:
-            return False
         with self.driver.session() as session:
-            session.execute_write(
+            result = session.execute_write(
                 lambda tx: tx.run(
                     '''MATCH (:User {login: $login1})
-                             -[:Make]->(f:Feedback)-[:About]->
-                             (:User {login: $login2})
-                        DETACH DELETE f''',
+                             -[:Make]->(f:Feedback)-[a:About]->
+                             (u:User {login: $login2})
+                        WITH u, f, a.estimation AS estimation, f.uid AS uid
+                        DETACH DELETE f
+                        WITH u, collect(estimation) AS estimations, collect(uid) AS uids
+                        ''' + FEEDBACK_TOMBSTONES + UPDATE_RATING + '''
+                        RETURN size(estimations) AS deleted''',
                     login1=sender_login,
-                    login2=recipient_login
-                )
+                    login2=recipient_login,
+                    sign=-1
+                ).single()
             )
-        return True
+        self.cache.delete(('user', recipient_login))
+        return result is not None
 
 
     def get_feedback_user_announcement(self,
@@ -361,22 +1222,24 @@ class DatabaseManager(DatabaseConnection):
             number: int
     ) -> bool:
         '''Удаление отзыва об объявлении'''
-        if self.get_feedback_user_announcement(sender_login, master_login, number) is None:
-            return False
         with self.driver.session() as session:
-            session.execute_write(
+            result = session.execute_write(
                 lambda tx: tx.run(
                     '''MATCH (:User {login: $login1})-[:Create {number: $number}]->(a:Announcement)
                        MATCH (:User {login: $login2})
                              -[:Make]->(f:Feedback)-[:About]->
                              (a)
-                       DETACH DELETE f''',
+                       WITH f, f.uid AS uid
+                       DETACH DELETE f
+                       WITH collect(uid) AS uids
+                       ''' + FEEDBACK_TOMBSTONES + '''
+                       RETURN size(uids) AS deleted''',
                     login1=master_login,
                     number=number,
                     login2=sender_login
-                )
+                ).single()
             )
-        return True
+        return result['deleted'] > 0
 
 
     def create_announcement_feedback(self,
@@ -386,25 +1249,153 @@ class DatabaseManager(DatabaseConnection):
             text: str
     ) -> bool:
         '''Создание комментария об объявлении'''
-        if (not self.user_exists(sender_login) or 
-            self.get_announcement(master_login, number) is None):
-            return False
-        # Создание нового комментария
+        # Комментарий создаётся, только если найдены автор и объявление
         with self.driver.session() as session:
-            session.execute_write(
+            created = session.execute_write(
                 lambda tx: tx.run(
                     '''MATCH (u:User {login: $login1}),
                     (:User {login: $login2})-[c:Create {number: $number}]->(a:Announcement)
                     CREATE (u)-[:Make]->
-                        (:Feedback {text: $text})
-                        -[:About]->(a)''',
+                        (:Feedback {text: $text, uid: randomUUID(), created_at: datetime()})
+                        -[:About]->(a)
+                    RETURN true AS created''',
                     login1=sender_login,
                     login2=master_login,
                     number=number,
                     text=text
-                )
+                ).single()
             )
-        return True
+        return created is not None
+
+
+    def create_announcements(self, announcements: list) -> list:
+        '''Пакетное создание объявлений (поля как у create_announcement).
+
+        Номера объявлений каждого мастера выделяются подряд под блокировкой
+        мастера. Возвращает результат для каждого элемента: index, created
+        и number при успехе или error при ошибке
+        '''
+        results = self._bulk_write(
+            announcements, ANNOUNCEMENT_SCHEMA,
+            '''UNWIND $rows AS row
+            WITH row.login AS login, collect(row) AS items
+            MATCH (u:User {login: login})
+            SET u._lock = true
+            REMOVE u._lock
+            WITH u, items
+            OPTIONAL MATCH (u)-[old:Create]->(:Announcement)
+            WITH u, items, coalesce(max(old.number), 0) AS base
+            UNWIND range(0, size(items) - 1) AS i
+            WITH u, items[i] AS item, base + i + 1 AS number
+            CREATE (u)-[:Create {number: number}]->(a:Announcement)
+            SET a = item.properties, a.created_at = datetime(), a.updated_at = datetime()
+            RETURN item.index AS index, number''',
+            lambda item: {
+                'login': item['login'],
+                'properties': {
+                    'name': item['name'], 'width': item['width'],
+                    'height': item['height'], 'length': item['length'],
+                    'weight': item['weight'], 'amount': item['amount'],
+                    'price': item['price'], 'address': item['address'],
+                    'location': self.geocoder.locate(item['address']),
+                    'description': item.get('description', ''),
+                    'photo_url': item.get('photo_url', 'no_photo.png')
+                }
+            },
+            'Пользователь не найден'
+        )
+        self.facets_generation += 1
+        if self.snapshot is not None:
+            self._refresh_snapshot([
+                (announcements[result['index']]['login'], result['number'])
+                for result in results if result.get('created')
+            ])
+        return results
+
+
+    def create_user_feedbacks(self, feedbacks: list) -> list:
+        '''Пакетное создание отзывов о пользователях (поля как у create_user_feedback)'''
+        results = self._bulk_write(
+            feedbacks, USER_FEEDBACK_SCHEMA,
+            '''UNWIND $rows AS row
+            MATCH (u1:User {login: row.sender_login}),
+                (u:User {login: row.recipient_login})
+            CREATE (u1)-[:Make]->
+                (:Feedback {text: row.text, uid: randomUUID(), created_at: datetime()})
+                -[:About {estimation: row.estimation}]->(u)
+            WITH u, collect(row.estimation) AS estimations, collect(row.index) AS indexes
+            ''' + UPDATE_RATING + '''
+            WITH indexes
+            UNWIND indexes AS index
+            RETURN index''',
+            lambda item: {
+                'sender_login': item['sender_login'],
+                'recipient_login': item['recipient_login'],
+                'text': item['text'],
+                'estimation': item['estimation']
+            },
+            'Пользователь не найден',
+            sign=1
+        )
+        for result in results:
+            if result['created']:
+                self.cache.delete(('user', feedbacks[result['index']]['recipient_login']))
+        return results
+
+
+    def create_announcement_feedbacks(self, feedbacks: list) -> list:
+        '''Пакетное создание комментариев (поля как у create_announcement_feedback)'''
+        return self._bulk_write(
+            feedbacks, ANNOUNCEMENT_FEEDBACK_SCHEMA,
+            '''UNWIND $rows AS row
+            MATCH (u:User {login: row.sender_login}),
+                (:User {login: row.master_login})
+                -[:Create {number: row.number}]->(a:Announcement)
+            CREATE (u)-[:Make]->
+                (:Feedback {text: row.text, uid: randomUUID(), created_at: datetime()})
+                -[:About]->(a)
+            RETURN row.index AS index''',
+            lambda item: {
+                'sender_login': item['sender_login'],
+                'master_login': item['master_login'],
+                'number': item['number'],
+                'text': item['text']
+            },
+            'Объявление не найдено'
+        )
+
+
+    def _bulk_write(self,
+            items: list, schema: dict, query: str,
+            to_row, not_found: str, **params
+    ) -> list:
+        '''Общая часть пакетной записи.
+
+        Элементы проверяются по schema, корректные преобразуются to_row
+        и записываются частями по BULK_CHUNK_SIZE строк запросом query,
+        который получает $rows и возвращает index записанных строк.
+        Незаписанные корректные элементы получают ошибку not_found
+        '''
+        results = [None] * len(items)
+        rows = []
+        for index, item in enumerate(items):
+            error = validate_item(item, schema)
+            if error:
+                results[index] = {'index': index, 'created': False, 'error': error}
+            else:
+                rows.append({'index': index, **to_row(item)})
+        with self.driver.session() as session:
+            for start in range(0, len(rows), BULK_CHUNK_SIZE):
+                chunk = rows[start:start + BULK_CHUNK_SIZE]
+                records = session.execute_write(
+                    lambda tx: tx.run(query, rows=chunk, **params).data()
+                )
+                for record in records:
+                    results[record['index']] = {'created': True, **record}
+        return [
+            result or {'index': index, 'created': False, 'error': not_found}
+            for index, result in enumerate(results)
+        ]
 
 
     def get_user_feedback(self, login: str) -> list:
@@ -413,13 +1404,7 @@ class DatabaseManager(DatabaseConnection):
             return None
         with self.driver.session() as session:
             feedback = session.execute_read(
-                lambda tx: tx.run(
-                    '''MATCH (u:User)-[:Make]->(f:Feedback)-[a:About]->(:User {login: $login})
-                    RETURN f.text AS text, 
-                        a.estimation AS estimation,
-                        u.login AS author''',
-                    login=login
-                ).data()
+                lambda tx: tx.run(USER_FEEDBACK_QUERY, login=login).data()
             )
         if feedback is not None:
             return feedback
@@ -433,15 +1418,7 @@ class DatabaseManager(DatabaseConnection):
         with self.driver.session() as session:
             feedback = session.execute_read(
                 lambda tx: tx.run(
-                    '''
-                    MATCH (:User {login: $login})
-                        -[:Create {number: $number}]->
-                        (a:Announcement)
-                    MATCH (u:User)-[:Make]->(f:Feedback)-[:About]->(a)
-                    RETURN f.text AS text,
-                        u.login AS author''',
-                    login=login,
-                    number=number
+                    ANNOUNCEMENT_FEEDBACK_QUERY, login=login, number=number
                 ).data()
             )
         if feedback is not None:
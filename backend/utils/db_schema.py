@@ -0,0 +1,109 @@
+import time
+
+from .db_main import DatabaseConnection
+
+
+# Ограничения и индексы, необходимые для работы сервиса.
+# Все запросы идемпотентны благодаря IF NOT EXISTS
+SCHEMA = [
+    # Уникальность логина, одновременно индекс для MATCH (u:User {login: $login})
+    '''CREATE CONSTRAINT user_login_unique IF NOT EXISTS
+       FOR (u:User) REQUIRE u.login IS UNIQUE''',
+    # Поиск объявления по номеру внутри связи (:User)-[:Create {number}]->
+    '''CREATE INDEX create_number IF NOT EXISTS
+       FOR ()-[c:Create]-() ON (c.number)''',
+    # Диапазонные индексы для числовых фильтров каталога
+    '''CREATE RANGE INDEX announcement_width IF NOT EXISTS
+       FOR (a:Announcement) ON (a.width)''',
+    '''CREATE RANGE INDEX announcement_height IF NOT EXISTS
+       FOR (a:Announcement) ON (a.height)''',
+    '''CREATE RANGE INDEX announcement_length IF NOT EXISTS
+       FOR (a:Announcement) ON (a.length)''',
+    '''CREATE RANGE INDEX announcement_weight IF NOT EXISTS
+       FOR (a:Announcement) ON (a.weight)''',
+    '''CREATE RANGE INDEX announcement_amount IF NOT EXISTS
+       FOR (a:Announcement) ON (a.amount)''',
+    '''CREATE RANGE INDEX announcement_price IF NOT EXISTS
+       FOR (a:Announcement) ON (a.price)''',
+    # Сортировка и курсоры списка объявлений по умолчанию
+    '''CREATE RANGE INDEX announcement_created_at IF NOT EXISTS
+       FOR (a:Announcement) ON (a.created_at)''',
+    # Поиск объявлений в радиусе от точки (near, radius_km)
+    '''CREATE POINT INDEX announcement_location IF NOT EXISTS
+       FOR (a:Announcement) ON (a.location)''',
+    # Выборка изменений для инкрементального бэкапа
+    '''CREATE CONSTRAINT feedback_uid_unique IF NOT EXISTS
+       FOR (f:Feedback) REQUIRE f.uid IS UNIQUE''',
+    '''CREATE RANGE INDEX user_updated_at IF NOT EXISTS
+       FOR (u:User) ON (u.updated_at)''',
+    '''CREATE RANGE INDEX announcement_updated_at IF NOT EXISTS
+       FOR (a:Announcement) ON (a.updated_at)''',
+    '''CREATE RANGE INDEX feedback_created_at IF NOT EXISTS
+       FOR (f:Feedback) ON (f.created_at)''',
+    '''CREATE RANGE INDEX tombstone_deleted_at IF NOT EXISTS
+       FOR (t:Tombstone) ON (t.deleted_at)''',
+    # Адреса, которые геокодер не нашёл (ensure_announcement_locations)
+    '''CREATE CONSTRAINT geocode_miss_unique IF NOT EXISTS
+       FOR (m:GeocodeMiss) REQUIRE m.address IS UNIQUE''',
+    # Полнотекстовый поиск по объявлениям и именам мастеров
+    '''CREATE FULLTEXT INDEX announcement_search IF NOT EXISTS
+       FOR (a:Announcement) ON EACH [a.name, a.address, a.description]''',
+    '''CREATE FULLTEXT INDEX master_search IF NOT EXISTS
+       FOR (u:User) ON EACH [u.full_name]''',
+]
+
+
+class DatabaseSchema(DatabaseConnection):
+    '''Создание и проверка ограничений и индексов базы данных'''
+
+    def apply(self) -> None:
+        '''Создание всех ограничений и индексов (повторный вызов безопасен)'''
+        # Изменения схемы нельзя смешивать в одной транзакции,
+        # поэтому каждый запрос выполняется отдельно
+        with self.driver.session() as session:
+            for query in SCHEMA:
+                session.run(query).consume()
+
+
+    def get_index_states(self) -> list:
+        '''Состояние всех индексов: имя, тип, сущность, свойства, статус и прогресс'''
+        with self.driver.session() as session:
+            indexes = session.execute_read(
+                lambda tx: tx.run(
+                    '''SHOW INDEXES
+                    YIELD name, type, entityType, labelsOrTypes,
+                          properties, state, populationPercent
+                    RETURN name, type, entityType, labelsOrTypes,
+                           properties, state, populationPercent
+                    ORDER BY name'''
+                ).data()
+            )
+        return indexes
+
+
+    def is_online(self) -> bool:
+        '''Проверка, что все индексы построены и доступны'''
+        return all(index['state'] == 'ONLINE' for index in self.get_index_states())
+
+
+    def wait_online(self, timeout: float = 300, interval: float = 1) -> bool:
+        '''Ожидание перехода всех индексов в состояние ONLINE'''
+        deadline = time.monotonic() + timeout
+        while True:
+            indexes = self.get_index_states()
+            # Индекс в состоянии FAILED не станет доступным без вмешательства
+            if any(index['state'] == 'FAILED' for index in indexes):
+                return False
+            if all(index['state'] == 'ONLINE' for index in indexes):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+
+
+if __name__ == '__main__':
+    schema = DatabaseSchema()
+    schema.apply()
+    schema.wait_online()
+    for index in schema.get_index_states():
+        print(f"{index['name']}: {index['state']} ({index['populationPercent']}%)")
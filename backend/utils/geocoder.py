@@ -0,0 +1,78 @@
+import abc
+import json
+import os
+
+from neo4j.spatial import WGS84Point
+
+
+# Таблица городов, используемая, если GEOCODER_TABLE не задана
+CITIES_TABLE = os.path.join(os.path.dirname(__file__), 'geocoder_cities.json')
+
+
+class Geocoder(abc.ABC):
+    '''Интерфейс геокодера: определение координат по адресу объявления.
+
+    Внешний сервис геокодирования должен реализовать тот же метод
+    '''
+
+    @abc.abstractmethod
+    def geocode(self, address: str) -> tuple:
+        '''Пара (широта, долгота) или None, если адрес не найден'''
+
+
+    def locate(self, address: str) -> WGS84Point:
+        '''Точка для свойства Announcement.location или None, в том числе
+        для пустого адреса и адреса не строкой'''
+        coordinates = self.geocode(address) if isinstance(address, str) and address else None
+        if coordinates is None:
+            return None
+        latitude, longitude = coordinates
+        return WGS84Point((longitude, latitude))
+
+
+class NullGeocoder(Geocoder):
+    '''Отключённый геокодер: адреса не определяются'''
+
+    def geocode(self, address: str) -> tuple:
+        return None
+
+
+class TableGeocoder(Geocoder):
+    '''Офлайн-геокодер по таблице адрес -> (широта, долгота).
+
+    Адрес ищется целиком, затем всё более короткими началами до запятой,
+    поэтому строка таблицы "москва" подходит и для "Москва, ул. Ленина, 1".
+    Регистр и лишние пробелы не учитываются
+    '''
+
+    def __init__(self, table: dict):
+        self.table = {_normalize(address): tuple(point) for address, point in table.items()}
+
+
+    @classmethod
+    def from_file(cls, path: str) -> 'TableGeocoder':
+        '''Таблица из JSON-файла вида {"адрес": [широта, долгота]}'''
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+
+    def geocode(self, address: str) -> tuple:
+        parts = [part.strip() for part in _normalize(address).split(',')]
+        for end in range(len(parts), 0, -1):
+            point = self.table.get(', '.join(parts[:end]))
+            if point is not None:
+                return point
+        return None
+
+
+def default_geocoder() -> Geocoder:
+    '''Геокодер по переменной окружения GEOCODER_TABLE (путь к таблице,
+    off - отключён), по умолчанию - таблица крупных городов'''
+    path = os.environ.get('GEOCODER_TABLE', CITIES_TABLE)
+    if path == 'off':
+        return NullGeocoder()
+    return TableGeocoder.from_file(path)
+
+
+def _normalize(address: str) -> str:
+    return ' '.join(address.lower().replace('ё', 'е').split())
@@ -0,0 +1,72 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from neo4j.time import DateTime
+
+from .utils import dumps
+
+
+def validators(version: list, variant: bytes = b'') -> tuple:
+    '''Заголовки ETag и Last-Modified по версии данных.
+
+    variant - то, от чего ещё зависит ответ (например, строка запроса).
+    ETag слабый, так как тело может по-разному сжиматься; Last-Modified -
+    самое позднее время в версии или None, если времён в ней нет
+    '''
+    digest = hashlib.sha1(dumps(version).encode() + b'\0' + variant).hexdigest()
+    times = [_to_utc(value) for value in _flatten(version) if isinstance(value, (DateTime, datetime))]
+    return f'W/"{digest}"', max(times) if times else None
+
+
+def is_not_modified(headers, etag: str, last_modified: datetime) -> bool:
+    '''Проверка условного запроса: If-None-Match, а без него If-Modified-Since'''
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(',')}
+        # Сравнение слабое: W/"x" и "x" совпадают
+        return '*' in tags or _weak(etag) in {_weak(tag) for tag in tags}
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # Last-Modified передаётся с точностью до секунды
+    return last_modified.replace(microsecond=0) <= since
+
+
+def set_validators(headers, etag: str, last_modified: datetime) -> None:
+    '''Запись ETag и Last-Modified в заголовки ответа.
+
+    Cache-Control: no-cache разрешает хранить ответ, но требует
+    проверять его перед каждым использованием
+    '''
+    headers['ETag'] = etag
+    if last_modified is not None:
+        headers['Last-Modified'] = format_datetime(last_modified, usegmt=True)
+    headers['Cache-Control'] = 'no-cache'
+
+
+def _weak(tag: str) -> str:
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def _flatten(values):
+    for value in values:
+        if isinstance(value, list):
+            yield from _flatten(value)
+        else:
+            yield value
+
+
+def _to_utc(value) -> datetime:
+    '''Время в UTC, время без пояса считается UTC'''
+    if isinstance(value, DateTime):
+        value = value.to_native()
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
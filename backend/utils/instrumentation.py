@@ -0,0 +1,352 @@
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Запросы дольше этого времени в секундах (по данным сервера) попадают в лог
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0.5))
+# Заголовок Server-Timing с временем обращений к БД в каждом ответе
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+# Границы корзин гистограмм в секундах
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Метод DatabaseManager, выполняющийся сейчас, - метка запросов Cypher
+_current_call = contextvars.ContextVar('current_call', default='other')
+# Время обращений к БД в текущем HTTP-запросе для Server-Timing
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    '''Гистограмма Prometheus с метками'''
+
+    def __init__(self, name: str, help: str, labels: tuple, buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+
+    def observe(self, value: float, *labels) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+
+    def render(self) -> list:
+        '''Строки текстового формата Prometheus'''
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(b), s, c) for labels, (b, s, c) in self._series.items()}
+        for labels, (buckets, total, count) in sorted(series.items()):
+            names = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, labels))
+            prefix = names + ',' if names else ''
+            for bound, value in zip(self.buckets, buckets):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {value}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{names}}} {total}')
+            lines.append(f'{self.name}_count{{{names}}} {count}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса',
+    ('route', 'method', 'status')
+)
+DB_CALL_SECONDS = Histogram(
+    'db_call_duration_seconds', 'Время вызова метода работы с БД', ('call',)
+)
+QUERY_AVAILABLE_SECONDS = Histogram(
+    'neo4j_query_available_seconds',
+    'Время до первой записи результата по данным сервера (result_available_after)',
+    ('call',)
+)
+QUERY_CONSUMED_SECONDS = Histogram(
+    'neo4j_query_consumed_seconds',
+    'Время получения всех записей по данным сервера (result_consumed_after)',
+    ('call',)
+)
+HISTOGRAMS = (REQUEST_SECONDS, DB_CALL_SECONDS, QUERY_AVAILABLE_SECONDS, QUERY_CONSUMED_SECONDS)
+
+
+def render_metrics(extra: dict = None) -> str:
+    '''Все гистограммы и дополнительные значения extra {имя: число}
+    в текстовом формате Prometheus'''
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for name, value in (extra or {}).items():
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def instrument_methods(cls):
+    '''Декоратор класса: замер времени всех открытых методов.
+
+    Время попадает в db_call_duration_seconds с меткой Класс.метод,
+    запросы Cypher внутри метода получают ту же метку
+    '''
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.isfunction(method):
+            continue
+        setattr(cls, name, _timed(method, f'{cls.__name__}.{name}'))
+    return cls
+
+
+def _timed(method, call: str):
+    # Вложенные вызовы (user_exists -> get_user) входят во время внешнего
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(*args, **kwargs):
+            if _current_call.get() != 'other':
+                return await method(*args, **kwargs)
+            token = _current_call.set(call)
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                _observe_call(call, time.perf_counter() - started)
+                _current_call.reset(token)
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if _current_call.get() != 'other':
+            return method(*args, **kwargs)
+        token = _current_call.set(call)
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _observe_call(call, time.perf_counter() - started)
+            _current_call.reset(token)
+    return wrapper
+
+
+def _observe_call(call: str, seconds: float) -> None:
+    DB_CALL_SECONDS.observe(seconds, call)
+    timings = _request_timings.get()
+    if timings is not None:
+        name = call.rpartition('.')[2]
+        total, count = timings.get(name, (0.0, 0))
+        timings[name] = (total + seconds, count + 1)
+
+
+def start_request() -> None:
+    '''Начало HTTP-запроса: сбор времени обращений к БД для Server-Timing'''
+    _request_timings.set({} if SERVER_TIMING else None)
+
+
+def finish_request(route: str, method: str, status: int, seconds: float, headers) -> None:
+    '''Конец HTTP-запроса: гистограмма и заголовок Server-Timing'''
+    REQUEST_SECONDS.observe(seconds, route, method, str(status))
+    timings = _request_timings.get()
+    if timings is None:
+        return
+    entries = [
+        f'{name};dur={total * 1000:.1f};desc="{count}"'
+        for name, (total, count) in timings.items()
+    ]
+    entries.append(f'app;dur={seconds * 1000:.1f}')
+    headers['Server-Timing'] = ', '.join(entries)
+
+
+def record_summary(summary) -> None:
+    '''Время выполнения запроса Cypher по сводке результата'''
+    if summary is None:
+        return
+    call = _current_call.get()
+    available = summary.result_available_after
+    consumed = summary.result_consumed_after
+    if available is not None:
+        QUERY_AVAILABLE_SECONDS.observe(available / 1000, call)
+    if consumed is not None:
+        QUERY_CONSUMED_SECONDS.observe(consumed / 1000, call)
+    total = ((available or 0) + (consumed or 0)) / 1000
+    if total >= SLOW_QUERY_SECONDS:
+        query = summary.query
+        text = query if isinstance(query, str) else getattr(query, 'text', str(query))
+        logger.warning('Медленный запрос в %s: %.3f с (до первой записи %s мс): %s',
+                       call, total, available, ' '.join(text.split())[:500])
+
+
+class InstrumentedDriver:
+    '''Обёртка драйвера neo4j: сводки всех запросов передаются в record_summary.
+
+    Методы .single() и .data() отбрасывают сводку, поэтому результаты,
+    полученные в функции транзакции, дочитываются через consume() перед
+    её завершением, а результаты session.run - при вызове consume()
+    '''
+
+    def __init__(self, driver):
+        self._driver = driver
+
+
+    def session(self, *args, **kwargs):
+        return _Session(self._driver.session(*args, **kwargs))
+
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+class _Session:
+    def __init__(self, session):
+        self._session = session
+
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+
+    def __exit__(self, *args):
+        return self._session.__exit__(*args)
+
+
+    def execute_read(self, work, *args, **kwargs):
+        return self._session.execute_read(_traced(work), *args, **kwargs)
+
+
+    def execute_write(self, work, *args, **kwargs):
+        return self._session.execute_write(_traced(work), *args, **kwargs)
+
+
+    def run(self, *args, **kwargs):
+        return _Result(self._session.run(*args, **kwargs))
+
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class _Transaction:
+    def __init__(self, tx):
+        self._tx = tx
+        self.results = []
+
+
+    def run(self, *args, **kwargs):
+        result = self._tx.run(*args, **kwargs)
+        self.results.append(result)
+        return result
+
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+
+def _traced(work):
+    @functools.wraps(work)
+    def wrapper(tx, *args, **kwargs):
+        traced = _Transaction(tx)
+        value = work(traced, *args, **kwargs)
+        for result in traced.results:
+            record_summary(result.consume())
+        return value
+    return wrapper
+
+
+class _Result:
+    def __init__(self, result):
+        self._result = result
+
+
+    def consume(self):
+        summary = self._result.consume()
+        record_summary(summary)
+        return summary
+
+
+    def __iter__(self):
+        return iter(self._result)
+
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+class InstrumentedAsyncDriver:
+    '''Асинхронный вариант InstrumentedDriver'''
+
+    def __init__(self, driver):
+        self._driver = driver
+
+
+    def session(self, *args, **kwargs):
+        return _AsyncSession(self._driver.session(*args, **kwargs))
+
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+class _AsyncSession:
+    def __init__(self, session):
+        self._session = session
+
+
+    async def __aenter__(self):
+        await self._session.__aenter__()
+        return self
+
+
+    async def __aexit__(self, *args):
+        return await self._session.__aexit__(*args)
+
+
+    async def execute_read(self, work, *args, **kwargs):
+        return await self._session.execute_read(_async_traced(work), *args, **kwargs)
+
+
+    async def execute_write(self, work, *args, **kwargs):
+        return await self._session.execute_write(_async_traced(work), *args, **kwargs)
+
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class _AsyncTransaction:
+    def __init__(self, tx):
+        self._tx = tx
+        self.results = []
+
+
+    async def run(self, *args, **kwargs):
+        result = await self._tx.run(*args, **kwargs)
+        self.results.append(result)
+        return result
+
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+
+def _async_traced(work):
+    @functools.wraps(work)
+    async def wrapper(tx, *args, **kwargs):
+        traced = _AsyncTransaction(tx)
+        value = await work(traced, *args, **kwargs)
+        for result in traced.results:
+            record_summary(await result.consume())
+        return value
+    return wrapper
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,120 @@
+import json
+import zlib
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _StreamReader:
+    '''Посимвольный разбор JSON из файла с подгрузкой по частям'''
+
+    def __init__(self, file, chunk_size: int):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+
+    def _fill(self) -> bool:
+        '''Чтение следующей части файла, прочитанное ранее отбрасывается'''
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+
+    def peek(self) -> str:
+        '''Следующий значащий символ (пустая строка в конце файла)'''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+
+    def expect(self, chars: str) -> str:
+        '''Чтение одного из ожидаемых символов-разделителей'''
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f'Ожидался один из символов {chars!r}, получено {char!r}')
+        self.pos += 1
+        return char
+
+
+    def value(self):
+        '''Чтение одного JSON-значения целиком'''
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buffer, self.pos)
+                # Число в конце буфера могло быть прочитано не полностью
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_json_items(file, chunk_size: int = 1 << 16):
+    '''Потоковое чтение JSON-объекта верхнего уровня.
+
+    Для каждого ключа, значением которого является массив, по одному
+    возвращаются пары (ключ, элемент), не загружая массив в память целиком.
+    Значения остальных типов пропускаются.
+    '''
+    reader = _StreamReader(file, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError('Ключ JSON-объекта должен быть строкой')
+        reader.expect(':')
+        if reader.peek() == '[':
+            reader.pos += 1
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    yield key, reader.value()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            reader.value()
+        if reader.expect(',}') == '}':
+            return
+
+
+def iter_ndjson_items(file):
+    '''Потоковое чтение NDJSON, где раздел записи хранится в поле section.
+
+    Возвращает пары (раздел, элемент) так же, как iter_json_items.
+    '''
+    for line in file:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if not isinstance(item, dict) or 'section' not in item:
+            raise ValueError('Строка NDJSON должна быть объектом с полем section')
+        yield item.pop('section'), item
+
+
+def iter_gzip(chunks, level: int = 6):
+    '''Потоковое сжатие текстовых частей в формат gzip'''
+    # wbits=31 - заголовок и контрольная сумма gzip
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
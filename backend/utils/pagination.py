@@ -0,0 +1,91 @@
+import base64
+import binascii
+import json
+
+from .utils import dumps
+
+
+# Выражения Cypher для ключей сортировки объявлений.
+# Даты хранятся только с часовым поясом (ensure_zoned_timestamps), поэтому
+# сортировка по created_at идёт по самому свойству и использует его индекс
+ANNOUNCEMENT_SORT_KEYS = {
+    'created_at': 'a.created_at',
+    'price': 'a.price',
+    'weight': 'a.weight',
+    # Релевантность полнотекстового поиска, только вместе с q
+    'relevance': 'score',
+    # Расстояние до точки near в километрах, только вместе с near
+    'distance': 'point.distance(a.location, point($near)) / 1000',
+}
+# Имена ключей сортировки, отличающиеся от имени сортировки (совпадают с полями ответа)
+_SORT_KEY_NAMES = {'relevance': 'score', 'distance': 'distance_km'}
+# Ключи, однозначно упорядочивающие объявления при равенстве основного
+ANNOUNCEMENT_TIE_KEYS = {
+    'created_at': 'a.created_at',
+    'master': 'u.login',
+    'number': 'c.number',
+}
+# Параметры запроса, значения которых нужно привести к datetime()
+_DATETIME_KEYS = ('created_at',)
+
+
+def announcement_keys(sort: str) -> list:
+    '''Список пар (ключ, выражение Cypher) для сортировки объявлений'''
+    keys = [(_SORT_KEY_NAMES.get(sort, sort), ANNOUNCEMENT_SORT_KEYS[sort])]
+    keys += [(key, expr) for key, expr in ANNOUNCEMENT_TIE_KEYS.items() if key != sort]
+    return keys
+
+
+def order_by(keys: list, descending: bool = False) -> str:
+    '''Текст ORDER BY для списка ключей'''
+    direction = ' DESC' if descending else ''
+    return 'ORDER BY ' + ', '.join(expr + direction for _, expr in keys)
+
+
+def keyset_condition(keys: list, descending: bool = False, param: str = 'after') -> str:
+    '''Условие "строго после курсора" для списка ключей.
+
+    Для ключей (k1, k2, k3) строится
+    k1 > $after.k1 OR (k1 = $after.k1 AND k2 > $after.k2) OR ...
+    '''
+    op = '<' if descending else '>'
+    clauses = []
+    for i, (key, expr) in enumerate(keys):
+        parts = [f'{prev_expr} = {_param(prev_key, param)}' for prev_key, prev_expr in keys[:i]]
+        parts.append(f'{expr} {op} {_param(key, param)}')
+        clauses.append('(' + ' AND '.join(parts) + ')')
+    return '(' + ' OR '.join(clauses) + ')'
+
+
+def _param(key: str, param: str) -> str:
+    if key in _DATETIME_KEYS:
+        return f'datetime(${param}.{key})'
+    return f'${param}.{key}'
+
+
+def encode_cursor(sort: str, descending: bool, item: dict, keys: list) -> str:
+    '''Непрозрачный курсор на элемент item'''
+    payload = {
+        'sort': sort,
+        'desc': descending,
+        'after': {key: item[key] for key, _ in keys},
+    }
+    # Даты neo4j записываются строками ISO 8601, как в ответе
+    data = dumps(payload)
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str, descending: bool, keys: list) -> dict:
+    '''Значения ключей из курсора, ValueError для некорректного курсора'''
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(data.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as error:
+        raise ValueError('Некорректный курсор') from error
+    if (not isinstance(payload, dict) or
+            payload.get('sort') != sort or payload.get('desc') != descending):
+        raise ValueError('Курсор получен для другой сортировки')
+    after = payload.get('after')
+    if not isinstance(after, dict) or any(key not in after for key, _ in keys):
+        raise ValueError('Некорректный курсор')
+    return after
@@ -0,0 +1,167 @@
+from .db_manager import (
+    ANNOUNCEMENT_FILTERS, ANNOUNCEMENT_EXPANSIONS, FEEDBACK_PAGE_SIZE, FACET_BUCKETS
+)
+from .pagination import (
+    ANNOUNCEMENT_SORT_KEYS, announcement_keys, decode_cursor, encode_cursor
+)
+
+
+# Максимальный размер страницы списка объявлений
+MAX_PAGE_SIZE = 1000
+# Максимальное число элементов пакетного получения
+MAX_BATCH_SIZE = 1000
+# Максимальный размер страницы отзывов, встроенных в объявление
+MAX_FEEDBACK_PAGE_SIZE = 100
+# Максимальное число интервалов гистограммы фасета
+MAX_FACET_BUCKETS = 50
+
+
+def parse_announcement_args(args) -> dict:
+    '''Фильтры, сортировка и страница списка объявлений из параметров запроса.
+
+    Возвращает словарь с ключами filters (аргументы фильтров get_announcements,
+    включая q, near и radius_km), sort, descending, limit, after, keys
+    и expand (только master для списка). При некорректных
+    параметрах выбрасывает ValueError с текстом ошибки для ответа
+    '''
+    filters = parse_announcement_filters(args)
+    # При полнотекстовом поиске по умолчанию сортируется по релевантности,
+    # при поиске рядом с точкой - по расстоянию
+    default_sort = ('relevance' if filters['q'] else
+                    'distance' if filters['near'] is not None else 'created_at')
+    sort = args.get('sort', default_sort)
+    if (sort not in ANNOUNCEMENT_SORT_KEYS or (sort == 'relevance' and not filters['q']) or
+            (sort == 'distance' and filters['near'] is None)):
+        raise ValueError('Некорректная сортировка')
+    order = args.get('order', 'desc' if sort == 'relevance' else 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError('Некорректный порядок сортировки')
+    descending = order == 'desc'
+    try:
+        limit = int(args.get('limit', 0))
+    except ValueError:
+        limit = -1
+    if limit < 0 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f'limit должен быть от 0 до {MAX_PAGE_SIZE}')
+    keys = announcement_keys(sort)
+    after = None
+    cursor = args.get('cursor')
+    if cursor:
+        after = decode_cursor(cursor, sort, descending, keys)
+    return {
+        'filters': filters, 'sort': sort, 'descending': descending,
+        'limit': limit, 'after': after, 'keys': keys,
+        'expand': parse_expand(args, ('master',))
+    }
+
+
+def parse_announcement_filters(args) -> dict:
+    '''Аргументы фильтров get_announcements (включая q, near и radius_km)
+    из параметров запроса, ValueError при ошибке'''
+    filters = {}
+    for filter, value in ANNOUNCEMENT_FILTERS.items():
+        filters[filter] = args.get(filter, default=value)
+        try:
+            filters[filter] = type(value)(filters[filter])
+        except (ValueError, TypeError):
+            raise ValueError(f'Некорректный тип данных {filter}')
+
+    filters['q'] = args.get('q', '').strip()
+    filters['near'] = parse_point(args.get('near', ''))
+    try:
+        filters['radius_km'] = float(args.get('radius_km', .0))
+    except ValueError:
+        raise ValueError('Некорректный тип данных radius_km')
+    if filters['radius_km'] < 0:
+        raise ValueError('radius_km не может быть отрицательным')
+    if filters['radius_km'] and filters['near'] is None:
+        raise ValueError('radius_km задаётся только вместе с near')
+    return filters
+
+
+def parse_facet_args(args) -> dict:
+    '''Фильтры (как у списка объявлений) и число интервалов buckets для фасетов'''
+    filters = parse_announcement_filters(args)
+    try:
+        buckets = int(args.get('buckets', FACET_BUCKETS))
+    except ValueError:
+        raise ValueError('Некорректный тип данных buckets')
+    if buckets < 1 or buckets > MAX_FACET_BUCKETS:
+        raise ValueError(f'buckets должен быть от 1 до {MAX_FACET_BUCKETS}')
+    return {'filters': filters, 'buckets': buckets}
+
+
+def parse_point(value: str) -> dict:
+    '''Точка из строки вида "широта,долгота" или None для пустой строки,
+    ValueError при ошибке'''
+    if not value:
+        return None
+    try:
+        latitude, longitude = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError('near должен иметь вид широта,долгота')
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError('Координаты near вне допустимого диапазона')
+    return {'latitude': latitude, 'longitude': longitude}
+
+
+def parse_expand(args, allowed=ANNOUNCEMENT_EXPANSIONS) -> tuple:
+    '''Связанные данные из параметра expand=master,feedback, ValueError при ошибке'''
+    expand = tuple(dict.fromkeys(
+        name.strip() for name in args.get('expand', '').split(',') if name.strip()
+    ))
+    for name in expand:
+        if name not in allowed:
+            raise ValueError(f'Некорректное значение expand: {name}')
+    return expand
+
+
+def parse_announcement_expand(args) -> dict:
+    '''Аргументы expand, feedback_limit и feedback_offset для get_announcement'''
+    expand = parse_expand(args)
+    try:
+        feedback_limit = int(args.get('feedback_limit', FEEDBACK_PAGE_SIZE))
+        feedback_offset = int(args.get('feedback_offset', 0))
+    except ValueError:
+        raise ValueError('Некорректный тип данных feedback_limit или feedback_offset')
+    if feedback_limit < 0 or feedback_limit > MAX_FEEDBACK_PAGE_SIZE:
+        raise ValueError(f'feedback_limit должен быть от 0 до {MAX_FEEDBACK_PAGE_SIZE}')
+    if feedback_offset < 0:
+        raise ValueError('feedback_offset не может быть отрицательным')
+    return {'expand': expand, 'feedback_limit': feedback_limit, 'feedback_offset': feedback_offset}
+
+
+def page_headers(query: dict, announcements: list) -> dict:
+    '''Заголовок X-Next-Cursor, если страница заполнена целиком'''
+    if query['limit'] and len(announcements) == query['limit']:
+        return {'X-Next-Cursor': encode_cursor(
+            query['sort'], query['descending'], announcements[-1], query['keys']
+        )}
+    return {}
+
+
+def parse_batch_logins(args) -> list:
+    '''Логины из повторяющегося параметра login, ValueError при ошибке'''
+    logins = args.getlist('login')
+    if not logins:
+        raise ValueError('Не переданы логины')
+    if len(logins) > MAX_BATCH_SIZE:
+        raise ValueError(f'Не больше {MAX_BATCH_SIZE} элементов за запрос')
+    return logins
+
+
+def parse_batch_announcement_keys(args) -> list:
+    '''Пары (логин мастера, номер) из повторяющегося параметра id вида
+    login/number, ValueError при ошибке'''
+    ids = args.getlist('id')
+    if not ids:
+        raise ValueError('Не переданы объявления')
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ValueError(f'Не больше {MAX_BATCH_SIZE} элементов за запрос')
+    keys = []
+    for id in ids:
+        login, _, number = id.rpartition('/')
+        if not login or not number.isnumeric():
+            raise ValueError(f'Некорректный идентификатор объявления {id}')
+        keys.append((login, int(number)))
+    return keys
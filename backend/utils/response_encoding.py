@@ -0,0 +1,157 @@
+import gzip
+import os
+import threading
+import time
+import zlib
+
+from flask.json.provider import DefaultJSONProvider
+
+from .utils import dumps_bytes
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Ответы меньше этого размера в байтах не сжимаются
+COMPRESS_MIN_SIZE = int(os.environ.get('RESPONSE_COMPRESS_MIN_SIZE', 1024))
+# Степень сжатия gzip (1-9) и brotli (0-11)
+GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', 5))
+# Типы содержимого, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+class EncodingMetrics:
+    '''Счётчики сериализации и сжатия ответов'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.serialize_seconds = 0.0
+        self.serialized_bytes = 0
+        self.compressed = {}
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+
+    def add_serialization(self, seconds: float, size: int) -> None:
+        with self._lock:
+            self.responses += 1
+            self.serialize_seconds += seconds
+            self.serialized_bytes += size
+
+
+    def add_compression(self, encoding: str, before: int, after: int) -> None:
+        with self._lock:
+            self.compressed[encoding] = self.compressed.get(encoding, 0) + 1
+            self.bytes_before += before
+            self.bytes_after += after
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'responses': self.responses,
+                'serialize_seconds': self.serialize_seconds,
+                'serialized_bytes': self.serialized_bytes,
+                'compressed': dict(self.compressed),
+                'bytes_before_compression': self.bytes_before,
+                'bytes_after_compression': self.bytes_after,
+                'bytes_saved': self.bytes_before - self.bytes_after,
+            }
+
+
+metrics = EncodingMetrics()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    '''JSON-провайдер Flask и Quart на utils.dumps_bytes.
+
+    Временные типы neo4j сериализуются без предварительного convert,
+    время сериализации и размер ответов попадают в metrics
+    '''
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps_bytes(obj).decode()
+
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        started = time.perf_counter()
+        body = dumps_bytes(obj)
+        metrics.add_serialization(time.perf_counter() - started, len(body))
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def choose_encoding(accept_encoding: str, supported=('br', 'gzip')) -> str:
+    '''Первое из supported сжатие, которое поддерживает клиент, или None'''
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    for encoding in supported:
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compressible(status: int, mimetype: str, headers) -> bool:
+    '''Имеет ли смысл сжимать ответ с такими статусом, типом и заголовками'''
+    return (200 <= status and status not in (204, 304) and
+            'Content-Encoding' not in headers and
+            (mimetype or '').startswith(COMPRESSIBLE_TYPES))
+
+
+def encode_body(body: bytes, accept_encoding: str) -> tuple:
+    '''Тело ответа и выбранное сжатие (None - без сжатия)'''
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None or len(body) < COMPRESS_MIN_SIZE:
+        return body, None
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    metrics.add_compression(encoding, len(body), len(compressed))
+    return compressed, encoding
+
+
+def compress_response(response, accept_encoding: str):
+    '''Сжатие готового ответа Flask, если клиент это поддерживает
+    и ответ достаточно большой. Потоковые ответы сжимает сам маршрут
+    '''
+    if (response.direct_passthrough or response.is_streamed or
+            not compressible(response.status_code, response.mimetype, response.headers)):
+        return response
+    response.vary.add('Accept-Encoding')
+    body, encoding = encode_body(response.get_data(), accept_encoding)
+    if encoding is not None:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def iter_gzip_counted(chunks):
+    '''Потоковое сжатие gzip текстовых частей с учётом в metrics'''
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    before = after = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        before += len(data)
+        data = compressor.compress(data)
+        if data:
+            after += len(data)
+            yield data
+    data = compressor.flush()
+    metrics.add_compression('gzip', before, after + len(data))
+    yield data
@@ -0,0 +1,26 @@
+import re
+
+
+# Специальные символы синтаксиса запросов Lucene
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+# Минимальная длина слова для нечёткого поиска
+FUZZY_MIN_LENGTH = 4
+
+
+def fulltext_query(text: str, prefix: bool = True, fuzzy: bool = True) -> str:
+    '''Запрос Lucene для полнотекстового индекса по строке пользователя.
+
+    Каждое слово ищется точно, по префиксу (опил -> опилки) и с опечатками
+    (опилкм -> опилки), документ должен содержать все слова.
+    Возвращает пустую строку, если в тексте нет слов.
+    '''
+    terms = []
+    for word in text.lower().split():
+        word = _LUCENE_SPECIAL.sub(r'\\\1', word)
+        variants = [word]
+        if prefix:
+            variants.append(word + '*')
+        if fuzzy and len(word) >= FUZZY_MIN_LENGTH:
+            variants.append(word + '~')
+        terms.append('(' + ' OR '.join(variants) + ')')
+    return ' AND '.join(terms)
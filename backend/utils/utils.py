@@ -1,32 +1,140 @@
-from neo4j.time import DateTime
+import json
 from datetime import datetime
 
+from neo4j.spatial import WGS84Point
+from neo4j.time import Date, DateTime, Duration, Time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Свойства узлов и отношений, хранящие дату и время.
+# Только они восстанавливаются из строк при загрузке бэкапа
+TEMPORAL_PROPERTIES = frozenset({'created_at', 'updated_at', 'deleted_at'})
+# Свойства, хранящие точку WGS 84; в JSON - {"latitude": ..., "longitude": ...}
+SPATIAL_PROPERTIES = frozenset({'location'})
+
+_TEMPORAL_TYPES = (Date, DateTime, Duration, Time)
+
 
 def convert(obj):
+    '''Замена временных типов neo4j строками ISO 8601, точек - словарями.
+
+    Словари и списки копируются, только если внутри есть что заменять,
+    иначе возвращается тот же объект
+    '''
     if isinstance(obj, dict):
-        return {k: convert(v) for k, v in obj.items()}
+        converted = None
+        for k, v in obj.items():
+            new = convert(v)
+            if new is not v:
+                if converted is None:
+                    converted = dict(obj)
+                converted[k] = new
+        return obj if converted is None else converted
     elif isinstance(obj, list):
-        return [convert(v) for v in obj]
-    elif isinstance(obj, DateTime):
+        converted = None
+        for i, v in enumerate(obj):
+            new = convert(v)
+            if new is not v:
+                if converted is None:
+                    converted = list(obj)
+                converted[i] = new
+        return obj if converted is None else converted
+    elif isinstance(obj, _TEMPORAL_TYPES):
         return obj.iso_format()
+    elif isinstance(obj, WGS84Point):
+        return _point_dict(obj)
     else:
         return obj
 
 
 def back_convert(obj):
+    '''Восстановление дат в свойствах из TEMPORAL_PROPERTIES
+    и точек в свойствах из SPATIAL_PROPERTIES.
+
+    Остальные строки не разбираются. Часовой пояс и наносекунды сохраняются:
+    даты с точностью до микросекунд возвращаются как datetime, который
+    драйвер записывает так же, как DateTime, более точные - как DateTime
+    '''
     if isinstance(obj, dict):
-        return {k: back_convert(v) for k, v in obj.items()}
+        return {
+            k: _parse_temporal(v) if k in TEMPORAL_PROPERTIES else
+            _parse_point(v) if k in SPATIAL_PROPERTIES else
+            back_convert(v) if isinstance(v, (dict, list)) else v
+            for k, v in obj.items()
+        }
     elif isinstance(obj, list):
-        return [back_convert(v) for v in obj]
-    elif isinstance(obj, str):
-        try:
-            dt = datetime.fromisoformat(obj)
-            return DateTime(
-                dt.year, dt.month, dt.day,
-                dt.hour, dt.minute, dt.second,
-                dt.microsecond * 1000
-            )
-        except ValueError:
-            return obj
+        return [back_convert(v) if isinstance(v, (dict, list)) else v for v in obj]
     else:
-        return obj
\ No newline at end of file
+        return obj
+
+
+def _parse_temporal(value):
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    # datetime хранит только микросекунды, наносекунды берутся из строки
+    dot = value.find('.', 19)
+    if dot < 0:
+        return parsed
+    end = dot + 1
+    while end < len(value) and value[end].isdigit():
+        end += 1
+    if end - dot - 1 <= 6:
+        return parsed
+    nanosecond = int(value[dot + 1:end][:9].ljust(9, '0'))
+    if nanosecond % 1000 == 0:
+        return parsed
+    return DateTime(
+        parsed.year, parsed.month, parsed.day,
+        parsed.hour, parsed.minute, parsed.second,
+        nanosecond, tzinfo=parsed.tzinfo
+    )
+
+
+def _parse_point(value):
+    if (isinstance(value, dict) and
+            isinstance(value.get('latitude'), (int, float)) and
+            isinstance(value.get('longitude'), (int, float))):
+        return WGS84Point((value['longitude'], value['latitude']))
+    return value
+
+
+def _point_dict(point: WGS84Point) -> dict:
+    return {'latitude': point.latitude, 'longitude': point.longitude}
+
+
+def json_default(obj):
+    '''Сериализация значений, которые JSON-кодировщик не знает'''
+    if isinstance(obj, _TEMPORAL_TYPES):
+        return obj.iso_format()
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, WGS84Point):
+        return _point_dict(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps_bytes(obj) -> bytes:
+    '''JSON в UTF-8 без предварительного копирования данных через convert.
+
+    Используется orjson, если он установлен, иначе стандартный json.
+    Стандартный json пишет WGS84Point (подкласс tuple) списком, не вызывая
+    json_default, поэтому для него данные сначала проходят через convert
+    '''
+    if orjson is not None:
+        return orjson.dumps(obj, default=json_default)
+    return json.dumps(convert(obj), default=json_default, ensure_ascii=False).encode('utf-8')
+
+
+def dumps(obj) -> str:
+    '''JSON-строка, как dumps_bytes'''
+    if orjson is not None:
+        return orjson.dumps(obj, default=json_default).decode()
+    return json.dumps(convert(obj), default=json_default, ensure_ascii=False)
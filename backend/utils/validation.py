@@ -0,0 +1,60 @@
+# Допустимые типы полей; bool исключается отдельно, так как это подкласс int
+NUMBER = (int, float)
+INTEGER = (int,)
+STRING = (str,)
+# Оценки в отзывах о пользователях: целые от 1 до RATING_SCALE
+RATING_SCALE = 5
+
+# Обязательные и необязательные поля элементов пакетной записи
+# и допустимые диапазоны (включительно) числовых полей
+ANNOUNCEMENT_SCHEMA = {
+    'required': {
+        'login': STRING, 'name': STRING, 'width': NUMBER, 'height': NUMBER,
+        'length': NUMBER, 'weight': NUMBER, 'amount': INTEGER, 'price': NUMBER,
+        'address': STRING
+    },
+    'optional': {'description': STRING, 'photo_url': STRING},
+}
+USER_FEEDBACK_SCHEMA = {
+    'required': {
+        'sender_login': STRING, 'recipient_login': STRING,
+        'text': STRING, 'estimation': INTEGER
+    },
+    'optional': {},
+    'ranges': {'estimation': (1, RATING_SCALE)},
+}
+ANNOUNCEMENT_FEEDBACK_SCHEMA = {
+    'required': {
+        'sender_login': STRING, 'master_login': STRING,
+        'number': INTEGER, 'text': STRING
+    },
+    'optional': {},
+}
+
+
+def validate_item(item, schema: dict) -> str:
+    '''Текст ошибки для элемента пакета или None, если элемент корректен'''
+    if not isinstance(item, dict):
+        return 'Элемент должен быть объектом'
+    for field, types in schema['required'].items():
+        if field not in item:
+            return f'Не хватает поля {field}'
+        if not _is_instance(item[field], types):
+            return f'Некорректный тип данных {field}'
+    for field, types in schema['optional'].items():
+        if field in item and not _is_instance(item[field], types):
+            return f'Некорректный тип данных {field}'
+    for field, (low, high) in schema.get('ranges', {}).items():
+        if field in item and not low <= item[field] <= high:
+            return f'Значение {field} должно быть от {low} до {high}'
+    return None
+
+
+def is_estimation(value) -> bool:
+    '''Корректность оценки отзыва: иначе агрегаты оценок мастера
+    (сумма и гистограмма) испортятся'''
+    return _is_instance(value, INTEGER) and 1 <= value <= RATING_SCALE
+
+
+def _is_instance(value, types: tuple) -> bool:
+    return isinstance(value, types) and not isinstance(value, bool)
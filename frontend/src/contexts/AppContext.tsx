@@ -64,6 +64,7 @@ export const AppProvider = ({ children }: { children: ReactNode }) => {
   };
 
   const logout = () => {
+    apiService.logout();
     setUser(null);
     toast({
       title: 'Выход из системы',
@@ -2,6 +2,13 @@ import { User, ListingItem, Comment, Review } from "@/types";
 
 const API_URL = 'http://localhost:5000/api';
 
+// Токен сессии из ответа на вход; хранится, пока открыта страница
+let sessionToken: string | null = null;
+
+// Заголовок Authorization для запросов, требующих входа
+const authHeaders = (): Record<string, string> =>
+  sessionToken ? { Authorization: `Bearer ${sessionToken}` } : {};
+
 // Преобразование данных пользователя из API в формат приложения
 const mapUserFromApi = (userData: any): User => {
   let userType = 'Покупатель';
@@ -66,13 +73,30 @@ export const apiService = {
         throw new Error('Ошибка авторизации');
       }
       
-      return await response.json();
+      const data = await response.json();
+      sessionToken = data.token || null;
+      return data;
     } catch (error) {
       console.error('Ошибка входа:', error);
       throw error;
     }
   },
   
+  // Выход: токен отзывается на сервере и забывается
+  logout: async () => {
+    if (!sessionToken) return;
+    try {
+      await fetch(`${API_URL}/logout/`, {
+        method: 'POST',
+        headers: authHeaders(),
+      });
+    } catch (error) {
+      console.error('Ошибка выхода:', error);
+    } finally {
+      sessionToken = null;
+    }
+  },
+  
   // Регистрация
   register: async (
     fullName: string, 
@@ -87,6 +111,7 @@ export const apiService = {
     try {
       let role = 'buyer';
       if (userType === 'Продавец') role = 'master';
+      // Администратора может создать только администратор (с его токеном)
       else if (userType === 'Админ') role = 'admin';
       
       const requestBody: Record<string, any> = {
@@ -103,6 +128,7 @@ export const apiService = {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...authHeaders(),
         },
         body: JSON.stringify(requestBody),
       });
@@ -158,6 +184,7 @@ export const apiService = {
         method: 'PATCH',
         headers: {
           'Content-Type': 'application/json',
+          ...authHeaders(),
         },
         body: JSON.stringify(requestBody),
       });
@@ -180,6 +207,7 @@ export const apiService = {
         method: 'PATCH',
         headers: {
           'Content-Type': 'application/json',
+          ...authHeaders(),
         },
         body: JSON.stringify({ status }),
       });
@@ -265,6 +293,7 @@ export const apiService = {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...authHeaders(),
         },
         body: JSON.stringify({
           login,
@@ -312,6 +341,7 @@ export const apiService = {
         method: 'PATCH',
         headers: {
           'Content-Type': 'application/json',
+          ...authHeaders(),
         },
         body: JSON.stringify(requestBody),
       });
@@ -332,6 +362,7 @@ export const apiService = {
     try {
       const response = await fetch(`${API_URL}/announcements/${masterId}/${number}/`, {
         method: 'DELETE',
+        headers: authHeaders(),
       });
       
       if (!response.ok) {
@@ -406,6 +437,7 @@ export const apiService = {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...authHeaders(),
         },
         body: JSON.stringify({
           sender_login,
@@ -429,6 +461,7 @@ export const apiService = {
     try {
       const response = await fetch(`${API_URL}/announcements/${masterId}/${number}/comments/${authorLogin}/`, {
         method: 'DELETE',
+        headers: authHeaders(),
       });
       
       if (!response.ok) {
@@ -494,6 +527,7 @@ export const apiService = {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...authHeaders(),
         },
         body: JSON.stringify({
           sender_login,
@@ -522,6 +556,7 @@ export const apiService = {
     try {
       const response = await fetch(`${API_URL}/users/${userLogin}/comments/${authorLogin}/`, {
         method: 'DELETE',
+        headers: authHeaders(),
       });
       
       if (!response.ok) {
@@ -538,7 +573,9 @@ export const apiService = {
   // Получение бэкапа базы данных
   getBackup: async () => {
     try {
-      const response = await fetch(`${API_URL}/backup/`);
+      const response = await fetch(`${API_URL}/backup/`, {
+        headers: authHeaders(),
+      });
       
       if (!response.ok) {
         throw new Error('Ошибка получения бэкапа');
@@ -558,6 +595,7 @@ export const apiService = {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...authHeaders(),
         },
         body: JSON.stringify({
           backup_data: backupData